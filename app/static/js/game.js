@@ -26,6 +26,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const hostChangeDeckButton = document.getElementById('host-change-deck');
     const hostKickPlayersButton = document.getElementById('host-kick-players');
     const hostStartGameButton = document.getElementById('host-start-game');
+    const hostAddBotButton = document.getElementById('host-add-bot');
+    const hostBotTakeoverButton = document.getElementById('host-bot-takeover');
 
     // Role assignment modal elements
     const roleAssignmentModal = document.getElementById('role-assignment-modal');
@@ -54,6 +56,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Track if the current player is the host
     let isHost = false;
+    let botTakeover = false; // Whether bots play for players whose turn timer runs out
 
     // Track all players data
     let allPlayersData = [];
@@ -709,15 +712,59 @@ document.addEventListener('DOMContentLoaded', () => {
         }, delay);
     }
 
+    // Version tag of the last state received and the full state it describes.
+    // The server answers 304 when nothing changed since that version, or a
+    // delta that leaves out the unchanged sections (hand, table, players, ...).
+    let gameStateVersion = null;
+    let lastGameStateData = null;
+
+    // Number of the newest chat message shown. The server sends only the
+    // messages after it, or all of them with chat_reset when the log must be
+    // replaced (first load, chat cleared, or too far behind).
+    let chatCursor = null;
+    const CHAT_LOG_LIMIT = 50; // Same as the server's ring of messages
+
+    function isOlderStateVersion(version, than) {
+        const [epoch, number] = (version || '').split('.');
+        const [thanEpoch, thanNumber] = (than || '').split('.');
+        return epoch === thanEpoch && Number(number) < Number(thanNumber);
+    }
+
     // Fetch the current game state
     function fetchGameState() {
-        fetch('/get_game_state')
-            .then(response => response.json())
+        const params = new URLSearchParams();
+        if (gameStateVersion) params.set('since', gameStateVersion);
+        if (chatCursor !== null) params.set('chat_since', chatCursor);
+        const url = params.toString() ? `/get_game_state?${params}` : '/get_game_state';
+        fetch(url, { cache: 'no-store' })
+            .then(response => response.status === 304 ? null : response.json())
             .then(data => {
+                if (data === null) {
+                    // Not modified: keep the current view (the turn timer counts down locally)
+                    window.gameStateErrorCount = 0;
+                    return;
+                }
                 if (data.success) {
                     // Reset error counter on successful response
                     window.gameStateErrorCount = 0;
 
+                    // Ignore responses that arrive after a newer state was already applied
+                    if (isOlderStateVersion(data.version, gameStateVersion)) {
+                        return;
+                    }
+                    // Chat updates are relative to chatCursor, never merged into the kept state
+                    if (data.chat_seq !== undefined) {
+                        receiveChatMessages(data);
+                        delete data.chat_messages;
+                        delete data.chat_seq;
+                        delete data.chat_reset;
+                    }
+                    if (data.delta && lastGameStateData) {
+                        data = { ...lastGameStateData, ...data };
+                    }
+                    lastGameStateData = data;
+                    gameStateVersion = data.version;
+
                     // Store the required cards count if provided
                     if (data.required_cards_to_play !== undefined) {
                         requiredCardsToPlay = data.required_cards_to_play;
@@ -773,6 +820,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function updateGameState(data) {
         // Store host status
         isHost = data.is_host === true;
+        botTakeover = data.bot_takeover === true;
 
         // Update localPlayerName from server data if available
         if (data.my_name) {
@@ -837,7 +885,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         // Check for last_skipped_position (from matching cards or timeout)
-        if (data.last_skipped_position !== undefined) {
+        if (data.last_skipped_position !== undefined && data.last_skipped_position !== null) {
             console.log("Found last_skipped_position:", data.last_skipped_position);
 
             // Check if this was a timeout skip based on the last action message
@@ -950,9 +998,6 @@ document.addEventListener('DOMContentLoaded', () => {
         // Organize cards in two rows
         organizeCardsInTwoRows();
 
-        // Display chat messages
-        displayChatMessages(data.chat_messages);
-
         // Make sure the clear system messages button is available
         addClearSystemMessagesButton();
 
@@ -1226,8 +1271,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Reset name tag classes first
                 nameTag.className = 'player-name-tag';
 
-                // Set name
+                // Set name, marking seats a bot is playing for someone
                 nameTag.textContent = player.name || 'Joining...';
+                if (player.is_bot && !nameTag.textContent.includes('🤖')) {
+                    nameTag.textContent += ' 🤖';
+                }
 
                 // Add rank to name tag if player has a rank
                 if (player.rank) {
@@ -1356,7 +1404,7 @@ document.addEventListener('DOMContentLoaded', () => {
             // If time is up, clear the interval
             if (currentTurnTimeLeft <= 0) {
                 clearInterval(turnTimerInterval);
-                // fetchGameState(); // Server will handle auto-skip, client will refresh via polling
+                // The server runs the timeout itself and pushes the new state
             }
         }, 100); // Update every 100ms for smoother animation
     }
@@ -1496,9 +1544,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     chatMessageInput.value = originalInput; // Restore input
                     alert("Failed to send message: " + (serverData.error || "Unknown error"));
                 }
-                // On success, the next fetchGameState will update the chat from the server,
-                // which includes clearing and re-rendering, effectively removing the optimistic message
-                // and showing the server-confirmed one.
+                // On success, the next fetchGameState brings the server-confirmed message,
+                // which replaces the optimistic one (see receiveChatMessages).
             })
             .catch(error => { // Handle network or other fetch errors
                 console.error('Error sending message:', error);
@@ -1522,16 +1569,25 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    let lastDisplayedMessageId = null;
-
-    function displayChatMessages(messages) {
+    function receiveChatMessages(data) {
         if (!chatLog) return;
 
         let shouldScroll = chatLog.scrollTop + chatLog.clientHeight >= chatLog.scrollHeight - 20;
 
-        chatLog.innerHTML = ''; // Clear all existing messages
+        if (data.chat_reset) {
+            chatLog.innerHTML = ''; // Clear all existing messages
+            chatCursor = null;
+        }
+
+        data.chat_messages.forEach(msg => {
+            if (chatCursor !== null && msg.seq <= chatCursor) return; // Already shown
+
+            // Our own message is confirmed: drop its optimistic copy
+            if (msg.sender === localPlayerName) {
+                const optimisticElement = chatLog.querySelector(".chat-message[data-message-id^='local-']");
+                if (optimisticElement) optimisticElement.remove();
+            }
 
-        messages.forEach(msg => {
             const messageElement = createChatMessageElement(msg);
 
             // Make system messages collapsible
@@ -1551,14 +1607,41 @@ document.addEventListener('DOMContentLoaded', () => {
 
             chatLog.appendChild(messageElement);
         });
+        chatCursor = data.chat_seq;
+
+        while (chatLog.children.length > CHAT_LOG_LIMIT) {
+            chatLog.removeChild(chatLog.firstChild);
+        }
 
         if (shouldScroll) {
             chatLog.scrollTop = chatLog.scrollHeight;
         }
     }
 
-    // Poll for game state updates more frequently to keep the timer accurate
-    setInterval(fetchGameState, 1000);
+    // The server pushes a 'state' event over /events whenever the game changes.
+    // Polling stays as a fallback: slow while the event stream is connected,
+    // every second when it is unavailable or has dropped.
+    const FAST_POLL_INTERVAL = 1000;
+    const SLOW_POLL_INTERVAL = 15000;
+    let pollInterval = null;
+
+    function schedulePolling(interval) {
+        clearInterval(pollInterval);
+        pollInterval = setInterval(fetchGameState, interval);
+    }
+
+    function connectGameEvents() {
+        if (!window.EventSource) {
+            return;
+        }
+        const gameEvents = new EventSource('/events');
+        gameEvents.addEventListener('state', () => fetchGameState());
+        gameEvents.onopen = () => schedulePolling(SLOW_POLL_INTERVAL);
+        gameEvents.onerror = () => schedulePolling(FAST_POLL_INTERVAL);
+    }
+
+    schedulePolling(FAST_POLL_INTERVAL);
+    connectGameEvents();
 
     // Function to update the cards required indicator
     function updateCardsRequiredIndicator(requiredCards) {
@@ -1696,6 +1779,63 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
+        // Host bot buttons; assigning onclick replaces the previous handler
+        if (hostAddBotButton) {
+            const waitingForStart = document.getElementById('cards-required-indicator')?.innerText.includes('Waiting for host');
+            hostAddBotButton.style.display = waitingForStart ? 'block' : 'none';
+            hostAddBotButton.onclick = function (e) {
+                e.preventDefault();
+                this.disabled = true;
+                fetch('/add_bot', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    }
+                })
+                    .then(response => response.json())
+                    .then(data => {
+                        if (data.success && data.refresh) {
+                            fetchGameState();
+                        } else if (data.error) {
+                            alert(data.error);
+                        }
+                    })
+                    .catch(error => {
+                        console.error('Error adding bot:', error);
+                        alert('Failed to add a bot. Please try again.');
+                    })
+                    .finally(() => {
+                        this.disabled = false;
+                    });
+            };
+        }
+
+        if (hostBotTakeoverButton) {
+            hostBotTakeoverButton.textContent = botTakeover ? '🤖 Bots Take Over Idle Players: On' : '🤖 Bots Take Over Idle Players: Off';
+            hostBotTakeoverButton.onclick = function (e) {
+                e.preventDefault();
+                fetch('/set_bot_takeover', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({ enabled: !botTakeover })
+                })
+                    .then(response => response.json())
+                    .then(data => {
+                        if (data.success) {
+                            fetchGameState();
+                        } else if (data.error) {
+                            alert(data.error);
+                        }
+                    })
+                    .catch(error => {
+                        console.error('Error changing bot settings:', error);
+                        alert('Failed to change the bot settings. Please try again.');
+                    });
+            };
+        }
+
         // Host new game button
         if (hostNewGameButton) {
             // Remove any existing event listeners
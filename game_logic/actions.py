@@ -1,17 +1,19 @@
-import random
 import time
-import uuid
 
 from .utils import (
-    util_create_deck, util_sort_cards, util_add_system_message,
-    util_get_player_by_position, util_assign_automatic_roles, CARD_VALUES
+    util_get_canonical_deck, util_add_system_message,
+    util_get_player_by_position, util_assign_automatic_roles, util_get_turn_time_left,
+    util_card_value, util_card_suit, util_card_numeric_value, util_card_effective_value,
+    util_make_card, util_clear_table, util_draw_from_pile, util_rebuild_turn_order, util_next_in_turn_order,
+    util_set_skipped, util_clear_skips, util_set_rank, util_all_active_players_skipped,
+    util_count_values, util_set_hand, util_add_to_hand, util_remove_from_hand, util_clear_chat, util_log_event,
+    util_append_chat_message, CARD_VALUES
 )
 
 
-def start_game(game_state, save_game_state_func):
-    """Start the game by dealing cards to all players"""
-    deck = util_create_deck(game_state)  # Uses util create_deck, passing game_state
-    random.shuffle(deck)
+def start_game(game_state, save_game_state_func, rng):
+    """Start the game by dealing cards to all players, shuffled with `rng`"""
+    deck = util_get_canonical_deck(game_state)
 
     num_players = len(game_state['players'])
     if num_players == 0:  # Cannot start game with no players
@@ -22,7 +24,9 @@ def start_game(game_state, save_game_state_func):
     # We will only use cards that can be distributed perfectly evenly.
     # The remaining cards are effectively discarded for this deal.
     cards_to_deal_total = cards_per_player * num_players
-    deck_for_dealing = deck[:cards_to_deal_total]
+    shuffled_deck = rng.sample(deck, len(deck))
+    deck_for_dealing = shuffled_deck[:cards_to_deal_total]
+    game_state['undealt_pile'] = shuffled_deck[cards_to_deal_total:]
 
     sorted_players = sorted(game_state['players'].items(), key=lambda x: x[1]['position'])
 
@@ -32,11 +36,11 @@ def start_game(game_state, save_game_state_func):
     for i, (player_id, player_data) in enumerate(sorted_players):
         start_idx = i * cards_per_player
         end_idx = start_idx + cards_per_player  # Each player gets exactly cards_per_player
-        player_data['hand'] = deck_for_dealing[start_idx:end_idx]
-        player_data['hand'] = util_sort_cards(player_data['hand'])
+        util_set_hand(player_data, deck_for_dealing[start_idx:end_idx])
         player_data['skipped'] = False
         player_data['rank'] = None
         player_data['inactive_turns'] = 0  # Reset inactive turns counter when game starts
+    util_rebuild_turn_order(game_state)
 
     game_state['started'] = True
     game_state['deal_animation_pending'] = True  # Trigger for client-side animation
@@ -49,8 +53,12 @@ def start_game(game_state, save_game_state_func):
     game_state['table'] = []
     game_state['last_card_played'] = None
     game_state['last_action'] = None
-    game_state['chat_messages'] = []
+    util_clear_chat(game_state)
     game_state['turn_start_time'] = time.time()
+    util_log_event(game_state, 'game_started', deck_size=game_state['deck_size'], rng_seed=game_state['rng_seed'], seats=[
+        {'player_id': player_id, 'name': player_data['name'], 'position': player_data['position'],
+         'role': player_data['role'], 'hand': list(player_data['hand'])}
+        for player_id, player_data in sorted_players])
 
     president_id = None
     culo_id = None
@@ -102,7 +110,7 @@ def start_game(game_state, save_game_state_func):
     save_game_state_func()
 
 
-def redistribute_cards(game_state, save_game_state_func):
+def redistribute_cards(game_state, save_game_state_func, rng):
     """Redistribute all cards when a new player joins"""
     new_player_id = None
     new_player_data = None
@@ -114,8 +122,7 @@ def redistribute_cards(game_state, save_game_state_func):
     if not new_player_id:
         return
 
-    new_player_cards = util_create_deck(game_state)  # Uses util create_deck
-    random.shuffle(new_player_cards)
+    undealt_pile = game_state['undealt_pile']
 
     total_cards = 0
     active_players = 0
@@ -124,19 +131,76 @@ def redistribute_cards(game_state, save_game_state_func):
             total_cards += len(player_data_val['hand'])
             active_players += 1
 
-    cards_for_new_player = len(new_player_cards) if active_players == 0 else total_cards // active_players
-    cards_for_new_player = max(cards_for_new_player, 5)
-    new_player_data['hand'] = new_player_cards[:cards_for_new_player]
-    new_player_data['hand'] = util_sort_cards(new_player_data['hand'])
+    # Dealt from the cards not in play, so hands, table and pile still make up the deck;
+    # when the pile runs short the new player gets what is left of it
+    cards_for_new_player = len(undealt_pile) if active_players == 0 else total_cards // active_players
+    cards_for_new_player = min(max(cards_for_new_player, 5), len(undealt_pile))
+    util_set_hand(new_player_data, util_draw_from_pile(game_state, cards_for_new_player, rng))
 
     if new_player_id not in game_state['current_game_players']:
         game_state['current_game_players'].append(new_player_id)
+        util_rebuild_turn_order(game_state)
+    if not game_state['game_over'] and util_get_player_by_position(game_state, game_state['current_player_index']) is None:
+        # The turn was left on the seat of a player who was kicked while they were the last one
+        advance_to_next_player(game_state, save_game_state_func)
+    util_log_event(game_state, 'dealt_in', player_id=new_player_id, name=new_player_data['name'],
+                   position=new_player_data['position'], role=new_player_data['role'],
+                   hand=list(new_player_data['hand']))
 
     util_add_system_message(
         game_state, f"🃏 {new_player_data['name']} has been dealt {len(new_player_data['hand'])} cards and joined the game in progress!", "info")
     save_game_state_func()
 
 
+def add_player_logic(game_state, player_id, player_name, save_game_state_func, rng):
+    """Seat a new player at the first free position
+
+    The first player becomes the host. A player who joins a game in progress
+    is dealt in right away.
+
+    Args:
+        game_state: The current game state
+        player_id: The new player's id
+        player_name: The new player's name, already sanitized for display
+        save_game_state_func: Function to save the game state
+        rng: Random generator that deals the cards if the game is in progress
+
+    Returns:
+        {'success': True, 'is_host': ...} or an error
+    """
+    if len(game_state['players']) >= 12:
+        return {'success': False, 'error': "Game is full. Please wait for a spot to open."}
+
+    existing_positions = [p_data['position'] for p_data in game_state['players'].values()]
+    position_order = [0, 2, 3, 1, 4, 6, 7, 5, 8, 9, 10, 11]
+    player_position = next((pos for pos in position_order if pos not in existing_positions),
+                           len(game_state['players']))
+
+    is_host = not game_state['players'] or game_state['host_player_id'] is None
+    if is_host:
+        game_state['host_player_id'] = player_id
+
+    game_state['players'][player_id] = {
+        'name': player_name, 'hand': [], 'position': player_position,
+        'skipped': False, 'rank': None, 'is_host': is_host, 'role': 'neutral',
+        'inactive_turns': 0,  # Initialize inactive turns counter
+        'bot_strategy': None,  # Strategy of the bot playing this seat, None while a person plays it
+        'value_counts': util_count_values([])  # Histogram of the hand's card values
+    }
+    util_rebuild_turn_order(game_state)
+
+    system_message_text = f"👑 {player_name} has joined as the host!" if is_host else f"👋 {player_name} has joined the game!"
+    util_add_system_message(game_state, system_message_text, "info")
+
+    if game_state['started']:
+        redistribute_cards(game_state, save_game_state_func, rng)
+    # Remove automatic game start when 2+ players join
+    # Instead, we'll wait for the host to explicitly start the game
+
+    save_game_state_func()
+    return {'success': True, 'is_host': is_host}
+
+
 def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_state_func):
     player_data = game_state['players'][player_id]
 
@@ -151,84 +215,53 @@ def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_
     for idx in card_indices:
         if not (0 <= idx < len(player_data['hand'])):
             return {'success': False, 'error': 'Invalid card index'}
+    if len(set(card_indices)) != len(card_indices):
+        return {'success': False, 'error': 'Invalid card index'}
 
     # Reset inactive turns counter when player plays a card
     player_data['inactive_turns'] = 0
 
-    if len(card_indices) > 1:
-        reference_value = None
-        is_playing_only_jokers = True
-        temp_selected_cards_from_hand = [player_data['hand'][idx] for idx in card_indices]
-        for card_in_hand in temp_selected_cards_from_hand:
-            if card_in_hand['value'] != '2':
-                reference_value = card_in_hand['value']
-                is_playing_only_jokers = False
-                break
-        if is_playing_only_jokers:
-            reference_value = joker_value if joker_value else '2'
-        elif not reference_value:
-            return {'success': False, 'error': 'Error determining reference value for multi-card play.'}
-        for card_in_hand in temp_selected_cards_from_hand:
-            card_original_value = card_in_hand['value']
-            effective_value = card_original_value
-            if card_original_value == '2':
-                if joker_value:
-                    effective_value = joker_value
-                elif not is_playing_only_jokers:
-                    effective_value = reference_value
-            if effective_value != reference_value:
-                return {'success': False, 'error': 'Selected cards must have the same value (considering jokers).'}
-
+    # Histogram of the selection: at most one value besides 2s, checked per value instead of per card
     selected_cards_from_hand = [player_data['hand'][idx] for idx in card_indices]
-    effective_play_value_for_comparison = None
+    selected_value_counts = util_count_values(selected_cards_from_hand)
+    selected_jokers = selected_value_counts[0]
+    selected_values = [value for value in range(1, len(selected_value_counts)) if selected_value_counts[value]]
+    if len(selected_values) > 1 or (selected_values and selected_jokers and joker_value and
+                                    CARD_VALUES.get(joker_value) != selected_values[0]):
+        return {'success': False, 'error': 'Selected cards must have the same value (considering jokers).'}
+
     if joker_value:
         effective_play_value_for_comparison = CARD_VALUES.get(joker_value)
-    elif len(selected_cards_from_hand) > 0:
-        first_card = selected_cards_from_hand[0]
-        if first_card['value'] != '2':
-            effective_play_value_for_comparison = first_card['numeric_value']
-        elif not any(c['value'] != '2' for c in selected_cards_from_hand):
-            effective_play_value_for_comparison = CARD_VALUES['2']
-        else:
-            non_joker_in_selection = next((c['value'] for c in selected_cards_from_hand if c['value'] != '2'), None)
-            if non_joker_in_selection:
-                effective_play_value_for_comparison = CARD_VALUES.get(non_joker_in_selection)
-            else:
-                effective_play_value_for_comparison = CARD_VALUES['2']
+    else:
+        effective_play_value_for_comparison = selected_values[0] if selected_values else CARD_VALUES['2']
 
     top_card = game_state['table'][-1] if game_state['table'] else None
     is_valid_play = False
-    if not top_card:
+    if top_card is None:
         is_valid_play = True
         game_state['required_cards_to_play'] = len(selected_cards_from_hand)
-    elif all(card['value'] == '2' for card in selected_cards_from_hand) and not joker_value:
+    elif not selected_values and not joker_value:
         is_valid_play = True
-    elif effective_play_value_for_comparison is not None and effective_play_value_for_comparison >= top_card['numeric_value']:
+    elif effective_play_value_for_comparison is not None and effective_play_value_for_comparison >= util_card_numeric_value(top_card):
         is_valid_play = True
 
     if not is_valid_play:
-        error_detail = f"Top card: {top_card['value'] if top_card else 'None'}. Your play (effective): {effective_play_value_for_comparison}. Joker_value provided: {joker_value}."
+        error_detail = f"Top card: {util_card_value(top_card) if top_card is not None else 'None'}. Your play (effective): {effective_play_value_for_comparison}. Joker_value provided: {joker_value}."
         return {'success': False, 'error': f'Invalid card(s). You must play card(s) with equal or higher value, or 2s. {error_detail}'}
 
     card_indices.sort(reverse=True)
     played_cards = []
-    for idx in card_indices:
-        played_card = player_data['hand'].pop(idx)
-        played_card['id'] = str(uuid.uuid4())
-        if played_card['value'] == '2' and joker_value:
-            played_card['original_value'] = played_card['value']
-            played_card['original_numeric_value'] = played_card['numeric_value']
-            played_card['joker_value'] = joker_value
-            played_card['display_value'] = joker_value
-            if joker_value in CARD_VALUES:
-                played_card['numeric_value'] = CARD_VALUES[joker_value]
+    for played_card in util_remove_from_hand(player_data, card_indices):
+        if util_card_value(played_card) == '2' and joker_value:
+            played_card = util_make_card('2', util_card_suit(played_card), joker_value)
         played_cards.append(played_card)
 
-    player_data['hand'] = util_sort_cards(player_data['hand'])
     game_state['table'].extend(played_cards)
-    game_state['last_card_played'] = played_cards[-1]['id']
+    game_state['cards_played'] += len(played_cards)
+    game_state['last_card_played'] = str(game_state['cards_played'])
     game_state['last_card_player_position'] = player_data['position']
     game_state['last_table_length'] = len(game_state['table'])
+    util_log_event(game_state, 'play', player_id=player_id, cards=played_cards)
 
     previous_card_on_table = game_state['table'][-len(played_cards) -
                                                  1] if len(game_state['table']) > len(played_cards) else None
@@ -236,9 +269,11 @@ def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_
     if len(player_data['hand']) == 0:
         if player_id not in game_state['rankings']:
             game_state['rankings'].append(player_id)
+            util_log_event(game_state, 'finished', player_id=player_id, place=len(game_state['rankings']))
         rank_position = game_state['rankings'].index(player_id)
         rank_map = {0: ('gold', "🥇 Gold"), 1: ('silver', "🥈 Silver"), 2: ('bronze', "🥉 Bronze")}
-        player_data['rank'], rank_text = rank_map.get(rank_position, ('loser', "👎 Loser"))
+        rank, rank_text = rank_map.get(rank_position, ('loser', "👎 Loser"))
+        util_set_rank(game_state, player_data, rank)
 
         # Check for >1 to avoid issues with 1 player game
         if len(game_state['rankings']) == len(game_state['current_game_players']) - 1 and len(game_state['current_game_players']) > 1:
@@ -246,7 +281,8 @@ def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_
                 (rem_id for rem_id in game_state['current_game_players'] if rem_id not in game_state['rankings']), None)
             if last_player_id and last_player_id in game_state['players']:
                 game_state['rankings'].append(last_player_id)
-                game_state['players'][last_player_id]['rank'] = 'loser'
+                util_log_event(game_state, 'finished', player_id=last_player_id, place=len(game_state['rankings']))
+                util_set_rank(game_state, game_state['players'][last_player_id], 'loser')
                 util_add_system_message(
                     game_state, f"👎 {game_state['players'][last_player_id]['name']} gets the Loser rank!", "warning")
                 game_state['game_over'] = True
@@ -260,20 +296,22 @@ def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_
         game_state['last_action'] = f"{player_data['name']} has finished with {rank_text} rank!"
         if game_state['game_over'] and game_state['rankings']:
             game_state['winner'] = game_state['rankings'][0]
+            util_log_event(game_state, 'game_over', rankings=list(game_state['rankings']))
         util_add_system_message(game_state, f"🏆 {player_data['name']} has finished with {rank_text} rank!", "success")
 
-        last_card_val = played_cards[-1].get('joker_value', played_cards[-1]['value'])
+        last_card_val = util_card_effective_value(played_cards[-1])
         if last_card_val == 'ace':
-            game_state['table'] = []
-            for p_id_loop in game_state['players']:
-                game_state['players'][p_id_loop]['skipped'] = False
+            util_clear_table(game_state)
+            util_clear_skips(game_state)
             util_add_system_message(
                 game_state, f"🔄 {player_data['name']} played an Ace as their last card, clearing the table!", "info")
+            # The finished player cannot lead the new round, the next player does
+            advance_to_next_player(game_state, save_game_state_func)
         else:
             advance_to_next_player(game_state, save_game_state_func)
-            if previous_card_on_table:
-                prev_val = previous_card_on_table.get('joker_value', previous_card_on_table['value'])
-                curr_val = played_cards[0].get('joker_value', played_cards[0]['value'])
+            if previous_card_on_table is not None:
+                prev_val = util_card_effective_value(previous_card_on_table)
+                curr_val = util_card_effective_value(played_cards[0])
                 if prev_val == curr_val:
                     next_player = util_get_player_by_position(game_state, game_state['current_player_index'])
                     if next_player:
@@ -283,22 +321,21 @@ def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_
         save_game_state_func()
         return {'success': True, 'refresh': True}
 
-    last_card_val = played_cards[-1].get('joker_value', played_cards[-1]['value'])
+    last_card_val = util_card_effective_value(played_cards[-1])
     if last_card_val == 'ace':
-        game_state['table'] = []
-        action_msg = f"{player_data['name']} played a Joker as Ace" if played_cards[-1]['value'] == '2' else f"{player_data['name']} played an Ace"
+        util_clear_table(game_state)
+        action_msg = f"{player_data['name']} played a Joker as Ace" if util_card_value(played_cards[-1]) == '2' else f"{player_data['name']} played an Ace"
         game_state['last_action'] = f"{action_msg}, cleared the table, and plays again!"
         util_add_system_message(game_state, f"🔄 {action_msg}, clearing the table and getting another turn!", "info")
-        for p_id_loop in game_state['players']:
-            game_state['players'][p_id_loop]['skipped'] = False
+        util_clear_skips(game_state)
         game_state['required_cards_to_play'] = 1
         game_state['turn_start_time'] = time.time()
         save_game_state_func()
         return {'success': True, 'refresh': True}
 
-    card_value = played_cards[0].get('joker_value', played_cards[0]['value'])
-    card_suit = played_cards[0]['suit']
-    is_joker = played_cards[0]['value'] == '2'
+    card_value = util_card_effective_value(played_cards[0])
+    card_suit = util_card_suit(played_cards[0])
+    is_joker = util_card_value(played_cards[0]) == '2'
     num_played = len(played_cards)
 
     if is_joker:
@@ -311,8 +348,8 @@ def play_card_logic(game_state, player_id, card_indices, joker_value, save_game_
 
     current_action_message = msg
     skip_triggered_by_match = False
-    if previous_card_on_table:
-        prev_val = previous_card_on_table.get('joker_value', previous_card_on_table['value'])
+    if previous_card_on_table is not None:
+        prev_val = util_card_effective_value(previous_card_on_table)
         if prev_val == card_value:
             current_action_message += f". This matches the previous card ({prev_val}), so the next player is skipped!"
             skip_triggered_by_match = True
@@ -354,24 +391,19 @@ def skip_turn_logic(game_state, player_id, save_game_state_func):
     # Reset inactive turns counter when player actively skips
     player_data['inactive_turns'] = 0
 
-    player_data['skipped'] = True
+    util_set_skipped(game_state, player_data, True)
     game_state['last_action'] = f"{player_data['name']} skipped their turn"
 
     # Store the current player position to trigger skip animation
     game_state['last_skipped_position'] = player_data['position']
 
-    all_active_skipped = all(p['skipped'] or p['rank']
-                             is not None for p in game_state['players'].values() if p['rank'] is None)
-
     # ensure there are active players
-    if all_active_skipped and any(p['rank'] is None for p in game_state['players'].values()):
-        game_state['table'] = []
+    if util_all_active_players_skipped(game_state):
+        util_clear_table(game_state)
         game_state['last_action'] = "All active players skipped. Table cleared!"
         util_add_system_message(
             game_state, "🔄 All active players skipped! Table has been cleared for a new round.", "info")
-        for p_data_loop in game_state['players'].values():
-            if p_data_loop['rank'] is None:
-                p_data_loop['skipped'] = False
+        util_clear_skips(game_state)
         game_state['last_card_player_position'] = None
         game_state['last_table_length'] = 0
         game_state['required_cards_to_play'] = 1  # Reset for new round
@@ -382,8 +414,8 @@ def skip_turn_logic(game_state, player_id, save_game_state_func):
 
 
 def advance_to_next_player(game_state, save_game_state_func):
-    num_active_players = sum(1 for p in game_state['players'].values() if p['rank'] is None)
-    if num_active_players <= 1 and any(p['rank'] is None for p in game_state['players'].values()):
+    num_active_players = game_state['active_players_count']
+    if num_active_players <= 1 and num_active_players > 0:
         # If only one player remains or game is about to end, don't advance further in some cases.
         # This helps prevent infinite loops if logic for game end is slightly off.
         # Check if game should be over.
@@ -392,56 +424,23 @@ def advance_to_next_player(game_state, save_game_state_func):
             remaining_players = [pid for pid in game_state['current_game_players'] if pid not in game_state['rankings']]
             if len(remaining_players) <= 1:
                 game_state['game_over'] = True
+                util_log_event(game_state, 'game_over', rankings=list(game_state['rankings']))
                 # util_assign_automatic_roles(game_state, save_game_state_func) # Already called in play_card
                 util_add_system_message(game_state, "🏁 Game appears to be over by player count.", "info")
                 save_game_state_func()
         return  # Don't advance if only one or zero active players are left
 
-    position_order = [0, 2, 3, 1, 4, 6, 7, 5, 8, 9, 10, 11]
-    player_current_positions = {p['position']
-                                for p_id, p in game_state['players'].items() if p_id in game_state['current_game_players']}
-    active_positions = [pos for pos in position_order if pos in player_current_positions]
-    active_positions.sort()  # Sort numerically for correct turn order
-    if not active_positions:
+    if not game_state['turn_order']:
         return  # No active players
 
-    try:
-        current_position_idx = active_positions.index(game_state['current_player_index'])
-    except ValueError:
-        current_position_idx = 0  # Default to first if not found
-        if active_positions:
-            game_state['current_player_index'] = active_positions[0]
-
-    for _ in range(len(active_positions) * 2):
-        current_position_idx = (current_position_idx + 1) % len(active_positions)
-        next_player_pos = active_positions[current_position_idx]
-        current_player_data = util_get_player_by_position(game_state, next_player_pos)  # Use util
-
-        if current_player_data and not current_player_data['skipped'] and current_player_data['rank'] is None:
-            game_state['current_player_index'] = next_player_pos
-            break
-    else:  # All remaining (active) players are skipped or have finished
-        all_active_skipped_or_ranked = True
-        for p_id in game_state['current_game_players']:
-            p_data = game_state['players'][p_id]
-            if p_data['rank'] is None and not p_data['skipped']:
-                all_active_skipped_or_ranked = False
-                break
-        if all_active_skipped_or_ranked:
-            for p_id in game_state['current_game_players']:
-                p_data = game_state['players'][p_id]
-                if p_data['rank'] is None:  # Only unskip active players
-                    p_data['skipped'] = False
-            # Attempt to find the next player again (could be the same if only one active player was skipped)
-            # This primarily handles the case where one player was skipped, and now it's their turn again after reset.
-            current_position_idx = active_positions.index(game_state['current_player_index'])  # Re-get current index
-            for _ in range(len(active_positions) * 2):  # Loop again
-                current_position_idx = (current_position_idx + 1) % len(active_positions)
-                next_player_pos = active_positions[current_position_idx]
-                current_player_data = util_get_player_by_position(game_state, next_player_pos)
-                if current_player_data and not current_player_data['skipped'] and current_player_data['rank'] is None:
-                    game_state['current_player_index'] = next_player_pos
-                    break  # Found next player
+    next_player_pos = util_next_in_turn_order(game_state, game_state['current_player_index'])
+    if next_player_pos is None:
+        # All remaining (active) players are skipped or have finished: unskip them and look again.
+        # This primarily handles the case where one player was skipped, and now it's their turn again after reset.
+        util_clear_skips(game_state)
+        next_player_pos = util_next_in_turn_order(game_state, game_state['current_player_index'])
+    if next_player_pos is not None:
+        game_state['current_player_index'] = next_player_pos
 
     game_state['turn_start_time'] = time.time()
 
@@ -451,44 +450,31 @@ def advance_to_next_player(game_state, save_game_state_func):
         game_state['current_player_index'] == game_state.get('last_card_player_position') and
         len(game_state['table']) == game_state.get('last_table_length', 0)
     ):
-        game_state['table'] = []
+        util_clear_table(game_state)
         game_state['last_action'] = "Round returned to the player who placed the last card. Table cleared! Same player starts."
         util_add_system_message(
             game_state, "🔄 No one played after the last card. Table cleared and the same player starts the new round!", "info")
-        for p_data_loop in game_state['players'].values():
-            if p_data_loop['rank'] is None:
-                p_data_loop['skipped'] = False
+        util_clear_skips(game_state)
         game_state['last_card_player_position'] = None
         game_state['last_table_length'] = 0
         game_state['required_cards_to_play'] = 1  # Reset for new round
         save_game_state_func()
         return
 
-    all_active_skipped_now = True
-    num_active_players_check = 0
-    for p_data_loop in game_state['players'].values():
-        if p_data_loop['rank'] is None:
-            num_active_players_check += 1
-            if not p_data_loop['skipped']:
-                all_active_skipped_now = False
-                break
-
-    if all_active_skipped_now and num_active_players_check > 0:
-        game_state['table'] = []
+    if util_all_active_players_skipped(game_state):
+        util_clear_table(game_state)
         game_state['last_action'] = "All active players skipped. Table cleared!"
         util_add_system_message(
             game_state, "🔄 All active players skipped! Table has been cleared for a new round.", "info")
-        for p_data_loop in game_state['players'].values():
-            if p_data_loop['rank'] is None:
-                p_data_loop['skipped'] = False
+        util_clear_skips(game_state)
         game_state['last_card_player_position'] = None
         game_state['last_table_length'] = 0
         game_state['required_cards_to_play'] = 1  # Reset for new round
         save_game_state_func()
 
 
-def reset_game_logic(game_state, save_game_state_func):
-    game_state['table'] = []
+def reset_game_logic(game_state, save_game_state_func, rng):
+    util_clear_table(game_state)
     game_state['game_over'] = False
     game_state['winner'] = None
     game_state['required_cards_to_play'] = 1
@@ -502,12 +488,12 @@ def reset_game_logic(game_state, save_game_state_func):
         'completed': False, 'current_exchange': 'president', 'phase': 'receive'
     })
     for player_id in game_state['players']:
-        game_state['players'][player_id]['hand'] = []
+        util_set_hand(game_state['players'][player_id], [])
         game_state['players'][player_id]['skipped'] = False
         game_state['players'][player_id]['rank'] = None
         game_state['players'][player_id]['inactive_turns'] = 0  # Reset inactive turns counter
 
-    start_game(game_state, save_game_state_func)  # Call the action start_game
+    start_game(game_state, save_game_state_func, rng)  # Call the action start_game
     game_state['last_action'] = "Game has been reset by the host"
     host_name = game_state['players'][game_state['host_player_id']]['name']
     util_add_system_message(game_state, f"🔄 {host_name} (host) has reset the game! Starting a new game...", "info")
@@ -516,6 +502,131 @@ def reset_game_logic(game_state, save_game_state_func):
     return {'success': True, 'refresh': True}
 
 
+def start_game_logic(game_state, save_game_state_func, rng):
+    """Start the game the host asked to start
+
+    Returns:
+        {'success': True, 'refresh': True}
+    """
+    game_state['waiting_for_start'] = False
+    start_game(game_state, save_game_state_func, rng)
+    host_name = game_state['players'][game_state['host_player_id']]['name']
+    util_add_system_message(game_state, f"🎮 {host_name} (host) has started the game!", "success")
+    save_game_state_func()
+    return {'success': True, 'refresh': True}
+
+
+def send_message_logic(game_state, player_id, text, timestamp, message_id, save_game_state_func):
+    """Post a player's chat message; the text must already be escaped for display"""
+    chat_message = {'sender': game_state['players'][player_id]['name'], 'text': text, 'timestamp': timestamp,
+                    'id': message_id}
+    util_append_chat_message(game_state, chat_message)
+    save_game_state_func()  # Cheap now that saves are journaled, and it pushes the message to everyone
+    return {'success': True}
+
+
+def claim_host_logic(game_state, player_id, save_game_state_func):
+    """Make the player the host (the secret /admin chat command)"""
+    game_state['host_player_id'] = player_id
+    for pid in game_state['players']:
+        game_state['players'][pid]['is_host'] = (pid == player_id)
+    save_game_state_func()
+    return {'success': True}
+
+
+def assign_roles_logic(game_state, roles, save_game_state_func):
+    """Set the roles the host assigned
+
+    Args:
+        roles: {'player_id', 'role'} dicts; unknown players and roles are ignored
+    """
+    valid_roles = ['neutral', 'president', 'vice-president', 'vice-culo', 'culo']
+    for role_info in roles:
+        target_p_id = role_info.get('player_id')
+        new_role = role_info.get('role')
+        if target_p_id in game_state['players'] and new_role in valid_roles:
+            game_state['players'][target_p_id]['role'] = new_role
+    host_name = game_state['players'][game_state['host_player_id']]['name']
+    util_add_system_message(game_state, f"👑 {host_name} (host) has assigned player roles!", "info")
+    save_game_state_func()
+    return {'success': True}
+
+
+def assign_ranks_logic(game_state, ranks, save_game_state_func):
+    """Set the ranks the host assigned
+
+    Args:
+        ranks: {'player_id', 'rank'} dicts; unknown players and ranks are ignored
+    """
+    valid_ranks = ['gold', 'silver', 'bronze', 'loser', None]
+    for rank_info in ranks:
+        target_p_id = rank_info.get('player_id')
+        new_rank = rank_info.get('rank')
+        if target_p_id in game_state['players'] and new_rank in valid_ranks:
+            game_state['players'][target_p_id]['rank'] = new_rank
+            if new_rank and target_p_id not in game_state['rankings']:
+                game_state['rankings'].append(target_p_id)
+            elif not new_rank and target_p_id in game_state['rankings']:
+                game_state['rankings'].remove(target_p_id)
+    util_rebuild_turn_order(game_state)
+    host_name = game_state['players'][game_state['host_player_id']]['name']
+    util_add_system_message(game_state, f"👑 {host_name} (host) has manually assigned player ranks!", "info")
+    save_game_state_func()
+    return {'success': True}
+
+
+def change_deck_size_logic(game_state, deck_size, save_game_state_func):
+    """Set the deck size for the next deal; the route checks that it is a valid one"""
+    game_state['deck_size'] = deck_size
+    host_name = game_state['players'][game_state['host_player_id']]['name']
+    size_map = {0.25: "1/4", 0.5: "1/2", 1.0: "1", 2.0: "2", 3.0: "3"}
+    deck_size_text = size_map.get(deck_size, str(deck_size))
+    util_add_system_message(game_state, f"🃏 {host_name} changed the deck size to {deck_size_text} deck(s)!", "info")
+    save_game_state_func()
+    return {'success': True}
+
+
+def kick_player_logic(game_state, host_player_id, player_id_to_kick, save_game_state_func, rng):
+    """Remove a player the host kicked; their cards go back to the undealt pile
+
+    Returns:
+        {'success': True, 'kicked_player_name': ..., 'refresh': True}
+    """
+    # Get the player name before removing them
+    kicked_player_name = game_state['players'][player_id_to_kick]['name']
+    kicked_players_turn = game_state['players'][player_id_to_kick]['position'] == game_state['current_player_index']
+    host_name = game_state['players'][host_player_id]['name']
+
+    game_state['undealt_pile'].extend(game_state['players'][player_id_to_kick]['hand'])
+    del game_state['players'][player_id_to_kick]
+
+    # If the player was in rankings, remove them
+    if player_id_to_kick in game_state.get('rankings', []):
+        game_state['rankings'].remove(player_id_to_kick)
+    util_rebuild_turn_order(game_state)
+
+    # Names are already sanitized when players join
+    util_add_system_message(game_state, f"👢 {host_name} kicked {kicked_player_name} from the game!", "warning")
+
+    # If the game is in progress, redistribute cards
+    if game_state['started'] and len(game_state['players']) >= 2:
+        redistribute_cards(game_state, save_game_state_func, rng)
+    # Nobody could play (or time out) on the empty seat
+    if kicked_players_turn and game_state['started'] and not game_state['game_over']:
+        advance_to_next_player(game_state, save_game_state_func)
+    save_game_state_func()
+    return {'success': True, 'kicked_player_name': kicked_player_name, 'refresh': True}
+
+
+def change_video_logic(game_state, player_id, video_id, save_game_state_func):
+    """Set the table's background video; the route checks the video id"""
+    game_state['table_video_id'] = video_id
+    host_name = game_state['players'][player_id]['name']
+    util_add_system_message(game_state, f"📺 {host_name} changed the table background video.", "info")
+    save_game_state_func()
+    return {'success': True, 'video_id': video_id, 'refresh': True}
+
+
 def exchange_card_logic(game_state, player_id, card_index, phase, exchange_type, save_game_state_func):
     exchange_state = game_state['card_exchange']
     if not exchange_state['active']:
@@ -551,14 +662,12 @@ def exchange_card_logic(game_state, player_id, card_index, phase, exchange_type,
             game_state['card_exchange']['president_cards_to_give'].append(card_index)
             if len(game_state['card_exchange']['president_cards_to_give']) >= 2:
                 game_state['card_exchange']['president_cards_to_give'].sort(reverse=True)
-                cards_to_president = [culo_data['hand'].pop(
-                    idx) for idx in game_state['card_exchange']['president_cards_to_receive']]
-                cards_to_culo = [president_data['hand'].pop(
-                    idx) for idx in game_state['card_exchange']['president_cards_to_give']]
-                president_data['hand'].extend(cards_to_president)
-                culo_data['hand'].extend(cards_to_culo)
-                president_data['hand'] = util_sort_cards(president_data['hand'])
-                culo_data['hand'] = util_sort_cards(culo_data['hand'])
+                cards_to_president = util_remove_from_hand(
+                    culo_data, game_state['card_exchange']['president_cards_to_receive'])
+                cards_to_culo = util_remove_from_hand(
+                    president_data, game_state['card_exchange']['president_cards_to_give'])
+                util_add_to_hand(president_data, cards_to_president)
+                util_add_to_hand(culo_data, cards_to_culo)
                 game_state['card_exchange']['president_exchange_completed'] = True
                 util_add_system_message(
                     game_state, f"🔄 Card exchange completed between {president_data['name']} (President) and {culo_data['name']} (Culo)!", "success")
@@ -604,14 +713,11 @@ def exchange_card_logic(game_state, player_id, card_index, phase, exchange_type,
             if not (0 <= vp_give_idx < len(vice_president_data['hand'])) or not (0 <= vc_give_idx < len(vice_culo_data['hand'])):
                 return {'success': False, 'error': 'Invalid card index during vice exchange execution.'}
 
-            vp_card_to_give = vice_president_data['hand'].pop(vp_give_idx)
-            vc_card_to_give = vice_culo_data['hand'].pop(vc_give_idx)
+            vp_cards_to_give = util_remove_from_hand(vice_president_data, [vp_give_idx])
+            vc_cards_to_give = util_remove_from_hand(vice_culo_data, [vc_give_idx])
 
-            vice_president_data['hand'].append(vc_card_to_give)
-            vice_culo_data['hand'].append(vp_card_to_give)
-
-            vice_president_data['hand'] = util_sort_cards(vice_president_data['hand'])
-            vice_culo_data['hand'] = util_sort_cards(vice_culo_data['hand'])
+            util_add_to_hand(vice_president_data, vc_cards_to_give)
+            util_add_to_hand(vice_culo_data, vp_cards_to_give)
             game_state['card_exchange']['vice_exchange_completed'] = True
             game_state['card_exchange']['completed'] = True
             util_add_system_message(
@@ -621,3 +727,73 @@ def exchange_card_logic(game_state, player_id, card_index, phase, exchange_type,
             return {'success': True, 'message': 'Vice-President-Vice-Culo card exchange completed'}
     else:
         return {'success': False, 'error': 'Invalid exchange type'}
+
+
+def turn_timeout_logic(game_state, turn_timer_duration, save_game_state_func, rng):
+    """Penalize or auto-kick the current player once their turn timer has run out
+
+    A timed out player gets 3 extra cards from the cards not in play, or is
+    kicked after `inactive_turns_threshold` consecutive timeouts. Either way
+    the turn passes to the next player.
+    """
+    time_left = util_get_turn_time_left(game_state, turn_timer_duration)
+    if time_left is None or time_left > 0:
+        return {'success': False, 'error': 'The turn has not timed out'}
+
+    cp_id_for_skip = game_state['seats'].get(game_state['current_player_index'])
+    if cp_id_for_skip in game_state['players']:
+        if cp_id_for_skip and not game_state['players'][cp_id_for_skip]['skipped'] and game_state['players'][cp_id_for_skip]['rank'] is None:
+            timed_out_player = game_state['players'][cp_id_for_skip]
+            game_state['last_skipped_position'] = game_state['current_player_index']
+
+            # Increment inactive turns counter
+            timed_out_player['inactive_turns'] += 1
+
+            # Check if player should be auto-kicked
+            if timed_out_player['inactive_turns'] >= game_state.get('inactive_turns_threshold', 3):
+                # Get the player name before removing them
+                kicked_player_name = timed_out_player['name']
+
+                # Remove the player from the game, their cards go back to the undealt pile
+                game_state['undealt_pile'].extend(timed_out_player['hand'])
+                del game_state['players'][cp_id_for_skip]
+
+                # If the player was in rankings, remove them
+                if cp_id_for_skip in game_state.get('rankings', []):
+                    game_state['rankings'].remove(cp_id_for_skip)
+                util_rebuild_turn_order(game_state)
+
+                # Add system message
+                util_add_system_message(
+                    game_state,
+                    f"👢 {kicked_player_name} was automatically kicked after {game_state.get('inactive_turns_threshold', 3)} inactive turns!",
+                    "warning"
+                )
+                game_state['last_action'] = f"{kicked_player_name} was auto-kicked for inactivity"
+
+                # If the game is in progress, redistribute cards
+                if game_state['started'] and len(game_state['players']) >= 2:
+                    redistribute_cards(game_state, save_game_state_func, rng)
+            else:
+                # Attempt to add 3 cards from the undealt pile to the player's hand
+                cards_to_add = util_draw_from_pile(game_state, 3, rng)
+                if cards_to_add:
+                    util_add_to_hand(timed_out_player, cards_to_add)
+                    util_add_system_message(
+                        game_state,
+                        f"⏳ {timed_out_player['name']} timed out and received 3 extra cards! ({timed_out_player['inactive_turns']}/{game_state.get('inactive_turns_threshold', 3)} inactive turns)",
+                        "warning"
+                    )
+                    game_state['last_action'] = f"{timed_out_player['name']} timed out and received 3 cards"
+                else:
+                    util_add_system_message(
+                        game_state,
+                        f"⏳ {timed_out_player['name']} timed out! ({timed_out_player['inactive_turns']}/{game_state.get('inactive_turns_threshold', 3)} inactive turns) (Not enough cards in deck to penalize).",
+                        "warning"
+                    )
+                    game_state['last_action'] = f"{timed_out_player['name']} timed out"
+
+            advance_to_next_player(game_state, save_game_state_func)
+            save_game_state_func()
+            return {'success': True, 'player_id': cp_id_for_skip, 'kicked': cp_id_for_skip not in game_state['players']}
+    return {'success': False, 'error': 'No active player to time out'}
@@ -0,0 +1,312 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .persistence import (BackgroundStateWriter, GameStateJournal, diff_state_entries, encode_state_entries,
+                          pack_state_entries, record_changed_keys, unpack_state_entries)
+from .snapshot import SNAPSHOT_MAGIC, decode_snapshot, migrate_game_state
+
+
+class VersionConflict(Exception):
+    """A commit expected a version of the room that is no longer the latest"""
+
+
+class StateBackend:
+    """Where rooms are persisted, and how processes sharing them stay in step
+
+    Every commit of a room gets the next version number. A commit names the
+    version its state was derived from and fails with VersionConflict if
+    somebody else committed in the meantime (compare-and-swap). Backends that
+    other processes can commit to as well are `shared`; for those, a change
+    that conflicts with a commit made elsewhere is made again on the newer
+    state (see RoomRegistry.mutate()), and subscribe() reports commits made
+    elsewhere.
+    """
+
+    shared = False
+
+    def load(self, room_id):
+        """Read the latest committed state of a room
+
+        Returns:
+            A (state or None, version, epoch) tuple. The state is migrated to
+            the current schema but still needs util_restore_game_state().
+            `epoch` changes whenever versions start over, None for a new epoch
+        """
+        raise NotImplementedError
+
+    def exists(self, room_id):
+        """Whether the room has committed state, without creating anything"""
+        raise NotImplementedError
+
+    def current_version(self, room_id):
+        """The latest committed version of the room"""
+        raise NotImplementedError
+
+    def commit(self, room_id, expected_version, game_state):
+        """Persist the state as the version after `expected_version`
+
+        Returns:
+            A (new version, changed entry keys or None if unknown) tuple, or
+            None if the state did not change
+        Raises:
+            VersionConflict: If `expected_version` is not the latest version
+        """
+        raise NotImplementedError
+
+    def subscribe(self, room_id, callback):
+        """Call callback(room_id, version) when another process commits to the room
+
+        Returns:
+            A function that cancels the subscription
+        """
+        return lambda: None
+
+    def release(self, room_id):
+        """Write everything pending for the room and let go of its resources"""
+
+    def close(self):
+        pass
+
+
+class JournalStateBackend(StateBackend):
+    """Rooms in per-room snapshot and journal files, for a single server process
+
+    Each room lives in its own directory under `directory`. Journal records
+    are written off the request path by one shared BackgroundStateWriter.
+    Versions are counted in memory and start over (with a new epoch) whenever
+    a room is loaded.
+    """
+
+    def __init__(self, directory, snapshot_interval=200, flush_interval=0.2,
+                 fsync_policy='interval', fsync_interval=1.0):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.writer = BackgroundStateWriter(flush_interval=flush_interval)
+        self._journals = {}  # Room id -> GameStateJournal
+        self._versions = {}  # Room id -> latest version
+        self._lock = threading.Lock()
+
+    def _snapshot_path(self, room_id):
+        return os.path.join(self.directory, room_id, 'game_state.pickle')
+
+    def load(self, room_id):
+        # The room's directory is made when its first snapshot is written, see GameStateJournal
+        journal = GameStateJournal(self._snapshot_path(room_id),
+                                   snapshot_interval=self.snapshot_interval,
+                                   fsync_policy=self.fsync_policy, fsync_interval=self.fsync_interval)
+        with self._lock:
+            self._journals[room_id] = journal
+            self._versions[room_id] = 0
+        return journal.load(), 0, None
+
+    def exists(self, room_id):
+        with self._lock:
+            if self._versions.get(room_id, 0) > 0:
+                return True  # Committed, but maybe not written yet
+        return os.path.exists(self._snapshot_path(room_id))
+
+    def current_version(self, room_id):
+        with self._lock:
+            return self._versions.get(room_id, 0)
+
+    def commit(self, room_id, expected_version, game_state):
+        with self._lock:
+            journal = self._journals[room_id]
+            if self._versions[room_id] != expected_version:
+                raise VersionConflict(f"Room {room_id} is at version {self._versions[room_id]}, "
+                                      f"not {expected_version}")
+            record = journal.capture(game_state)
+            if record is None:
+                return None
+            self._versions[room_id] = version = expected_version + 1
+        self.writer.queue(journal, record)
+        return version, record_changed_keys(record)
+
+    def release(self, room_id):
+        with self._lock:
+            journal = self._journals.pop(room_id, None)
+            self._versions.pop(room_id, None)
+        if journal is not None:
+            self.writer.release(journal)
+
+    def close(self):
+        self.writer.close()
+
+
+class SQLiteStateBackend(StateBackend):
+    """Rooms in one SQLite database that the worker processes on a host share
+
+    Every commit stores the room's full state under its version, as the
+    pack_state_entries() blob of the entries it already encoded to tell what
+    changed, so a state is encoded once per commit. Commits are one
+    compare-and-swap statement each (UPDATE ... WHERE version = ?): nothing
+    holds the database's write lock while a mutation runs, so rooms (and
+    the same room's readers) on different processes never wait for each
+    other. A commit that finds the room already past its version raises
+    VersionConflict, and the caller catches up and runs its change again
+    (see RoomRegistry.mutate()). The database runs in WAL mode, so readers
+    never wait for a writer.
+
+    Commits by other processes are noticed by polling PRAGMA data_version
+    every `poll_interval` seconds on a background thread, which then calls
+    the subscribers of the rooms whose version moved. Rows written before
+    commits stored entries hold a snapshot (see game_logic/snapshot.py),
+    which still loads.
+    """
+
+    shared = True
+
+    def __init__(self, path, poll_interval=0.05, busy_timeout=30.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()  # One connection per thread
+        self._connections = []
+        self._lock = threading.Lock()
+        self._entries = {}  # Room id -> encode_state_entries() of the last commit seen, for changed keys
+        self._seen_versions = {}  # Room id -> latest version this process knows of
+        self._subscribers = {}  # Room id -> list of callbacks
+        self._poller = None
+        self._closed = threading.Event()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS rooms (room_id TEXT PRIMARY KEY, "
+                           "version INTEGER NOT NULL, snapshot BLOB NOT NULL)")
+        # Versions are never reset, so one epoch per database keeps state tags equal across processes
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+        self.epoch = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def load(self, room_id):
+        row = self._connection().execute("SELECT version, snapshot FROM rooms WHERE room_id = ?",
+                                         (room_id,)).fetchone()
+        if row is None:
+            with self._lock:
+                self._seen_versions[room_id] = 0
+                self._entries.pop(room_id, None)
+            return None, 0, self.epoch
+        version, data = row
+        if data[:len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC:
+            schema_version, _, game_state = decode_snapshot(data)
+        else:
+            schema_version, game_state = unpack_state_entries(data)
+        game_state = migrate_game_state(game_state, schema_version)
+        with self._lock:
+            self._seen_versions[room_id] = version
+            self._entries.pop(room_id, None)  # Restoring adds keys, so compare against the restored state
+        return game_state, version, self.epoch
+
+    def exists(self, room_id):
+        return self._connection().execute("SELECT 1 FROM rooms WHERE room_id = ?", (room_id,)).fetchone() is not None
+
+    def current_version(self, room_id):
+        row = self._connection().execute("SELECT version FROM rooms WHERE room_id = ?", (room_id,)).fetchone()
+        return row[0] if row else 0
+
+    def commit(self, room_id, expected_version, game_state):
+        previous_entries = self._entries.get(room_id)
+        entries = encode_state_entries(game_state, previous_entries)
+        changed_keys = None
+        if previous_entries is not None:
+            changed, removed = diff_state_entries(previous_entries, entries)
+            if not changed and not removed:
+                return None
+            changed_keys = list(changed) + removed
+
+        version = expected_version + 1
+        data = pack_state_entries(entries)
+        # One statement in autocommit mode: the database's write lock is only held while it runs
+        if expected_version == 0:
+            cursor = self._connection().execute(
+                "INSERT OR IGNORE INTO rooms (room_id, version, snapshot) VALUES (?, ?, ?)", (room_id, version, data))
+        else:
+            cursor = self._connection().execute(
+                "UPDATE rooms SET version = ?, snapshot = ? WHERE room_id = ? AND version = ?",
+                (version, data, room_id, expected_version))
+        if cursor.rowcount != 1:
+            raise VersionConflict(f"Room {room_id} is past version {expected_version}")
+        with self._lock:
+            self._entries[room_id] = entries
+            self._seen_versions[room_id] = max(self._seen_versions.get(room_id, 0), version)
+        return version, changed_keys
+
+    def subscribe(self, room_id, callback):
+        with self._lock:
+            self._subscribers.setdefault(room_id, []).append(callback)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='state-poller', daemon=True)
+                self._poller.start()
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(room_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._subscribers.pop(room_id, None)
+        return unsubscribe
+
+    def release(self, room_id):
+        with self._lock:
+            self._entries.pop(room_id, None)
+            self._seen_versions.pop(room_id, None)
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.ProgrammingError:
+                pass  # Still in use by a thread that is about to exit
+
+    def _poll(self):
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        data_version = None
+        while not self._closed.wait(self.poll_interval):
+            try:
+                # Changes whenever another connection commits, and costs no table read
+                new_data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+                if new_data_version == data_version:
+                    continue
+                data_version = new_data_version
+                with self._lock:
+                    room_ids = list(self._subscribers)
+                if not room_ids:
+                    continue
+                rows = connection.execute(f"SELECT room_id, version FROM rooms WHERE room_id IN "
+                                          f"({','.join('?' * len(room_ids))})", room_ids).fetchall()
+            except sqlite3.Error as e:
+                print(f"Error polling the state database: {e}")
+                time.sleep(self.poll_interval)
+                continue
+            for room_id, version in rows:
+                with self._lock:
+                    if version <= self._seen_versions.get(room_id, 0):
+                        continue
+                    self._seen_versions[room_id] = version
+                    callbacks = list(self._subscribers.get(room_id, []))
+                for callback in callbacks:
+                    try:
+                        callback(room_id, version)
+                    except Exception as e:
+                        print(f"Error handling a commit to room {room_id}: {e}")
+        connection.close()
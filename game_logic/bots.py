@@ -0,0 +1,140 @@
+import uuid
+
+from .actions import add_player_logic, play_card_logic, skip_turn_logic
+from .simulation import STRATEGIES, exchange_step, legal_plays
+from .utils import (util_add_system_message, util_get_player_by_position,
+                    util_get_turn_time_left)
+
+BOT_STRATEGY = 'lowest-legal'  # Strategy of bots that fill seats or take over idle players
+
+
+def is_bot_controlled(player_data):
+    return player_data.get('bot_strategy') is not None
+
+
+def bot_to_move(game_state):
+    """The id of the bot-controlled player who has to act now, or None
+
+    That is the current player during a round, or the President or
+    Vice-President whose turn it is to choose cards during the card exchange.
+    """
+    if not game_state['started'] or game_state.get('game_over', False):
+        return None
+    exchange_state = game_state['card_exchange']
+    if exchange_state.get('active', False) and not exchange_state.get('completed', False):
+        key = 'president_id' if exchange_state['current_exchange'] == 'president' else 'vice_president_id'
+        player_id = exchange_state.get(key)
+        player_data = game_state['players'].get(player_id)
+        return player_id if player_data and is_bot_controlled(player_data) else None
+
+    player_data = util_get_player_by_position(game_state, game_state['current_player_index'])
+    if player_data is None or not is_bot_controlled(player_data):
+        return None
+    if player_data['rank'] is not None or player_data['skipped']:
+        return None
+    return game_state['seats'][game_state['current_player_index']]
+
+
+def bot_move_logic(game_state, save_game_state_func, rng):
+    """Let the bot that has to act make its move
+
+    Plays are chosen by the bot's strategy from legal_plays(), which only
+    looks at the hand's value histogram and the top card; a bot that finds
+    nothing to play skips.
+
+    Returns:
+        The result of the action the bot took, or an error if no bot has to act
+    """
+    player_id = bot_to_move(game_state)
+    if player_id is None:
+        return {'success': False, 'error': 'No bot has to act'}
+    exchange_state = game_state['card_exchange']
+    if exchange_state.get('active', False) and not exchange_state.get('completed', False):
+        return exchange_step(game_state, save_game_state_func)
+
+    player_data = game_state['players'][player_id]
+    strategy = STRATEGIES.get(player_data['bot_strategy'], STRATEGIES[BOT_STRATEGY])
+    plays = legal_plays(game_state, player_data)
+    play = strategy(game_state, player_id, plays, rng) if plays else None
+    if play is not None:
+        result = play_card_logic(game_state, player_id, list(play[0]), play[1], save_game_state_func)
+        if result['success']:
+            return result
+    return skip_turn_logic(game_state, player_id, save_game_state_func)
+
+
+def add_bot_logic(game_state, save_game_state_func, rng, strategy=BOT_STRATEGY, player_id=None):
+    """Seat a bot in the first free position before the game starts
+
+    Args:
+        player_id: The bot's player id, a new one by default
+
+    Returns:
+        {'success': True, 'player_id': ...} or an error
+    """
+    if game_state['started']:
+        return {'success': False, 'error': 'Bots can only be added before the game starts'}
+    bot_number = 1 + sum(1 for player_data in game_state['players'].values() if player_data.get('is_bot'))
+    player_id = player_id or new_bot_id()
+    result = add_player_logic(game_state, player_id, f'🤖 Bot {bot_number}', save_game_state_func, rng)
+    if not result['success']:
+        return result
+    game_state['players'][player_id].update(is_bot=True, bot_strategy=strategy)
+    save_game_state_func()
+    return {'success': True, 'player_id': player_id}
+
+
+def new_bot_id():
+    return f'bot-{uuid.uuid4().hex[:8]}'
+
+
+def set_bot_takeover_logic(game_state, host_player_id, enabled, save_game_state_func):
+    """Turn bots that play for timed out players on or off"""
+    game_state['bot_takeover'] = enabled
+    host_name = game_state['players'][host_player_id]['name']
+    if enabled:
+        util_add_system_message(
+            game_state, f"🤖 {host_name} (host) turned on bots: they play for anyone whose turn timer runs out.", "info")
+    else:
+        util_add_system_message(
+            game_state, f"⏳ {host_name} (host) turned off bots: timed out players get penalty cards again.", "info")
+    save_game_state_func()
+    return {'success': True, 'enabled': enabled}
+
+
+def bot_takeover_logic(game_state, turn_timer_duration, save_game_state_func, rng):
+    """Hand the seat of a player whose turn timer ran out to a bot, which moves right away
+
+    This replaces the penalty cards and the auto-kick of turn_timeout_logic()
+    when the room has `bot_takeover` enabled. The player gets the seat back
+    with release_seat_logic() as soon as they act again.
+    """
+    time_left = util_get_turn_time_left(game_state, turn_timer_duration)
+    if time_left is None or time_left > 0:
+        return {'success': False, 'error': 'The turn has not timed out'}
+    player_id = game_state['seats'].get(game_state['current_player_index'])
+    player_data = game_state['players'].get(player_id)
+    if player_data is None or player_data['rank'] is not None or player_data['skipped']:
+        return {'success': False, 'error': 'No active player to time out'}
+
+    player_data['bot_strategy'] = BOT_STRATEGY
+    player_data['inactive_turns'] = 0
+    util_add_system_message(game_state, f"🤖 {player_data['name']} timed out, a bot plays for them until they are back.",
+                            "warning")
+    save_game_state_func()
+    return bot_move_logic(game_state, save_game_state_func, rng)
+
+
+def release_seat_logic(game_state, player_id, save_game_state_func):
+    """Give a player back the seat a bot took over; seated bots keep theirs
+
+    Returns:
+        True if a bot was playing for the player
+    """
+    player_data = game_state['players'].get(player_id)
+    if player_data is None or player_data.get('is_bot') or not is_bot_controlled(player_data):
+        return False
+    player_data['bot_strategy'] = None
+    util_add_system_message(game_state, f"👋 {player_data['name']} is back and plays again.", "info")
+    save_game_state_func()
+    return True
@@ -0,0 +1,221 @@
+import bisect
+import random
+
+from .actions import (add_player_logic, assign_ranks_logic, assign_roles_logic, change_deck_size_logic,
+                      change_video_logic, claim_host_logic, exchange_card_logic, kick_player_logic,
+                      play_card_logic, reset_game_logic, send_message_logic, skip_turn_logic, start_game_logic,
+                      turn_timeout_logic)
+from .bots import add_bot_logic, bot_move_logic, bot_takeover_logic, release_seat_logic, set_bot_takeover_logic
+from .snapshot import decode_snapshot, encode_snapshot, migrate_game_state
+from .utils import util_game_rng, util_log_event, util_restore_game_state
+
+# Every change to a room's state is an event: a dict with a 'type' and the
+# fields listed here, made by make_event() and applied by apply_event().
+# Events hold everything their action depends on. Actions that deal or draw
+# cards use the table's generator for the event's number (see util_game_rng).
+# Applying the same events to the same state therefore gives the same state,
+# apart from wall clock values: turn_start_time and the timestamps and ids of
+# system messages.
+EVENT_FIELDS = {
+    'join': ('player_id', 'name'),
+    'add_bot': ('bot_id',),
+    'deal': (),  # The host starts the game
+    'reset': (),
+    'play': ('player_id', 'card_indices', 'joker_value'),
+    'skip': ('player_id',),
+    'exchange': ('player_id', 'card_index', 'phase', 'exchange_type'),
+    'chat': ('player_id', 'text', 'timestamp', 'message_id'),
+    'claim_host': ('player_id',),
+    'assign_roles': ('roles',),
+    'assign_ranks': ('ranks',),
+    'set_bot_takeover': ('player_id', 'enabled'),
+    'deck_size': ('deck_size',),
+    'kick': ('player_id', 'target_id'),
+    'video': ('player_id', 'video_id'),
+    'timeout': (),  # The turn timer ran out: penalty cards or auto-kick
+    'takeover': (),  # The turn timer ran out and a bot takes over the seat
+    'bot_move': (),
+}
+CHECKPOINT_INTERVAL = 50  # Events between the state snapshots logged as replay checkpoints
+
+
+def make_event(event_type, **fields):
+    """A new event
+
+    Raises:
+        ValueError: For an unknown type, or fields that are not the type's
+    """
+    expected_fields = EVENT_FIELDS.get(event_type)
+    if expected_fields is None:
+        raise ValueError(f"Unknown event type: {event_type!r}")
+    if set(fields) != set(expected_fields):
+        raise ValueError(f"A {event_type!r} event has the fields {expected_fields}, not {tuple(fields)}")
+    fields['type'] = event_type
+    return fields
+
+
+def _rng(game_state, event):
+    if 'seed' in event:
+        return random.Random(event['seed'])  # Logged before tables had their own generator
+    return util_game_rng(game_state, game_state['event_seq'])
+
+
+def _as_player(action):
+    """An event handler for a player's own action, which also gives them back a seat a bot took over"""
+    def handler(game_state, event, save_game_state_func):
+        release_seat_logic(game_state, event['player_id'], save_game_state_func)
+        return action(game_state, event, save_game_state_func)
+    return handler
+
+
+# Event type -> handler(game_state, event, save_game_state_func). The turn
+# timer had run out when a timeout event was made, so it is applied with a
+# timer of 0 seconds: a replay must not wait for it again.
+_HANDLERS = {
+    'join': lambda game_state, event, save: add_player_logic(
+        game_state, event['player_id'], event['name'], save, _rng(game_state, event)),
+    'add_bot': lambda game_state, event, save: add_bot_logic(
+        game_state, save, _rng(game_state, event), player_id=event['bot_id']),
+    'deal': lambda game_state, event, save: start_game_logic(game_state, save, _rng(game_state, event)),
+    'reset': lambda game_state, event, save: reset_game_logic(game_state, save, _rng(game_state, event)),
+    'play': _as_player(lambda game_state, event, save: play_card_logic(
+        game_state, event['player_id'], list(event['card_indices']), event['joker_value'], save)),
+    'skip': _as_player(lambda game_state, event, save: skip_turn_logic(game_state, event['player_id'], save)),
+    'exchange': _as_player(lambda game_state, event, save: exchange_card_logic(
+        game_state, event['player_id'], event['card_index'], event['phase'], event['exchange_type'], save)),
+    'chat': _as_player(lambda game_state, event, save: send_message_logic(
+        game_state, event['player_id'], event['text'], event['timestamp'], event['message_id'], save)),
+    'claim_host': _as_player(lambda game_state, event, save: claim_host_logic(game_state, event['player_id'], save)),
+    'assign_roles': lambda game_state, event, save: assign_roles_logic(game_state, event['roles'], save),
+    'assign_ranks': lambda game_state, event, save: assign_ranks_logic(game_state, event['ranks'], save),
+    'set_bot_takeover': lambda game_state, event, save: set_bot_takeover_logic(
+        game_state, event['player_id'], event['enabled'], save),
+    'deck_size': lambda game_state, event, save: change_deck_size_logic(game_state, event['deck_size'], save),
+    'kick': lambda game_state, event, save: kick_player_logic(
+        game_state, event['player_id'], event['target_id'], save, _rng(game_state, event)),
+    'video': lambda game_state, event, save: change_video_logic(
+        game_state, event['player_id'], event['video_id'], save),
+    'timeout': lambda game_state, event, save: turn_timeout_logic(game_state, 0, save, _rng(game_state, event)),
+    'takeover': lambda game_state, event, save: bot_takeover_logic(game_state, 0, save, _rng(game_state, event)),
+    'bot_move': lambda game_state, event, save: bot_move_logic(game_state, save, _rng(game_state, event)),
+}
+
+
+def apply_event(game_state, event, save_game_state_func):
+    """Apply an event to the state and log it
+
+    The log entry (type 'event_log', with the event's sequence number) goes
+    to the state's event list (see util_log_event), so the room registry
+    hands it on when it commits. Every CHECKPOINT_INTERVAL events, and for
+    the first event after the state was loaded, the entry also carries a
+    snapshot of the state before the event, to replay from.
+
+    Only events that succeed or save a change are logged and numbered; a
+    rejected action (or one that raises) leaves the sequence number as it
+    was, so it makes no new version.
+
+    Returns:
+        The result of the event's action
+    """
+    offset = game_state['event_seq']
+    last_skipped_position = game_state['last_skipped_position']
+    checkpoint = None
+    if 'events' in game_state and (offset % CHECKPOINT_INTERVAL == 0 or game_state['checkpoint_due']):
+        checkpoint = encode_snapshot(game_state, offset)  # The state before the event
+    saved = []
+
+    def save():
+        saved.append(True)
+        return save_game_state_func()
+
+    game_state['event_seq'] = offset + 1  # The event's generator (see _rng) is numbered before it runs
+    # One-shot animation triggers stay in the state (and so in every response
+    # for that version) until the next event, instead of being consumed by the first poll
+    game_state['last_skipped_position'] = None
+    logged = False
+    try:
+        result = _HANDLERS[event['type']](game_state, event, save)
+        logged = bool(saved) or result.get('success', False)
+    finally:
+        if not logged:
+            game_state['event_seq'] = offset
+            game_state['last_skipped_position'] = last_skipped_position
+    if logged and 'events' in game_state:
+        if checkpoint is not None:
+            game_state['checkpoint_due'] = False
+        util_log_event(game_state, 'event_log', seq=offset + 1, event=event, checkpoint=checkpoint)
+    return result
+
+
+def _no_save():
+    return True
+
+
+def replay_events(game_state, events):
+    """Apply logged events to a state again, without logging them
+
+    Returns:
+        The state
+    """
+    logged_events = game_state.pop('events', None)
+    for event in events:
+        apply_event(game_state, event, _no_save)
+    if logged_events is not None:
+        game_state['events'] = logged_events
+    return game_state
+
+
+def load_checkpoint(snapshot):
+    """Decode a checkpoint snapshot
+
+    Returns:
+        The (offset, restored game_state) of the checkpoint
+    """
+    schema_version, offset, game_state = decode_snapshot(snapshot)
+    return offset, util_restore_game_state(migrate_game_state(game_state, schema_version), announce=False)
+
+
+class EventLog:
+    """Logged events and checkpoints of a room, to rebuild its state at any offset
+
+    The state at offset n is the state after the room's first n events;
+    event number n (counting from 1) takes it from offset n - 1 to n. A state
+    is rebuilt from the nearest checkpoint at or before its offset, so it
+    takes at most CHECKPOINT_INTERVAL - 1 events to replay.
+    """
+
+    def __init__(self):
+        self.checkpoints = {}  # Offset -> snapshot of the state at that offset
+        self.events = {}  # Sequence number -> event
+        self._checkpoint_offsets = []
+
+    def add(self, seq, event, checkpoint=None):
+        """Add an event (and the checkpoint logged with it, taken before it)"""
+        self.events[seq] = event
+        if checkpoint is not None:
+            self.add_checkpoint(seq - 1, checkpoint)
+
+    def add_checkpoint(self, offset, snapshot):
+        if offset not in self.checkpoints:
+            bisect.insort(self._checkpoint_offsets, offset)
+        self.checkpoints[offset] = snapshot
+
+    @property
+    def last_offset(self):
+        return max(self.events, default=max(self.checkpoints, default=0))
+
+    def state_at(self, offset):
+        """Rebuild the state at the offset
+
+        Raises:
+            ValueError: If no checkpoint precedes the offset, or events between them are missing
+        """
+        index = bisect.bisect_right(self._checkpoint_offsets, offset) - 1
+        if index < 0:
+            raise ValueError(f"No checkpoint at or before offset {offset}")
+        start, game_state = load_checkpoint(self.checkpoints[self._checkpoint_offsets[index]])
+        try:
+            events = [self.events[seq] for seq in range(start + 1, offset + 1)]
+        except KeyError as e:
+            raise ValueError(f"Event {e.args[0]} is missing from the log") from e
+        return replay_events(game_state, events)
@@ -0,0 +1,271 @@
+import atexit
+import marshal
+import pickle
+import sqlite3
+import threading
+import time
+from array import array
+
+from .eventlog import EventLog, load_checkpoint, replay_events
+from .snapshot import load_pickled_data
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS games (game_id INTEGER PRIMARY KEY, room_id TEXT NOT NULL, "
+    "deck_size REAL NOT NULL, started_at REAL NOT NULL, finished_at REAL, rng_seed INTEGER)",
+    "CREATE INDEX IF NOT EXISTS games_by_room ON games (room_id, game_id)",
+    "CREATE TABLE IF NOT EXISTS seats (game_id INTEGER NOT NULL, player_id TEXT NOT NULL, name TEXT NOT NULL, "
+    "position INTEGER NOT NULL, role TEXT, place INTEGER, finished_at REAL, "
+    "PRIMARY KEY (game_id, player_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS hands (game_id INTEGER NOT NULL, player_id TEXT NOT NULL, cards BLOB NOT NULL, "
+    "PRIMARY KEY (game_id, player_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS plays (play_id INTEGER PRIMARY KEY, game_id INTEGER NOT NULL, "
+    "player_id TEXT NOT NULL, cards BLOB NOT NULL, played_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS plays_by_game ON plays (game_id, play_id)",
+    "CREATE TABLE IF NOT EXISTS chat (chat_id INTEGER PRIMARY KEY, room_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+    "game_id INTEGER, sender TEXT, text TEXT, type TEXT, sent_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chat_by_room ON chat (room_id, chat_id)",
+    "CREATE TABLE IF NOT EXISTS events (room_id TEXT NOT NULL, seq INTEGER NOT NULL, type TEXT NOT NULL, "
+    "event BLOB NOT NULL, logged_at REAL NOT NULL, PRIMARY KEY (room_id, seq)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS checkpoints (room_id TEXT NOT NULL, offset INTEGER NOT NULL, "
+    "snapshot BLOB NOT NULL, PRIMARY KEY (room_id, offset)) WITHOUT ROWID",
+)
+
+# The statements are constant, so each connection compiles them once (sqlite3's statement cache)
+_INSERT_GAME = "INSERT INTO games (room_id, deck_size, started_at, rng_seed) VALUES (?, ?, ?, ?)"
+_INSERT_SEAT = ("INSERT OR REPLACE INTO seats (game_id, player_id, name, position, role) "
+                "VALUES (?, ?, ?, ?, ?)")
+_INSERT_HAND = "INSERT OR REPLACE INTO hands (game_id, player_id, cards) VALUES (?, ?, ?)"
+_INSERT_PLAY = "INSERT INTO plays (game_id, player_id, cards, played_at) VALUES (?, ?, ?, ?)"
+_INSERT_CHAT = ("INSERT INTO chat (room_id, seq, game_id, sender, text, type, sent_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)")
+# A room's events start over from 1 if its state is lost, so newer ones replace the old
+_INSERT_EVENT = "INSERT OR REPLACE INTO events (room_id, seq, type, event, logged_at) VALUES (?, ?, ?, ?, ?)"
+_INSERT_CHECKPOINT = "INSERT OR REPLACE INTO checkpoints (room_id, offset, snapshot) VALUES (?, ?, ?)"
+_UPDATE_PLACE = "UPDATE seats SET place = ?, finished_at = ? WHERE game_id = ? AND player_id = ?"
+_UPDATE_FINISHED = "UPDATE games SET finished_at = ? WHERE game_id = ?"
+_SELECT_CHECKPOINT_OFFSET = "SELECT max(offset) FROM checkpoints WHERE room_id = ? AND offset <= ?"
+_SELECT_CHECKPOINTS = "SELECT offset, snapshot FROM checkpoints WHERE room_id = ? AND offset BETWEEN ? AND ?"
+_SELECT_EVENTS = "SELECT seq, event FROM events WHERE room_id = ? AND seq > ? AND seq <= ? ORDER BY seq"
+# The latest checkpoint of a room and the events after it, as (0, offset, snapshot) and
+# (1, seq, event) rows; both parts are range scans of a primary key
+_SELECT_LIVE_STATE = ("WITH latest AS (SELECT offset, snapshot FROM checkpoints WHERE room_id = ? "
+                      "ORDER BY offset DESC LIMIT 1) "
+                      "SELECT 0, offset, snapshot FROM latest UNION ALL "
+                      "SELECT 1, seq, event FROM events WHERE room_id = ? AND seq > (SELECT offset FROM latest) "
+                      "ORDER BY 1, 2")
+_SELECT_LATEST_GAME = ("SELECT game_id, deck_size, started_at, finished_at, rng_seed FROM games "
+                       "WHERE room_id = ? ORDER BY game_id DESC LIMIT 1")
+
+
+def encode_cards(cards):
+    """Cards as stored in the hands and plays tables: two bytes each, as jokers may carry a value"""
+    return array('H', cards).tobytes()
+
+
+def decode_cards(data):
+    cards = array('H')
+    cards.frombytes(data)
+    return cards.tolist()
+
+
+_PICKLE_PROTOCOL = 5  # Of logged events; documented and readable by later Python versions
+
+
+def _decode_event(data):
+    """A logged event, pickled or (as databases from before did) marshal-encoded"""
+    if data[:1] == b'\x80':  # Pickle's PROTO opcode, which never starts marshal data
+        return load_pickled_data(data)
+    return marshal.loads(data)
+
+
+class HistoryStore:
+    """The history of every game in every room, in a SQLite database
+
+    Tables: games (one row per deal, with its room), seats (who played,
+    their role going in and the place they finished in), hands (the cards
+    each player was dealt), plays (every play in order) and chat (every
+    message). The events and checkpoints tables hold each room's event log
+    (see game_logic/eventlog.py), which load_event_log() reads and
+    load_live_state() restores a room's table from. Several
+    server processes can share the database; it runs in WAL mode, so reading
+    the history never waits for the writer.
+
+    record() only queues the events a room committed (see util_log_event), so
+    it is cheap enough for the request path. A writer thread waits
+    `flush_interval` seconds to batch further events, then writes them all
+    in one transaction with one executemany() per table. If that fails, each
+    commit's events are written on their own and those that still fail are
+    dropped, so one bad event loses only its own commit. close() writes
+    everything still pending and is registered to run at exit.
+    """
+
+    def __init__(self, path, flush_interval=0.5, busy_timeout=30.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = []  # (room_id, events) pairs in commit order
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._connection = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(games)")]
+        if 'rng_seed' not in columns:  # Databases from before tables recorded their seed
+            self._connection.execute("ALTER TABLE games ADD COLUMN rng_seed INTEGER")
+        self._reader = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None,
+                                       check_same_thread=False)
+        atexit.register(self.close)
+
+    def record(self, room_id, events):
+        """Queue the events of one commit of the room for writing"""
+        with self._pending_lock:
+            self._pending.append((room_id, events))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def latest_game(self, room_id):
+        """The room's most recent game, which is the one in progress unless it has finished
+
+        Returns:
+            {'game_id', 'deck_size', 'started_at', 'finished_at', 'rng_seed'},
+            or None if the room never played a game
+        """
+        with self._read_lock:
+            row = self._reader.execute(_SELECT_LATEST_GAME, (room_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('game_id', 'deck_size', 'started_at', 'finished_at', 'rng_seed'), row))
+
+    def load_live_state(self, room_id):
+        """Restore the room's table as of its last recorded event, with one query
+
+        Returns:
+            The restored game state, or None if the room has no event log
+        """
+        with self._read_lock:
+            rows = self._reader.execute(_SELECT_LIVE_STATE, (room_id, room_id)).fetchall()
+        if not rows:
+            return None
+        _, game_state = load_checkpoint(rows[0][2])
+        return replay_events(game_state, [_decode_event(event) for _, _, event in rows[1:]])
+
+    def load_event_log(self, room_id, first=0, last=None):
+        """Read the part of the room's event log needed to rebuild its states from offset `first` to `last`
+
+        Returns:
+            An EventLog, starting at the last checkpoint at or before `first`
+        """
+        last = (1 << 62) if last is None else last
+        event_log = EventLog()
+        with self._read_lock:
+            start = self._reader.execute(_SELECT_CHECKPOINT_OFFSET, (room_id, first)).fetchone()[0]
+            if start is None:
+                return event_log
+            checkpoints = self._reader.execute(_SELECT_CHECKPOINTS, (room_id, start, last)).fetchall()
+            events = self._reader.execute(_SELECT_EVENTS, (room_id, start, last)).fetchall()
+        for offset, snapshot in checkpoints:
+            event_log.add_checkpoint(offset, snapshot)
+        for seq, event in events:
+            event_log.add(seq, _decode_event(event))
+        return event_log
+
+    def write_pending(self):
+        """Write all queued events now, on the calling thread"""
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                self._write(pending)
+                return
+            except Exception as e:
+                print(f"Error saving game history: {e}")
+            if len(pending) == 1:
+                return
+            for room_id, events in pending:
+                try:
+                    self._write([(room_id, events)])
+                except Exception as e:
+                    print(f"Dropping the game history of one commit to room {room_id}: {e}")
+
+    def close(self):
+        self.write_pending()
+        with self._write_lock, self._read_lock:
+            self._connection.close()
+            self._reader.close()
+
+    def _write(self, pending):
+        connection = self._connection
+        game_ids = {}  # Room id -> id of the room's current game
+        seats, hands, plays, chat, places, finished = [], [], [], [], [], []
+        logged_events, checkpoints = [], []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for room_id, events in pending:
+                if room_id not in game_ids:
+                    # Another process may have started the room's game; the index makes this one lookup
+                    row = connection.execute(_SELECT_LATEST_GAME, (room_id,)).fetchone()
+                    game_ids[room_id] = row[0] if row else None
+                for event in events:
+                    event_type = event['type']
+                    if event_type == 'event_log':
+                        logged_event = event['event']
+                        logged_events.append((room_id, event['seq'], logged_event['type'],
+                                              pickle.dumps(logged_event, _PICKLE_PROTOCOL), event['time']))
+                        if event['checkpoint'] is not None:
+                            checkpoints.append((room_id, event['seq'] - 1, event['checkpoint']))
+                        continue
+                    if event_type == 'chat':
+                        message = event['message']
+                        chat.append((room_id, message['seq'], game_ids[room_id], message['sender'],
+                                     message['text'], message.get('type'), event['time']))
+                        continue
+                    if event_type == 'game_started':
+                        game_ids[room_id] = connection.execute(_INSERT_GAME, (
+                            room_id, event['deck_size'], event['time'], event.get('rng_seed'))).lastrowid
+                        new_seats = event['seats']
+                    elif event_type == 'dealt_in':
+                        new_seats = [event]
+                    else:
+                        new_seats = ()
+                    game_id = game_ids[room_id]
+                    if game_id is None:
+                        continue  # Events of a game that started before history was recorded
+                    for seat in new_seats:
+                        seats.append((game_id, seat['player_id'], seat['name'], seat['position'], seat['role']))
+                        hands.append((game_id, seat['player_id'], encode_cards(seat['hand'])))
+                    if event_type == 'play':
+                        plays.append((game_id, event['player_id'], encode_cards(event['cards']), event['time']))
+                    elif event_type == 'finished':
+                        places.append((event['place'], event['time'], game_id, event['player_id']))
+                    elif event_type == 'game_over':
+                        finished.append((event['time'], game_id))
+            # Rows before the updates that may refer to them
+            for statement, rows in ((_INSERT_SEAT, seats), (_INSERT_HAND, hands), (_INSERT_PLAY, plays),
+                                    (_INSERT_CHAT, chat), (_INSERT_EVENT, logged_events),
+                                    (_INSERT_CHECKPOINT, checkpoints), (_UPDATE_PLACE, places),
+                                    (_UPDATE_FINISHED, finished)):
+                if rows:
+                    connection.executemany(statement, rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.flush_interval)  # Let more events accumulate into one transaction
+            self._wakeup.clear()
+            try:
+                self.write_pending()
+            except Exception as e:  # Never let the writer thread die, or history stops for good
+                print(f"Error in the game history writer: {e}")
@@ -0,0 +1,464 @@
+import atexit
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+
+from .snapshot import (SCHEMA_VERSION, SNAPSHOT_MAGIC, SnapshotError, decode_snapshot, encode_snapshot,
+                       load_pickled_data, migrate_game_state)
+
+# Each journal record is a little-endian uint32 length followed by a pickled payload
+RECORD_HEADER = struct.Struct('<I')
+# A blob of encode_state_entries() is STATE_ENTRIES_MAGIC, a <uint16 schema version and the pickled entries
+STATE_ENTRIES_MAGIC = b'VCSE'
+_ENTRIES_HEADER = struct.Struct('<H')
+# Lists journaled item by item, keyed by the given item field. Their items never
+# change once added, so each is pickled only once; empty (None) slots are skipped.
+KEYED_LISTS = {'chat_messages': 'id'}
+# When journal writes are fsynced: after every write, once the oldest unsynced
+# write is `fsync_interval` seconds old, or never (left to the OS)
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class GameStateJournal:
+    """Persist the game state as a snapshot plus an append-only journal of deltas
+
+    Every save compares each top-level key of the game state (and every player
+    entry individually) against what was last persisted and appends only the
+    changed entries to the journal. Every `snapshot_interval` journal records
+    the full state is written to the snapshot file (see game_logic/snapshot.py)
+    and the journal starts over. Snapshot files of older versions, which were
+    pickles, still load, and are migrated like older snapshot schemas.
+
+    Lists in KEYED_LISTS (the chat) are journaled per item, so appending a
+    message costs one entry instead of rewriting the whole list. They are
+    loaded back as plain lists of their items, in the order they were added.
+
+    Snapshot and journal carry a generation number so a journal that belongs to
+    an older snapshot (e.g. after a crash between the two writes) is ignored.
+    Snapshots are written to a temporary file that replaces the snapshot file
+    only once complete, so a crash or a concurrent save can never leave a
+    truncated snapshot; a torn record at the end of the journal is ignored.
+
+    `fsync_policy` (see FSYNC_POLICIES) decides how much of the journal a
+    machine crash may lose. Snapshots are fsynced, together with their
+    directory, under every policy but 'never'.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, snapshot_interval=200,
+                 fsync_policy='interval', fsync_interval=1.0):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy!r}")
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or f"{snapshot_path}.journal"
+        self.snapshot_interval = snapshot_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.generation = 0
+        self.records_since_snapshot = 0
+        self._persisted = None  # Entry key -> pickled bytes of the last persisted value
+        self._journal_file = None
+        self._journal_intact = False
+        self._unsynced_since = None  # time.monotonic() of the oldest journal write not yet fsynced
+
+    def save(self, game_state):
+        """Append the changes since the last save, or write a snapshot when due
+
+        Returns:
+            True if the state was persisted, False on error
+        """
+        try:
+            record = self.capture(game_state)
+            if record is not None:
+                self.write([record])
+            return True
+        except Exception as e:
+            print(f"Error saving game state: {e}")
+            return False
+
+    def capture(self, game_state):
+        """Encode the changes since the last capture without touching the disk
+
+        Returns:
+            A snapshot or delta record for write(), or None if nothing changed.
+            Both kinds list the changed entry keys, see record_changed_keys().
+        """
+        entries = encode_state_entries(game_state, self._persisted)
+        changed, removed = None, None
+        if self._persisted is not None:
+            changed, removed = diff_state_entries(self._persisted, entries)
+            if not changed and not removed:
+                return None
+
+        self._persisted = entries
+        if changed is None or self.records_since_snapshot >= self.snapshot_interval:
+            self.generation += 1
+            self.records_since_snapshot = 0
+            return {'generation': self.generation,
+                    'snapshot': encode_snapshot(game_state, self.generation),
+                    'changed': None if changed is None else list(changed) + removed}
+
+        self.records_since_snapshot += 1
+        return {'set': changed, 'del': removed}
+
+    def write(self, records):
+        """Write captured records in order, coalescing consecutive deltas into one"""
+        snapshot_indices = [i for i, record in enumerate(records) if 'snapshot' in record]
+        if snapshot_indices:
+            # Everything before the newest snapshot is already contained in it
+            snapshot = records[snapshot_indices[-1]]
+            records = records[snapshot_indices[-1] + 1:]
+            self._write_snapshot(snapshot)
+
+        merged = None
+        for record in records:
+            merged = record if merged is None else merge_delta_records(merged, record)
+        if merged is not None:
+            self._append_record(merged)
+
+    def load(self):
+        """Rebuild the last persisted state from the snapshot and the journal
+
+        The state is migrated to the current snapshot schema once the journal
+        is replayed, since the journal holds values of the snapshot's schema.
+
+        Returns:
+            The game state dict, or None if nothing has been persisted yet
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+
+        with open(self.snapshot_path, 'rb') as f:
+            data = f.read()
+        if data.startswith(SNAPSHOT_MAGIC):
+            schema_version, self.generation, game_state = decode_snapshot(data)
+        else:
+            schema_version = 0
+            snapshot = load_pickled_data(data)
+            if isinstance(snapshot, dict) and 'generation' in snapshot and 'state' in snapshot:
+                self.generation = snapshot['generation']
+                game_state = snapshot['state']
+            else:
+                # Plain pickled state written before the journal existed
+                self.generation = 0
+                game_state = snapshot
+
+        for list_key, item_key in KEYED_LISTS.items():
+            if isinstance(game_state.get(list_key), list):
+                game_state[list_key] = {item[item_key]: item for item in game_state[list_key] if item is not None}
+
+        self.records_since_snapshot = 0
+        self._journal_intact = False
+        journal_matches_snapshot = False
+        for record in self._read_records():
+            if not journal_matches_snapshot:
+                if record.get('generation') != self.generation:
+                    break  # Journal left over from an older snapshot
+                journal_matches_snapshot = True
+                continue
+            for key, data in record['set'].items():
+                self._apply(game_state, key, load_pickled_data(data))
+            for key in record['del']:
+                self._remove(game_state, key)
+            self.records_since_snapshot += 1
+
+        for list_key in KEYED_LISTS:
+            if isinstance(game_state.get(list_key), dict):
+                game_state[list_key] = list(game_state[list_key].values())
+        game_state = migrate_game_state(game_state, schema_version)
+
+        # Without an intact journal for this snapshot the next save starts a fresh generation
+        journal_usable = journal_matches_snapshot and self._journal_intact
+        self._persisted = encode_state_entries(game_state) if journal_usable else None
+        return game_state
+
+    def sync(self):
+        """fsync the journal records written since the last sync"""
+        try:
+            if self._journal_file is not None and self._unsynced_since is not None:
+                os.fsync(self._journal_file.fileno())
+        finally:
+            self._unsynced_since = None
+
+    def sync_deadline(self):
+        """time.monotonic() by which the 'interval' policy wants the journal synced, or None"""
+        if self.fsync_policy != 'interval' or self._unsynced_since is None:
+            return None
+        return self._unsynced_since + self.fsync_interval
+
+    def close(self):
+        if self._journal_file:
+            if self.fsync_policy != 'never':
+                self.sync()
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _apply(self, game_state, key, value):
+        _apply_state_entry(game_state, key, value)
+
+    def _remove(self, game_state, key):
+        if isinstance(key, tuple):
+            game_state.get(key[0], {}).pop(key[1], None)
+        else:
+            game_state.pop(key, None)
+
+    def _write_snapshot(self, snapshot):
+        self.close()
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)  # Nothing is on disk before the first snapshot
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.snapshot_path) + '.',
+                                         suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(snapshot['snapshot'])
+                if self.fsync_policy != 'never':
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if self.fsync_policy != 'never':
+            _fsync_directory(directory)
+        # The journal of the previous snapshot is ignored from here on, its generation no longer matches
+        self._journal_file = open(self.journal_path, 'wb')
+        self._append_record({'generation': snapshot['generation']})
+
+    def _append_record(self, record):
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'ab')
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self._journal_file.write(RECORD_HEADER.pack(len(payload)) + payload)
+        self._journal_file.flush()
+        if self.fsync_policy == 'always':
+            os.fsync(self._journal_file.fileno())
+        elif self.fsync_policy == 'interval':
+            now = time.monotonic()
+            if self._unsynced_since is None:
+                self._unsynced_since = now
+            if now - self._unsynced_since >= self.fsync_interval:
+                self.sync()
+
+    def _read_records(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if not header:
+                    self._journal_intact = True
+                    return
+                if len(header) < RECORD_HEADER.size:
+                    return
+                (length,) = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return  # Torn write at the end of the journal
+                yield load_pickled_data(payload)
+
+
+def encode_state_entries(game_state, persisted=None):
+    """Pickle the state entry by entry, to tell which entries changed between two states
+
+    Entries are the top-level keys, every player and every item of the
+    KEYED_LISTS; items are immutable, so their bytes are taken from
+    `persisted` (an earlier result) when they are already in there.
+
+    Returns:
+        Entry key -> pickled bytes
+    """
+    entries = {}
+    for key, value in game_state.items():
+        if key == 'players':
+            entries[key] = pickle.dumps(list(value.keys()), pickle.HIGHEST_PROTOCOL)
+            for player_id, player_data in value.items():
+                entries[('players', player_id)] = pickle.dumps(player_data, pickle.HIGHEST_PROTOCOL)
+        elif key in KEYED_LISTS and isinstance(value, list):
+            persisted = persisted or {}
+            for item in value:
+                if item is not None:
+                    entry_key = (key, item[KEYED_LISTS[key]])
+                    entries[entry_key] = persisted.get(entry_key) or pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        else:
+            entries[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return entries
+
+
+def _apply_state_entry(game_state, key, value):
+    if key == 'players':
+        # Only the seating order is stored here, player entries are separate
+        players = game_state.get('players', {})
+        game_state['players'] = {player_id: players.get(player_id) for player_id in value}
+    elif isinstance(key, tuple):
+        # Keyed lists are rebuilt as dicts, in insertion order
+        game_state.setdefault(key[0], {})[key[1]] = value
+    else:
+        game_state[key] = value
+
+
+def pack_state_entries(entries):
+    """Store a complete encode_state_entries() result as one blob, with the snapshot schema version
+
+    Returns:
+        STATE_ENTRIES_MAGIC, a <uint16 schema version header and the pickled entries
+    """
+    return STATE_ENTRIES_MAGIC + _ENTRIES_HEADER.pack(SCHEMA_VERSION) + pickle.dumps(entries, pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_state_entries(data):
+    """Rebuild the state from a pack_state_entries() blob
+
+    Like a state loaded from a snapshot, it still needs migrate_game_state()
+    and util_restore_game_state(); keyed lists come back as plain lists of
+    their items.
+
+    Returns:
+        A (schema version, game_state) tuple
+    """
+    if data[:len(STATE_ENTRIES_MAGIC)] != STATE_ENTRIES_MAGIC:
+        raise SnapshotError('Not a state entries blob')
+    (schema_version,) = _ENTRIES_HEADER.unpack_from(data, len(STATE_ENTRIES_MAGIC))
+    if schema_version > SCHEMA_VERSION:
+        raise SnapshotError(f'State entries schema version {schema_version} is newer than {SCHEMA_VERSION}')
+    game_state = {}
+    for key, value in load_pickled_data(data[len(STATE_ENTRIES_MAGIC) + _ENTRIES_HEADER.size:]).items():
+        _apply_state_entry(game_state, key, load_pickled_data(value))
+    for list_key in KEYED_LISTS:
+        # A list without items has no entries at all
+        game_state[list_key] = list(game_state.get(list_key, {}).values())
+    return schema_version, game_state
+
+
+def diff_state_entries(old_entries, new_entries):
+    """Compare two encode_state_entries() results
+
+    Returns:
+        A (changed entry key -> new bytes, removed entry keys) tuple
+    """
+    changed = {key: data for key, data in new_entries.items() if old_entries.get(key) != data}
+    removed = [key for key in old_entries if key not in new_entries]
+    return changed, removed
+
+
+def _fsync_directory(directory):
+    """Make a rename in the directory durable; not every platform can open directories"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def record_changed_keys(record):
+    """Entry keys changed by a captured record, or None if unknown (first snapshot)
+
+    Entry keys are top-level state keys, or (key, item id) tuples for players
+    and keyed list items.
+    """
+    if 'snapshot' in record:
+        return record['changed']
+    return list(record['set']) + list(record['del'])
+
+
+def merge_delta_records(first, second):
+    """Combine two consecutive delta records into one equivalent record"""
+    changed = {key: data for key, data in first['set'].items() if key not in second['del']}
+    changed.update(second['set'])
+    removed = [key for key in first['del'] if key not in second['set']]
+    removed.extend(key for key in second['del'] if key not in removed)
+    return {'set': changed, 'del': removed}
+
+
+class BackgroundStateWriter:
+    """Write captured journal records off the request path
+
+    One writer thread serves any number of journals. Records are captured on
+    the mutating thread (so the state is never read while another thread
+    mutates it) and handed over with queue(); the writer waits
+    `flush_interval` seconds to batch further records before writing. It
+    also fsyncs the journals with the 'interval' policy that went quiet before
+    their interval was up. close() writes everything still pending and is
+    registered to run at exit.
+    """
+
+    def __init__(self, flush_interval=0.2):
+        self.flush_interval = flush_interval
+        self._pending = []  # (journal, record) pairs in capture order
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._journals = set()
+        atexit.register(self.close)
+
+    def queue(self, journal, record):
+        """Queue a record captured from the journal for writing"""
+        with self._pending_lock:
+            self._pending.append((journal, record))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='state-writer', daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def write_pending(self):
+        """Write all queued records now, on the calling thread"""
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            records_by_journal = {}
+            for journal, record in pending:
+                records_by_journal.setdefault(journal, []).append(record)
+            for journal, records in records_by_journal.items():
+                self._journals.add(journal)
+                try:
+                    journal.write(records)
+                except Exception as e:
+                    print(f"Error saving game state: {e}")
+
+    def sync_due(self, now=None):
+        """fsync the journals whose sync deadline has passed"""
+        now = now or time.monotonic()
+        with self._write_lock:
+            for journal in self._journals:
+                deadline = journal.sync_deadline()
+                if deadline is not None and deadline <= now:
+                    try:
+                        journal.sync()
+                    except OSError as e:
+                        print(f"Error syncing game state journal: {e}")
+
+    def _next_sync_timeout(self):
+        with self._write_lock:
+            deadlines = [journal.sync_deadline() for journal in self._journals]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+
+    def release(self, journal):
+        """Write pending records and close the journal's file handle"""
+        self.write_pending()
+        with self._write_lock:
+            journal.close()
+            self._journals.discard(journal)
+
+    def close(self):
+        self.write_pending()
+        with self._write_lock:
+            for journal in self._journals:
+                journal.close()
+            self._journals.clear()
+
+    def _run(self):
+        while True:
+            if self._wakeup.wait(self._next_sync_timeout()):
+                time.sleep(self.flush_interval)  # Let more records accumulate into one write
+                self._wakeup.clear()
+                self.write_pending()
+            self.sync_due()
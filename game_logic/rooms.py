@@ -0,0 +1,413 @@
+import atexit
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .backends import JournalStateBackend, VersionConflict
+from .utils import init_game_state, util_restore_game_state
+
+DEFAULT_ROOM_ID = 'default'
+ROOM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+def is_valid_room_id(room_id):
+    return isinstance(room_id, str) and bool(ROOM_ID_PATTERN.match(room_id))
+
+
+class ReadWriteLock:
+    """Lock that admits any number of readers at once, or a single writer
+
+    Waiting writers block new readers so a steady stream of polls cannot starve
+    a mutation.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class GameRoom:
+    """One game table: its game_state and its lock
+
+    Anything that mutates game_state must hold `lock.write()`; anything that
+    only reads it holds `lock.read()`. `version` is the state backend's version
+    of the state, which increases every time a batch of mutations is committed;
+    subscribers block in wait_for_change() until then, and view_fragment()
+    caches what readers build for one version. `epoch` changes whenever the
+    backend starts counting versions over, so `state_tag` identifies a state
+    uniquely even though versions restart from 0 after a reload. A room that
+    is not `persistent` stands in for a table that does not exist yet and is
+    never committed.
+    """
+
+    def __init__(self, room_id, game_state, version=0, epoch=None, persistent=True):
+        self.room_id = room_id
+        self.persistent = persistent
+        self.game_state = game_state
+        self.lock = ReadWriteLock()
+        self.dirty = False
+        self.last_access = time.time()
+        self.epoch = epoch or uuid.uuid4().hex[:8]
+        self.version = version
+        self.key_versions = {}  # State key -> version that last changed it
+        # Version of the last change with unknown keys; what led up to a loaded version is unknown
+        self.unknown_changes_version = version
+        self.subscribers = 0
+        self._changed = threading.Condition()
+        self._fragments = {}  # Encoded view fragments for _fragments_version
+        self._fragments_version = None
+        self._fragments_lock = threading.Lock()
+
+    def mark_dirty(self):
+        self.dirty = True
+        return True
+
+    @property
+    def state_tag(self):
+        return f"{self.epoch}.{self.version}"
+
+    def parse_state_tag(self, state_tag):
+        """The version a tag from this room's current epoch refers to, or None"""
+        epoch, _, version = (state_tag or '').strip('"').partition('.')
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def publish(self, changed_keys=None, version=None):
+        """Move to the next (or the given) version and wake up everyone waiting for a change
+
+        Args:
+            changed_keys: Journal entry keys that changed, or None if unknown
+            version: The committed version, by default the next one
+        """
+        with self._changed:
+            self.version = self.version + 1 if version is None else version
+            if changed_keys is None:
+                self.unknown_changes_version = self.version
+            else:
+                for key in changed_keys:
+                    if isinstance(key, tuple):
+                        # Track the collection as well as the item, e.g. 'players' and ('players', id)
+                        self.key_versions[key[0]] = self.version
+                        if key[1] in self.game_state.get(key[0], ()):
+                            self.key_versions[key] = self.version
+                        else:
+                            self.key_versions.pop(key, None)
+                    else:
+                        self.key_versions[key] = self.version
+            self._changed.notify_all()
+
+    def changed_since(self, version, key):
+        """Whether the state key (or (collection, item) key) changed after `version`"""
+        return version < self.unknown_changes_version or self.key_versions.get(key, 0) > version
+
+    def view_fragment(self, key, build):
+        """Return build() for the current version, calling it at most once per version
+
+        Callers hold the read lock, so the version cannot change while the
+        fragment is built. Fragments of older versions are dropped.
+        """
+        with self._fragments_lock:
+            if self._fragments_version != self.version:
+                self._fragments = {}
+                self._fragments_version = self.version
+            fragment = self._fragments.get(key)
+        if fragment is None:
+            fragment = build()
+            with self._fragments_lock:
+                if self._fragments_version == self.version:
+                    self._fragments[key] = fragment
+        return fragment
+
+    @contextmanager
+    def subscription(self):
+        """Count a long-lived subscriber; rooms with subscribers are never evicted"""
+        with self._changed:
+            self.subscribers += 1
+        try:
+            yield
+        finally:
+            with self._changed:
+                self.subscribers -= 1
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until the room's version differs from `version` or the timeout passes
+
+        Returns:
+            The current version
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class RoomRegistry:
+    """Rooms keyed by room id, loaded on first use and evicted to disk when idle
+
+    Rooms are persisted by a StateBackend, by default a JournalStateBackend
+    with one directory of snapshot and journal files per room under
+    `directory` (the other arguments configure it). Only rooms that were
+    accessed within `idle_timeout` seconds are kept in memory.
+
+    With a shared backend several processes serve the same rooms: mutation()
+    first catches up with commits made elsewhere, mutate() makes a change
+    again when another process committed to the room before it, and commits
+    of other processes are applied as the backend notices them, so reads
+    (see reading()) may trail them by the backend's poll interval.
+
+    The game events a flush commits (see util_log_event) are taken out of the
+    state and passed to on_events(room, events), e.g. to record the game's
+    history; the events of a discarded change are dropped with it. A room the
+    backend has no state for gets restore(room_id), e.g. its table restored
+    from that history, or a new state if that returns None.
+    """
+
+    def __init__(self, directory, idle_timeout=900, snapshot_interval=200, flush_interval=0.2, on_change=None,
+                 fsync_policy='interval', fsync_interval=1.0, backend=None, on_events=None, restore=None):
+        self.directory = directory
+        self.on_change = on_change  # Called with the room after it is loaded and after every flushed change
+        self.on_events = on_events  # Called with the room and the game events of every flushed change
+        self.restore = restore  # Called with the id of a room the backend has no state for
+        self.idle_timeout = idle_timeout
+        self.backend = backend or JournalStateBackend(directory, snapshot_interval=snapshot_interval,
+                                                      flush_interval=flush_interval, fsync_policy=fsync_policy,
+                                                      fsync_interval=fsync_interval)
+        self.rooms = {}
+        self._unsubscribe = {}  # Room id -> function that ends the room's backend subscription
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+        self._closed = False
+        atexit.register(self.close)
+
+    def get_loaded(self, room_id):
+        """Return the room if it is in memory, without loading or touching it"""
+        with self._lock:
+            return self.rooms.get(room_id)
+
+    def placeholder(self, room_id):
+        """A room with a new state that is neither kept nor persisted, to read a table nobody created yet"""
+        return GameRoom(room_id, init_game_state(), persistent=False)
+
+    def get(self, room_id, create=True):
+        """Return the room, loading it from disk or creating it if needed
+
+        Args:
+            create: False to return None instead of creating a room that was never committed or restored
+        """
+        if not is_valid_room_id(room_id):
+            raise ValueError(f"Invalid room id: {room_id!r}")
+
+        with self._lock:
+            room = self.rooms.get(room_id)
+            if room is None:
+                room = self._load(room_id, create)
+                if room is None:
+                    return None
+                self.rooms[room_id] = room
+                if self.backend.shared:
+                    self._unsubscribe[room_id] = self.backend.subscribe(room_id, self._on_commit)
+                if self.on_change:
+                    self.on_change(room)
+            # Under the lock, so evict_idle() cannot drop the room before the caller uses it
+            room.last_access = time.time()
+
+        if room.last_access - self._last_eviction > self.idle_timeout / 10:
+            self.evict_idle()
+        return room
+
+    @contextmanager
+    def mutation(self, room):
+        """Hold the room's write lock, with the latest state
+
+        The caller flushes the room before the block ends. With a shared
+        backend the commit fails if another process committed to the room
+        in the meantime; mutate() makes the change again then.
+        """
+        with room.lock.write():
+            self._catch_up(room)
+            yield
+
+    def mutate(self, room, change):
+        """Call change() under mutation() and flush the room, again until no other process committed first
+
+        change() must leave the room dirty if it changed the state. When the
+        commit conflicts with one made elsewhere, the room catches up, which
+        discards the change, and change() runs again on the newer state.
+
+        Returns:
+            What the last call of change() returned
+        """
+        while True:
+            with self.mutation(room):
+                result = change()
+                try:
+                    self._flush(room)
+                    return result
+                except VersionConflict as e:
+                    if not self._catch_up(room):
+                        print(f"Discarding a change to room {room.room_id}: {e}")
+                        return result
+
+    @contextmanager
+    def reading(self, room):
+        """Hold the room's read lock
+
+        Commits of other processes reach the room through the backend's
+        subscription, not by asking the backend on every read.
+        """
+        with room.lock.read():
+            yield
+
+    def flush(self, room):
+        """Commit everything the room changed since the last flush as one version
+
+        The caller must hold the room's write lock, from mutation() if the
+        backend is shared. A change that conflicts with a commit of another
+        process is discarded; mutate() makes it again instead.
+        """
+        try:
+            return self._flush(room)
+        except VersionConflict as e:
+            print(f"Discarding a change to room {room.room_id}: {e}")
+            self._catch_up(room)
+            return False
+
+    def _flush(self, room):
+        """flush(), but raising VersionConflict"""
+        if not room.dirty:
+            return False
+        room.dirty = False
+        if not room.persistent:
+            return False
+        events = room.game_state.get('events')
+        if events:
+            room.game_state['events'] = []  # Never persisted
+        try:
+            committed = self.backend.commit(room.room_id, room.version, room.game_state)
+        except VersionConflict:
+            raise
+        except Exception as e:
+            print(f"Error saving game state for room {room.room_id}: {e}")
+            return False
+        if events and self.on_events:
+            self.on_events(room, events)
+        if committed is None:
+            return False
+        version, changed_keys = committed
+        room.publish(changed_keys, version)
+        if self.on_change:
+            self.on_change(room)
+        return True
+
+    def evict_idle(self, now=None):
+        """Persist and drop rooms that have not been accessed for idle_timeout seconds
+
+        Only changes are written, so a room that was only looked at leaves nothing on disk.
+        """
+        now = now or time.time()
+        self._last_eviction = now
+        with self._lock:
+            # Held until the files are written so the room cannot be reloaded from a stale journal
+            idle_rooms = [room for room in self.rooms.values()
+                          if now - room.last_access > self.idle_timeout and not room.subscribers]
+            for room in idle_rooms:
+                del self.rooms[room.room_id]
+                self._unsubscribe.pop(room.room_id, lambda: None)()
+                if room.dirty:
+                    with self.mutation(room):
+                        self.flush(room)
+                self.backend.release(room.room_id)
+        return [room.room_id for room in idle_rooms]
+
+    def close(self):
+        """Flush every room and close the backend; later calls do nothing"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            rooms = list(self.rooms.values())
+        for room in rooms:
+            with self.mutation(room):
+                self.flush(room)
+        self.backend.close()
+
+    def _load(self, room_id, create=True):
+        game_state, version, epoch = None, 0, None
+        try:
+            if not create and not self.backend.exists(room_id):
+                game_state = self.restore(room_id) if self.restore else None
+                if game_state is None:
+                    return None
+            loaded_state, version, epoch = self.backend.load(room_id)
+            if loaded_state is not None:
+                game_state = util_restore_game_state(loaded_state, announce=not self.backend.shared)
+            elif game_state is None and self.restore:
+                game_state = self.restore(room_id)
+        except Exception as e:
+            if not create:
+                print(f"Error loading game state for room {room_id}: {e}")
+                return None
+            print(f"Error loading game state for room {room_id}: {e} - Reinitializing game state.")
+        return GameRoom(room_id, game_state or init_game_state(), version, epoch)
+
+    def _catch_up(self, room):
+        """Replace the room's state with a newer one another process committed
+
+        The caller holds the room's write lock.
+        """
+        if not self.backend.shared or self.backend.current_version(room.room_id) == room.version:
+            return False
+        try:
+            loaded_state, version, epoch = self.backend.load(room.room_id)
+        except Exception as e:
+            print(f"Error reloading game state for room {room.room_id}: {e}")
+            return False
+        if loaded_state is None:
+            return False
+        room.game_state = util_restore_game_state(loaded_state, announce=False)
+        room.epoch = epoch or room.epoch
+        room.dirty = False
+        room.publish(None, version)
+        if self.on_change:
+            self.on_change(room)
+        return True
+
+    def _on_commit(self, room_id, version):
+        """Backend subscription callback: apply another process's commit to the room in memory"""
+        room = self.get_loaded(room_id)
+        if room is not None and room.version != version:
+            with room.lock.write():
+                self._catch_up(room)
@@ -0,0 +1,216 @@
+from .actions import (add_player_logic, exchange_card_logic, play_card_logic,
+                      reset_game_logic, skip_turn_logic, start_game)
+from .utils import (CARD_VALUES, VALUES, init_game_state, util_card_numeric_value,
+                    util_game_rng, util_get_player_by_position)
+
+
+def _no_save():
+    return True
+
+
+def legal_plays(game_state, player_data):
+    """Every distinct play the player could make now
+
+    Plays use the leftmost cards of each value run in the sorted hand, and
+    2s only to make up for missing cards of the value they stand in for (or
+    on their own, plain or as Aces).
+
+    Returns:
+        A list of (card_indices, joker_value) tuples
+    """
+    value_counts = player_data['value_counts']
+    jokers = value_counts[0]
+    plays = []
+    if not game_state['table']:
+        sizes = None  # Any size can lead a round
+        top_value = 0
+    else:
+        sizes = (game_state['required_cards_to_play'],)
+        top_value = util_card_numeric_value(game_state['table'][-1])
+
+    run_start = jokers
+    for value in range(1, len(VALUES)):
+        count = value_counts[value]
+        if count and value >= top_value:
+            for size in sizes or range(1, count + jokers + 1):
+                if size <= count:
+                    plays.append((list(range(run_start, run_start + size)), None))
+                elif size <= count + jokers:
+                    plays.append((list(range(run_start, run_start + count)) + list(range(size - count)),
+                                  VALUES[value]))
+        run_start += count
+    for size in sizes or range(1, jokers + 1):
+        if size <= jokers:
+            plays.append((list(range(size)), None))
+            plays.append((list(range(size)), 'ace'))
+    return plays
+
+
+def play_value(game_state, play, hand=None):
+    """The value a play counts as: its joker value, or the value of its natural cards
+
+    Strategies rank every play of a turn, so they pass the current player's
+    hand instead of having it looked up for each play.
+    """
+    card_indices, joker_value = play
+    if joker_value:
+        return CARD_VALUES[joker_value]
+    if hand is None:
+        hand = game_state['players'][game_state['seats'][game_state['current_player_index']]]['hand']
+    return util_card_numeric_value(hand[card_indices[-1]])
+
+
+def lowest_legal_strategy(game_state, player_id, plays, rng):
+    """Shed the lowest cards first and keep 2s for when nothing else fits"""
+    player_data = game_state['players'][player_id]
+    jokers, hand = player_data['value_counts'][0], player_data['hand']
+    # The 2s come first in the hand and last in a play, see legal_plays()
+    return min(plays, key=lambda play: (play[0][-1] < jokers, play_value(game_state, play, hand), -len(play[0])))
+
+
+def greedy_ace_strategy(game_state, player_id, plays, rng):
+    """Clear the table with an Ace (or 2s played as Aces) whenever possible"""
+    hand = game_state['players'][player_id]['hand']
+    ace_plays = [play for play in plays if play_value(game_state, play, hand) == CARD_VALUES['ace']]
+    return lowest_legal_strategy(game_state, player_id, ace_plays or plays, rng)
+
+
+def random_strategy(game_state, player_id, plays, rng):
+    """Pick any legal play, or skip now and then"""
+    if rng.random() < 0.1:
+        return None
+    return rng.choice(plays)
+
+
+STRATEGIES = {
+    'lowest-legal': lowest_legal_strategy,
+    'greedy-ace': greedy_ace_strategy,
+    'random': random_strategy,
+}
+
+
+def exchange_step(game_state, save_game_state_func=_no_save):
+    """Make the next card exchange choice: take the culo's best cards, give back the worst
+
+    Returns:
+        The exchange_card_logic() result
+    """
+    exchange_state = game_state['card_exchange']
+    receiving = exchange_state['phase'] == 'receive'
+    if exchange_state['current_exchange'] == 'president':
+        player_id, other_id = exchange_state['president_id'], exchange_state['culo_id']
+        chosen = exchange_state['president_cards_to_receive' if receiving else 'president_cards_to_give']
+    else:
+        player_id, other_id = exchange_state['vice_president_id'], exchange_state['vice_culo_id']
+        chosen = []  # The vice exchange is one card each way
+    # Chosen cards stay in the hands until the exchange completes, so count past them
+    if receiving:
+        card_index = len(game_state['players'][other_id]['hand']) - 1 - len(chosen)
+    else:
+        card_index = len(chosen)
+    return exchange_card_logic(game_state, player_id, card_index, exchange_state['phase'],
+                               exchange_state['current_exchange'], save_game_state_func)
+
+
+def _run_card_exchange(game_state):
+    """President and Vice-President take the best cards and give back their worst ones"""
+    exchange_state = game_state['card_exchange']
+    while exchange_state['active'] and not exchange_state['completed']:
+        if not exchange_step(game_state)['success']:
+            break
+
+
+def new_simulated_game(num_players, deck_size=1, rng_seed=None):
+    """A game state with `num_players` seated bots, see bot_id()"""
+    game_state = init_game_state(rng_seed)
+    game_state['deck_size'] = deck_size
+    game_state.pop('events')  # Simulated games have no history
+    for seat in range(num_players):
+        add_player_logic(game_state, bot_id(seat), f'Bot {seat}', _no_save, util_game_rng(game_state, 0))
+    return game_state
+
+
+def bot_id(seat):
+    return f'bot-{seat}'
+
+
+def play_game(game_state, strategies, rng, max_turns=10000):
+    """Deal a new game on `game_state` and let the bots play it to the end
+
+    The first game on a state is started, later ones are reset, so roles
+    from the previous game trigger the card exchange like they do at a real
+    table.
+
+    Args:
+        game_state: A state from new_simulated_game()
+        strategies: One strategy function per seat, in seat order
+        rng: random.Random the deals and the strategies draw from
+        max_turns: Give up after this many turns
+
+    Returns:
+        A dict with the finishing order of seats ('rankings'), the seats'
+        table positions ('positions'), their roles going into the game
+        ('start_roles') and after it ('roles'), the number of turns, table
+        clears and 2s played, and whether the game ended rather than stalling
+        or hitting max_turns ('finished')
+    """
+    start_roles = [game_state['players'][bot_id(seat)]['role'] for seat in range(len(strategies))]
+    if game_state['started']:
+        reset_game_logic(game_state, _no_save, rng)
+    else:
+        start_game(game_state, _no_save, rng)
+    # Nobody reads the chat here; without it system messages are not even formatted
+    game_state.pop('chat_messages', None)
+    _run_card_exchange(game_state)
+
+    seats = {bot_id(seat): seat for seat in range(len(strategies))}
+    turns = table_clears = jokers_used = 0
+    while not game_state['game_over'] and turns < max_turns:
+        player_data = util_get_player_by_position(game_state, game_state['current_player_index'])
+        if player_data is None or player_data['rank'] is not None or player_data['skipped']:
+            break  # Nobody can move
+        player_id = game_state['seats'][game_state['current_player_index']]
+        table_length, cards_played = len(game_state['table']), game_state['cards_played']
+        jokers_in_hand = player_data['value_counts'][0]
+        plays = legal_plays(game_state, player_data)
+        play = strategies[seats[player_id]](game_state, player_id, plays, rng) if plays else None
+        result = None
+        if play is not None:
+            result = play_card_logic(game_state, player_id, list(play[0]), play[1], _no_save)
+            if result['success']:
+                jokers_used += jokers_in_hand - player_data['value_counts'][0]
+        if result is None or not result['success']:
+            skip_turn_logic(game_state, player_id, _no_save)
+        # Fewer cards on the table than were put there means it was cleared
+        if len(game_state['table']) < table_length + game_state['cards_played'] - cards_played:
+            table_clears += 1
+        turns += 1
+
+    return {
+        'rankings': [seats[player_id] for player_id in game_state['rankings']],
+        'positions': [game_state['players'][bot_id(seat)]['position'] for seat in range(len(strategies))],
+        'start_roles': start_roles,
+        'roles': [game_state['players'][bot_id(seat)]['role'] for seat in range(len(strategies))],
+        'turns': turns,
+        'table_clears': table_clears,
+        'jokers_used': jokers_used,
+        'finished': game_state['game_over'],
+    }
+
+
+def simulate(strategy_names, games=1, deck_size=1, seed=None, max_turns=10000):
+    """Play `games` consecutive games at one table of bots
+
+    Args:
+        strategy_names: One STRATEGIES name per seat
+        games: Number of games to play; roles carry over between them
+        deck_size: Deck size for every game
+        seed: Seed for the deals and the strategies, for reproducible runs
+
+    Returns:
+        The play_game() result of every game
+    """
+    strategies = [STRATEGIES[name] for name in strategy_names]
+    game_state = new_simulated_game(len(strategies), deck_size, seed)
+    rng = util_game_rng(game_state, 0)  # The table's own generator, so simulations in parallel never share one
+    return [play_game(game_state, strategies, rng, max_turns) for _ in range(games)]
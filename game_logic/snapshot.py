@@ -0,0 +1,243 @@
+import io
+import marshal
+import pickle
+import struct
+from array import array
+from operator import itemgetter
+
+from .utils import util_new_rng_seed, util_upgrade_legacy_state
+
+# A snapshot is SNAPSHOT_MAGIC, a <uint16 schema version, uint64 generation>
+# header and a pickled tuple of plain values (see _PAYLOAD_FIELDS), loaded
+# with the restricted unpickler of load_pickled_data(), which refuses to
+# import or call anything. Pickle protocol 5 is documented and stays readable
+# by later Python versions. Encoding runs on the request thread (on every
+# journal snapshot, SQLite commit and event log checkpoint), so the tuple is
+# only laid out where that is cheap and saves space:
+#   - players are rows of field values, without the keys
+#   - player ids are stored once; the keys that refer to players hold their
+#     seat numbers (see PLAYER_ID_KEYS)
+#   - hands and the undealt pile are one byte per card, the table (whose
+#     cards may carry a joker value) two bytes per card
+#   - the chat ring is stored as it is: pickle writes its repeated keys
+#     once, and splitting 50 messages into rows costs more than it saves
+#   - derived state (seats, turn order and counters, value_counts) and the
+#     transient event list and checkpoint flag are left out;
+#     util_restore_game_state() rebuilds them when the room is loaded
+# Schema versions 1 to 4 were marshal-encoded, which is not guaranteed to be
+# readable by another Python version; decode_snapshot() still reads them
+# where it can. Versions 1 to 3 also stored the chat as rows.
+# A new layout, or a new key in init_game_state(), gets a new SCHEMA_VERSION
+# and a MIGRATIONS entry that turns a state decoded with the previous version
+# into one of the current version. Loading does not backfill keys otherwise.
+SNAPSHOT_MAGIC = b'VCSN'
+SCHEMA_VERSION = 5
+_HEADER = struct.Struct('<HQ')
+_PICKLE_PROTOCOL = 5
+
+PLAYER_FIELDS = ('name', 'position', 'skipped', 'rank', 'is_host', 'role', 'inactive_turns', 'bot_strategy')
+_PAYLOAD_FIELDS = ('meta', 'player_ids', 'player_rows', 'hands', 'player_extras', 'chat_messages',
+                   'undealt_pile', 'table')
+# Layout of schema versions 1 to 3
+CHAT_FIELDS = ('sender', 'text', 'timestamp', 'id', 'seq')  # Plus 'type', which only system messages have
+_SEAT_PAYLOAD_FIELDS = ('meta', 'player_ids', 'player_rows', 'hands', 'player_extras', 'chat_rows',
+                        'chat_types', 'chat_slots', 'chat_capacity', 'undealt_pile', 'table')
+# Keys stored in payload fields of their own, or rebuilt on load
+SECTION_KEYS = frozenset(('players', 'chat_messages', 'table', 'undealt_pile'))
+DERIVED_KEYS = frozenset(('seats', 'turn_order', 'active_players_count', 'skipped_players_count'))
+TRANSIENT_KEYS = frozenset(('events', 'checkpoint_due'))
+# Keys (and card exchange keys) that hold seat numbers instead of player ids, or lists of them
+PLAYER_ID_KEYS = ('host_player_id', 'winner')
+PLAYER_ID_LIST_KEYS = ('rankings', 'current_game_players')
+EXCHANGE_PLAYER_ID_KEYS = ('president_id', 'culo_id', 'vice_president_id', 'vice_culo_id')
+
+_UNSTORED_KEYS = SECTION_KEYS | DERIVED_KEYS | TRANSIENT_KEYS
+_KNOWN_PLAYER_FIELDS = frozenset(PLAYER_FIELDS + ('hand', 'value_counts'))
+_player_row = itemgetter(*PLAYER_FIELDS)
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def encode_snapshot(game_state, generation=0):
+    """Encode a game state (and its journal generation) as a binary snapshot
+
+    Returns:
+        The snapshot bytes
+    """
+    players = game_state['players'].values()
+    meta = game_state.copy()
+    for key in _UNSTORED_KEYS:
+        meta.pop(key, None)
+
+    seat_numbers = dict(zip(game_state['players'], range(len(players))))
+    for key in PLAYER_ID_KEYS:
+        if meta.get(key) in seat_numbers:
+            meta[key] = seat_numbers[meta[key]]
+    for key in PLAYER_ID_LIST_KEYS:
+        meta[key] = [seat_numbers.get(player_id, player_id) for player_id in meta[key]]
+    meta['card_exchange'] = card_exchange = dict(meta['card_exchange'])
+    for key in EXCHANGE_PLAYER_ID_KEYS:
+        if card_exchange.get(key) in seat_numbers:
+            card_exchange[key] = seat_numbers[card_exchange[key]]
+
+    player_extras = {}
+    if set(map(len, players)) - {len(_KNOWN_PLAYER_FIELDS)}:
+        for seat, player_data in enumerate(players):
+            extras = {key: value for key, value in player_data.items() if key not in _KNOWN_PLAYER_FIELDS}
+            if extras:
+                player_extras[seat] = extras
+
+    payload = (meta, tuple(game_state['players']), list(map(_player_row, players)),
+               [bytes(player_data['hand']) for player_data in players], player_extras, game_state['chat_messages'],
+               bytes(game_state['undealt_pile']), array('H', game_state['table']).tobytes())
+    return SNAPSHOT_MAGIC + _HEADER.pack(SCHEMA_VERSION, generation) + pickle.dumps(payload, _PICKLE_PROTOCOL)
+
+
+def decode_snapshot(data):
+    """Decode a binary snapshot
+
+    The state is returned as stored: migrate_game_state() brings it up to
+    the current schema, and util_restore_game_state() adds the derived keys.
+
+    Returns:
+        A (schema version, generation, game_state) tuple
+    Raises:
+        SnapshotError: If the data is no snapshot, is corrupt, or is marshal-encoded
+            in a way this Python version cannot read
+    """
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise SnapshotError('Not a game state snapshot')
+    try:
+        schema_version, generation = _HEADER.unpack_from(data, len(SNAPSHOT_MAGIC))
+        if schema_version > SCHEMA_VERSION:
+            raise SnapshotError(f'Snapshot schema version {schema_version} is newer than {SCHEMA_VERSION}')
+        payload_data = data[len(SNAPSHOT_MAGIC) + _HEADER.size:]
+        if schema_version < 5:
+            payload = marshal.loads(payload_data)
+            if schema_version < 4:
+                return schema_version, generation, _decode_seat_payload(payload)
+        else:
+            payload = load_pickled_data(payload_data)
+        game_state, player_ids, player_rows, hands, player_extras, chat_ring, undealt_pile, table_bytes = payload
+    except (struct.error, EOFError, TypeError, ValueError, pickle.UnpicklingError) as e:
+        raise SnapshotError(f'Corrupt snapshot: {e}') from e
+
+    game_state['players'] = _decode_players(player_ids, player_rows, hands, player_extras)
+    game_state['chat_messages'] = chat_ring
+    game_state['undealt_pile'] = list(undealt_pile)
+    game_state['table'] = _decode_table(table_bytes)
+    if schema_version >= 5:
+        _decode_player_ids(game_state, player_ids)
+    return schema_version, generation, game_state
+
+
+def _decode_players(player_ids, player_rows, hands, player_extras):
+    players = {}
+    for player_id, (name, position, skipped, rank, is_host, role, inactive_turns, bot_strategy), hand in zip(
+            player_ids, player_rows, hands):
+        players[player_id] = {
+            'name': name, 'hand': list(hand), 'position': position, 'skipped': skipped, 'rank': rank,
+            'is_host': is_host, 'role': role, 'inactive_turns': inactive_turns, 'bot_strategy': bot_strategy,
+        }
+    for seat, extras in player_extras.items():
+        players[player_ids[seat]].update(extras)
+    return players
+
+
+def _decode_table(table_bytes):
+    table = array('H')
+    table.frombytes(table_bytes)
+    return table.tolist()
+
+
+def _decode_seat_payload(payload):
+    """The state from a payload of schema versions 1 to 3 (see _SEAT_PAYLOAD_FIELDS)"""
+    (game_state, player_ids, player_rows, hands, player_extras, chat_rows, chat_types,
+     chat_slots, chat_capacity, undealt_pile, table_bytes) = payload
+    game_state['players'] = _decode_players(player_ids, player_rows, hands, player_extras)
+
+    messages = [{'sender': sender, 'text': text, 'timestamp': timestamp, 'id': message_id, 'seq': seq}
+                for sender, text, timestamp, message_id, seq in chat_rows]
+    for message, message_type in zip(messages, chat_types):
+        if message_type is not None:
+            message['type'] = message_type
+    chat_ring = [None] * chat_capacity
+    for slot, message in zip(chat_slots, messages):
+        chat_ring[slot] = message
+    game_state['chat_messages'] = chat_ring
+
+    game_state['undealt_pile'] = list(undealt_pile)
+    game_state['table'] = _decode_table(table_bytes)
+    _decode_player_ids(game_state, player_ids)
+    return game_state
+
+
+def _decode_player_ids(game_state, player_ids):
+    """Replace the seat numbers stored for the PLAYER_ID_KEYS with the players' ids"""
+    for key in PLAYER_ID_KEYS:
+        if type(game_state.get(key)) is int:
+            game_state[key] = player_ids[game_state[key]]
+    for key in PLAYER_ID_LIST_KEYS:
+        game_state[key] = [player_ids[seat] if type(seat) is int else seat for seat in game_state[key]]
+    card_exchange = game_state['card_exchange']
+    for key in EXCHANGE_PLAYER_ID_KEYS:
+        if type(card_exchange.get(key)) is int:
+            card_exchange[key] = player_ids[card_exchange[key]]
+
+
+def _migrate_from_pickle(game_state):
+    """Version 0 is a pickled state from before snapshots had a schema
+
+    Those may lack any key added to init_game_state() since, and hold cards
+    as dicts.
+    """
+    return util_upgrade_legacy_state(game_state)
+
+
+def _add_event_seq(game_state):
+    """Version 2 counts the events applied to the state (see game_logic/eventlog.py)"""
+    game_state.setdefault('event_seq', 0)
+    return game_state
+
+
+def _add_rng_seed(game_state):
+    """Version 3 records the seed of the table's random generator"""
+    game_state.setdefault('rng_seed', util_new_rng_seed())
+    return game_state
+
+
+def _same_state(game_state):
+    """Versions 4 and 5 only changed the snapshot encoding, which decode_snapshot() handles"""
+    return game_state
+
+
+# Schema version -> function that upgrades a state decoded with it to the next version
+MIGRATIONS = {
+    0: _migrate_from_pickle,
+    1: _add_event_seq,
+    2: _add_rng_seed,
+    3: _same_state,
+    4: _same_state,
+}
+
+
+def migrate_game_state(game_state, schema_version):
+    """Upgrade a state decoded with an older schema, one version at a time"""
+    while schema_version < SCHEMA_VERSION:
+        game_state = MIGRATIONS[schema_version](game_state)
+        schema_version += 1
+    return game_state
+
+
+class _DataUnpickler(pickle.Unpickler):
+    """Unpickler for plain data: refuses to import anything, so loading cannot run code"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f'Refusing to load {module}.{name} from a game state file')
+
+
+def load_pickled_data(data):
+    """Unpickle plain data (dicts, lists, strings, numbers, bytes), as in game state files and journals"""
+    return _DataUnpickler(io.BytesIO(data)).load()
@@ -0,0 +1,66 @@
+import heapq
+import threading
+import time
+
+
+class TurnTimerScheduler:
+    """Fire turn timeouts for every room from a single background thread
+
+    Deadlines are kept in a heap of (deadline, room_id, turn_start_time). When
+    a deadline passes, `on_expire(room_id, turn_start_time)` is called on the
+    scheduler thread. A room has at most one armed deadline: scheduling the
+    same turn again is a no-op, and scheduling a new turn replaces the old one
+    (the stale heap entry is skipped when it comes up). A turn fires at most
+    once: scheduling it again after it expired is a no-op too, even if its
+    timeout did not change the turn.
+    """
+
+    def __init__(self, on_expire):
+        self.on_expire = on_expire
+        self._heap = []
+        self._armed = {}  # room_id -> turn_start_time of the deadline that will fire
+        self._expired = {}  # room_id -> turn_start_time of the deadline that fired last
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, room_id, turn_start_time, deadline):
+        with self._condition:
+            if turn_start_time in (self._armed.get(room_id), self._expired.get(room_id)):
+                return
+            self._armed[room_id] = turn_start_time
+            heapq.heappush(self._heap, (deadline, room_id, turn_start_time))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='turn-timers', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, room_id):
+        """Disarm the room's deadline and forget which turn expired last"""
+        with self._condition:
+            self._armed.pop(room_id, None)
+            self._expired.pop(room_id, None)
+
+    def _next_expired(self):
+        with self._condition:
+            while True:
+                while self._heap and self._armed.get(self._heap[0][1]) != self._heap[0][2]:
+                    heapq.heappop(self._heap)  # Superseded or cancelled
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                _, room_id, turn_start_time = heapq.heappop(self._heap)
+                del self._armed[room_id]
+                self._expired[room_id] = turn_start_time
+                return room_id, turn_start_time
+
+    def _run(self):
+        while True:
+            room_id, turn_start_time = self._next_expired()
+            try:
+                self.on_expire(room_id, turn_start_time)
+            except Exception as e:
+                print(f"Error expiring turn in room {room_id}: {e}")
@@ -0,0 +1,211 @@
+import json
+import struct
+import sys
+from array import array
+from multiprocessing import Pool
+
+from .simulation import simulate
+
+ROLES = ('neutral', 'president', 'vice-president', 'vice-culo', 'culo')
+UNRANKED = 255
+
+RESULTS_MAGIC = b'VCTR'
+RESULTS_FORMAT_VERSION = 1
+_LENGTH = struct.Struct('<I')
+
+# Column name -> array typecode, per table
+GAME_COLUMNS = (('game_id', 'I'), ('config', 'H'), ('turns', 'I'),
+                ('table_clears', 'I'), ('jokers_used', 'I'), ('finished', 'B'))
+SEAT_COLUMNS = (('game_id', 'I'), ('seat', 'B'), ('position', 'B'),
+                ('start_role', 'B'), ('place', 'B'))
+
+
+def tournament_configs(player_counts, deck_sizes, strategy_names):
+    """Every (players, deck size) combination, with strategies dealt round-robin to the seats"""
+    return [{'players': players, 'deck_size': deck_size,
+             'strategies': [strategy_names[seat % len(strategy_names)] for seat in range(players)]}
+            for players in player_counts for deck_size in deck_sizes]
+
+
+def tournament_shards(configs, games, games_per_shard, seed):
+    """Split `games` games per config into shards of consecutive games at one table
+
+    Every shard gets its own seed and a contiguous block of game ids, so the
+    results do not depend on how many workers run the shards or in what order.
+    """
+    shards = []
+    for config_index, config in enumerate(configs):
+        for first_game in range(0, games, games_per_shard):
+            shard_index = len(shards)
+            shards.append({'config_index': config_index, 'config': config,
+                           'first_game_id': shard_index * games_per_shard,
+                           'games': min(games_per_shard, games - first_game),
+                           'seed': seed * 1000003 + shard_index})
+    return shards
+
+
+def run_shard(shard):
+    """Play one shard in this process and return its results as columns
+
+    Returns:
+        A (game columns, seat columns) tuple of {column name: array}
+    """
+    config = shard['config']
+    results = simulate(config['strategies'], games=shard['games'],
+                       deck_size=config['deck_size'], seed=shard['seed'])
+    game_columns = {name: array(typecode) for name, typecode in GAME_COLUMNS}
+    seat_columns = {name: array(typecode) for name, typecode in SEAT_COLUMNS}
+    for offset, result in enumerate(results):
+        game_id = shard['first_game_id'] + offset
+        game_columns['game_id'].append(game_id)
+        game_columns['config'].append(shard['config_index'])
+        game_columns['turns'].append(result['turns'])
+        game_columns['table_clears'].append(result['table_clears'])
+        game_columns['jokers_used'].append(result['jokers_used'])
+        game_columns['finished'].append(result['finished'])
+
+        places = {seat: place for place, seat in enumerate(result['rankings'])}
+        for seat, position in enumerate(result['positions']):
+            seat_columns['game_id'].append(game_id)
+            seat_columns['seat'].append(seat)
+            seat_columns['position'].append(position)
+            seat_columns['start_role'].append(ROLES.index(result['start_roles'][seat]))
+            seat_columns['place'].append(places.get(seat, UNRANKED))
+    return game_columns, seat_columns
+
+
+class ResultsWriter:
+    """Append column chunks to a tournament results file
+
+    The file is a length-prefixed JSON header followed by chunks. Each chunk
+    is a length-prefixed JSON chunk header (table name, row count and column
+    typecodes) followed by the raw bytes of each column, in header order.
+    Columns are stored in the writer's native byte order, recorded in the file
+    header.
+    """
+
+    def __init__(self, path, metadata):
+        self.file = open(path, 'wb')
+        self.file.write(RESULTS_MAGIC)
+        self._write_json(dict(metadata, version=RESULTS_FORMAT_VERSION, byteorder=sys.byteorder))
+
+    def _write_json(self, value):
+        data = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        self.file.write(_LENGTH.pack(len(data)))
+        self.file.write(data)
+
+    def write_chunk(self, table, columns):
+        rows = len(next(iter(columns.values())))
+        self._write_json({'table': table, 'rows': rows,
+                          'columns': [[name, column.typecode] for name, column in columns.items()]})
+        for column in columns.values():
+            column.tofile(self.file)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_json(file):
+    length = file.read(_LENGTH.size)
+    if len(length) < _LENGTH.size:
+        return None
+    return json.loads(file.read(_LENGTH.unpack(length)[0]))
+
+
+def read_results(path):
+    """Load a tournament results file
+
+    Returns:
+        A (metadata, tables) tuple where tables maps each table name to
+        {column name: array} with the chunks concatenated
+    """
+    tables = {}
+    with open(path, 'rb') as file:
+        if file.read(len(RESULTS_MAGIC)) != RESULTS_MAGIC:
+            raise ValueError(f"{path} is not a tournament results file")
+        metadata = _read_json(file)
+        swap = metadata['byteorder'] != sys.byteorder
+        while True:
+            chunk = _read_json(file)
+            if chunk is None:
+                break
+            columns = tables.setdefault(chunk['table'], {})
+            for name, typecode in chunk['columns']:
+                column = array(typecode)
+                column.fromfile(file, chunk['rows'])
+                if swap:
+                    column.byteswap()
+                columns.setdefault(name, array(typecode)).extend(column)
+    return metadata, tables
+
+
+def new_summary(configs):
+    return [{'games': 0, 'unfinished': 0, 'turns': 0, 'table_clears': 0, 'jokers_used': 0,
+             'by_position': {}, 'by_role': {}} for _ in configs]
+
+
+def update_summary(summary, game_columns, seat_columns):
+    """Add a shard's (or a whole file's) columns to the per-config totals
+
+    Per seat position and per starting role it counts seats, wins (first
+    place) and the sum of finishing places.
+    """
+    config_by_game = {}
+    for game_id, config_index, turns, table_clears, jokers_used, finished in zip(
+            game_columns['game_id'], game_columns['config'], game_columns['turns'],
+            game_columns['table_clears'], game_columns['jokers_used'], game_columns['finished']):
+        totals = summary[config_index]
+        totals['games'] += 1
+        totals['unfinished'] += not finished
+        totals['turns'] += turns
+        totals['table_clears'] += table_clears
+        totals['jokers_used'] += jokers_used
+        config_by_game[game_id] = totals
+
+    for game_id, position, start_role, place in zip(
+            seat_columns['game_id'], seat_columns['position'],
+            seat_columns['start_role'], seat_columns['place']):
+        totals = config_by_game[game_id]
+        for group, key in (('by_position', position), ('by_role', ROLES[start_role])):
+            counts = totals[group].setdefault(key, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += place == 0
+            counts[2] += place
+    return summary
+
+
+def run_tournament(configs, games, path, games_per_shard=50, seed=0, workers=None, progress=None):
+    """Play `games` games per config across a process pool and write them to `path`
+
+    Shards are written as they complete, so memory use does not grow with the
+    number of games and the file holds everything finished so far.
+
+    Args:
+        configs: From tournament_configs()
+        games: Games per config
+        path: Results file to create
+        games_per_shard: Consecutive games one worker plays at one table
+        seed: Base seed; the same seed and shard size give the same results
+        workers: Number of processes, defaults to the number of CPUs
+        progress: Optional callback with (shards done, total shards)
+
+    Returns:
+        The update_summary() totals per config
+    """
+    shards = tournament_shards(configs, games, games_per_shard, seed)
+    summary = new_summary(configs)
+    metadata = {'configs': configs, 'games': games, 'games_per_shard': games_per_shard, 'seed': seed}
+    with ResultsWriter(path, metadata) as writer, Pool(workers) as pool:
+        for done, (game_columns, seat_columns) in enumerate(pool.imap_unordered(run_shard, shards), 1):
+            writer.write_chunk('games', game_columns)
+            writer.write_chunk('seats', seat_columns)
+            update_summary(summary, game_columns, seat_columns)
+            if progress:
+                progress(done, len(shards))
+    return summary
@@ -1,4 +1,9 @@
+import bisect
+import random
+import secrets
+import time
 import uuid
+from collections import Counter
 from datetime import datetime
 
 # Card suits and values
@@ -7,9 +12,30 @@ VALUES = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'jack', 'queen', 'king',
 # Card values for comparison (higher index = higher value)
 CARD_VALUES = {'2': 0, '3': 1, '4': 2, '5': 3, '6': 4, '7': 5, '8': 6, '9': 7, '10': 8,
                'jack': 9, 'queen': 10, 'king': 11, 'ace': 12}
+SUIT_INDEX = {suit: index for index, suit in enumerate(SUITS)}
+
+# Cards are stored as small ints: bits 0-1 hold the suit index, bits 2-5 the
+# numeric value, so comparing two codes orders cards by value and then suit,
+# exactly like util_sort_cards. A 2 played as a joker also carries its joker
+# value + 1 from bit 6 up; such cards only ever live on the table. Cards are
+# converted to dicts only when they are rendered or sent as JSON.
+CARD_CODE_MASK = 0x3F
+JOKER_SHIFT = 6
+# Supported deck sizes, in decks
+DECK_SIZES = (0.25, 0.5, 1, 2, 3)
+# The chat is a ring of CHAT_CAPACITY slots: message number `seq` lives in
+# slot seq % CHAT_CAPACITY and overwrites the message CHAT_CAPACITY before it.
+# `chat_seq` is the number of the newest message; numbers keep growing across
+# clears so clients can ask for everything after the last one they saw.
+CHAT_CAPACITY = 50
+
+
+def init_game_state(rng_seed=None):
+    """A new, empty table
 
-
-def init_game_state():
+    Args:
+        rng_seed: Seed of the table's random generator (see util_game_rng), a new one by default
+    """
     return {
         'players': {},
         'table': [],
@@ -19,7 +45,9 @@ def init_game_state():
         'last_card_played': None,
         'game_name': 'Culo',
         'last_action': None,  # To track if a player skipped or played a card
-        'chat_messages': [],  # Add chat messages list
+        'chat_messages': [None] * CHAT_CAPACITY,  # Ring of chat message slots, see CHAT_CAPACITY
+        'chat_seq': 0,  # Number of the newest chat message
+        'chat_cleared_seq': 0,  # chat_seq when the chat was last cleared
         'game_over': False,   # Flag to indicate if the game is over
         'winner': None,       # Store the winner's player_id
         'last_card_player_position': None,  # Track the position of the player who played the last card
@@ -33,6 +61,7 @@ def init_game_state():
         'last_skipped_position': None,  # Track the position of the last player who skipped
         'table_video_id': 'Y_bYby1O-2I',  # Default YouTube video ID for the table background
         'inactive_turns_threshold': 3,  # Number of consecutive inactive turns before auto-kick
+        'bot_takeover': False,  # A bot plays for players whose turn timer runs out, instead of penalties
         'card_exchange': {
             'active': False,  # Whether card exchange is currently active
             'president_id': None,  # ID of the president player
@@ -50,44 +79,275 @@ def init_game_state():
             'phase': 'receive'  # Current phase: 'receive' or 'give'
         },
         'deal_animation_pending': False,  # Added for deal animation
+        'cards_played': 0,  # Number of cards played so far, used to give played cards an id
+        'undealt_pile': [],  # Deck cards that are in no hand and not on the table, for penalty draws
+        'seats': {},  # Position -> player_id of every seated player
+        'turn_order': [],  # Sorted positions of the players in the current game, walked as a ring
+        'active_players_count': 0,  # Players without a rank
+        'skipped_players_count': 0,  # Players without a rank who skipped this round
+        'events': [],  # Game events not yet handed to the room's on_events hook (see util_log_event)
+        'event_seq': 0,  # Number of events applied to the state (see game_logic/eventlog.py)
+        'rng_seed': util_new_rng_seed() if rng_seed is None else rng_seed,  # Seed of the deals and draws
+        'checkpoint_due': True,  # Whether the next logged event needs a checkpoint of the state
     }
 
 
-def util_create_deck(game_state, deck_size=None):
-    """Create a deck of cards
+def util_new_rng_seed():
+    """A fresh seed for a table's random generator, from the OS; fits a signed 64-bit integer"""
+    return secrets.randbits(63)
+
+
+def util_game_rng(game_state, stream):
+    """The random generator for one stream of the table's random numbers
+
+    Every deal, penalty draw and bot decision draws from a generator made
+    from the table's recorded 'rng_seed' and a stream number, such as the
+    number of the event being applied. The same seed and stream give the same
+    numbers, so a table replays identically, and tables never share a generator.
+
+    Returns:
+        A random.Random
+    """
+    return random.Random((game_state['rng_seed'] << 64) | stream)
+
+
+def util_upgrade_legacy_state(loaded_state):
+    """Bring a state saved before snapshots had a schema up to date
+
+    Keys added to init_game_state() after the state was saved (including
+    sub-keys of nested dicts such as card_exchange) are filled with defaults,
+    and cards stored as dicts are encoded as ints.
 
     Args:
-        game_state: The current game state
-        deck_size: The size of the deck to create (0.25, 0.5, 1, 2, 3)
-                  If None, uses the game_state's deck_size
+        loaded_state: The game state dict read from disk
 
     Returns:
-        A list of cards
+        The upgraded game state
     """
-    if deck_size is None:
-        deck_size = game_state['deck_size']
+    game_state = init_game_state()
+    game_state.update(loaded_state)
+
+    if game_state.get('host_player_id') is None and game_state['players']:
+        game_state['host_player_id'] = list(game_state['players'].keys())[0]
+
+    for key, default_value in init_game_state().items():
+        if key not in game_state:
+            game_state[key] = default_value
+        elif isinstance(default_value, dict):
+            if not isinstance(game_state[key], dict):
+                game_state[key] = {}
+            for sub_key, sub_default_value in default_value.items():
+                if sub_key not in game_state[key]:
+                    game_state[key][sub_key] = sub_default_value
+
+    # Cards used to be stored as dicts
+    for player_data in game_state['players'].values():
+        player_data['hand'] = [util_card_from_dict(card) if isinstance(card, dict) else card
+                               for card in player_data['hand']]
+    game_state['table'] = [util_card_from_dict(card) if isinstance(card, dict) else card
+                           for card in game_state['table']]
+    if 'undealt_pile' not in loaded_state:
+        util_rebuild_undealt_pile(game_state)
+    return game_state
+
+
+def util_restore_game_state(loaded_state, announce=True):
+    """Build a complete game state from a persisted one
+
+    The persisted state has the current schema (older ones are migrated by
+    game_logic/snapshot.py) but may lack the derived keys, which are rebuilt
+    here: value histograms, the chat ring, seats and the turn order. The
+    event list starts out empty.
+
+    Args:
+        loaded_state: The game state dict read from disk
+        announce: Whether to tell the room in the chat that the state was loaded
+
+    Returns:
+        The restored game state
+    """
+    game_state = loaded_state
+    for player_data in game_state['players'].values():
+        util_set_hand(player_data, player_data['hand'])
+    util_rebuild_chat(game_state)
+    util_rebuild_turn_order(game_state)
+    game_state['events'] = []
+    # The announcement is no event, so replays must start from the state after it
+    game_state['checkpoint_due'] = announce
+
+    if announce:
+        util_add_system_message(game_state, "🔄 Game state loaded from saved file.", "info")
+    return game_state
+
+
+def util_make_card(value, suit, joker_value=None):
+    """Encode a card as an int
+
+    Args:
+        value: The card value ('2' ... 'ace')
+        suit: The card suit
+        joker_value: The value a 2 is played as, if any
+
+    Returns:
+        The card code
+    """
+    card = CARD_VALUES[value] << 2 | SUIT_INDEX[suit]
+    if joker_value in CARD_VALUES:
+        card |= (CARD_VALUES[joker_value] + 1) << JOKER_SHIFT
+    return card
+
+
+def util_card_value(card):
+    """The printed value of a card ('2' ... 'ace'), ignoring any joker value"""
+    return VALUES[(card & CARD_CODE_MASK) >> 2]
+
+
+def util_card_suit(card):
+    return SUITS[card & 3]
 
+
+def util_card_joker_value(card):
+    """The value a 2 was played as, or None"""
+    joker_bits = card >> JOKER_SHIFT
+    return VALUES[joker_bits - 1] if joker_bits else None
+
+
+def util_card_effective_value(card):
+    """The value a card counts as on the table: its joker value if it has one"""
+    return util_card_joker_value(card) or util_card_value(card)
+
+
+def util_card_numeric_value(card):
+    """The numeric value a card is compared by, taking its joker value into account"""
+    joker_bits = card >> JOKER_SHIFT
+    return joker_bits - 1 if joker_bits else (card & CARD_CODE_MASK) >> 2
+
+
+def util_card_to_dict(card, card_id=None):
+    """Expand a card code into the dict shape the templates and the client use"""
+    value = util_card_value(card)
+    card_dict = {'suit': util_card_suit(card), 'value': value, 'numeric_value': util_card_numeric_value(card)}
+    joker_value = util_card_joker_value(card)
+    if joker_value:
+        card_dict.update({'original_value': value, 'original_numeric_value': CARD_VALUES[value],
+                          'joker_value': joker_value, 'display_value': joker_value})
+    if card_id is not None:
+        card_dict['id'] = card_id
+    return card_dict
+
+
+def util_cards_to_dicts(cards):
+    return [util_card_to_dict(card) for card in cards]
+
+
+def util_table_to_dicts(game_state):
+    """The table as card dicts, each with the id it got when it was played
+
+    Played cards are numbered by the room's `cards_played` counter. The table
+    only grows by plays until it is cleared, so the last card on it is card
+    number `cards_played`.
+    """
+    first_card_number = game_state['cards_played'] - len(game_state['table']) + 1
+    return [util_card_to_dict(card, str(first_card_number + i)) for i, card in enumerate(game_state['table'])]
+
+
+def util_card_from_dict(card):
+    """Encode a card dict as written by older versions of the game"""
+    return util_make_card(card.get('original_value', card['value']), card['suit'], card.get('joker_value'))
+
+
+def _build_deck(deck_size):
     # Create a standard deck
     standard_deck = []
     for suit in SUITS:
         for value in VALUES:
-            standard_deck.append({'suit': suit, 'value': value, 'numeric_value': CARD_VALUES[value]})
+            standard_deck.append(util_make_card(value, suit))
 
     # Handle fractional decks
     if deck_size == 0.25:
         # 1/4 deck - one suit only
-        return [card for card in standard_deck if card['suit'] == 'hearts']
+        return tuple(card for card in standard_deck if util_card_suit(card) == 'hearts')
     elif deck_size == 0.5:
         # 1/2 deck - two suits only
-        return [card for card in standard_deck if card['suit'] in ['hearts', 'diamonds']]
+        return tuple(card for card in standard_deck if util_card_suit(card) in ['hearts', 'diamonds'])
 
     # Handle multiple decks
-    final_deck = []
-    num_decks = int(deck_size)
-    for _ in range(num_decks):
-        final_deck.extend(standard_deck.copy())
+    return tuple(standard_deck) * int(deck_size)
+
+
+# Built once and shared; 1.0 and 1 hash alike, so float deck sizes find them too
+CANONICAL_DECKS = {deck_size: _build_deck(deck_size) for deck_size in DECK_SIZES}
+
+
+def util_get_canonical_deck(game_state, deck_size=None):
+    """The shared deck for a deck size, as an immutable tuple of card codes
+
+    Args:
+        game_state: The current game state
+        deck_size: The size of the deck (0.25, 0.5, 1, 2, 3)
+                  If None, uses the game_state's deck_size
+    """
+    if deck_size is None:
+        deck_size = game_state['deck_size']
+    deck = CANONICAL_DECKS.get(deck_size)
+    return deck if deck is not None else _build_deck(deck_size)
+
+
+def util_create_deck(game_state, deck_size=None):
+    """Create a deck of cards
+
+    Args:
+        game_state: The current game state
+        deck_size: The size of the deck to create (0.25, 0.5, 1, 2, 3)
+                  If None, uses the game_state's deck_size
+
+    Returns:
+        A new list of card codes that the caller may shuffle or modify
+    """
+    return list(util_get_canonical_deck(game_state, deck_size))
+
+
+def util_rebuild_undealt_pile(game_state):
+    """Recompute the undealt pile as the deck minus every card in a hand or on the table
+
+    Cards are counted, so with several decks one copy of a card in play
+    leaves the other copies in the pile.
+    """
+    cards_in_play = Counter(card & CARD_CODE_MASK for card in game_state['table'])  # Without joker values
+    for player_data in game_state['players'].values():
+        cards_in_play.update(player_data['hand'])
+    undealt_pile = []
+    for card in util_get_canonical_deck(game_state):
+        if cards_in_play[card]:
+            cards_in_play[card] -= 1
+        else:
+            undealt_pile.append(card)
+    game_state['undealt_pile'] = undealt_pile
+
 
-    return final_deck
+def util_clear_table(game_state):
+    """Clear the table, returning its cards to the undealt pile"""
+    game_state['undealt_pile'].extend(card & CARD_CODE_MASK for card in game_state['table'])
+    game_state['table'] = []
+
+
+def util_draw_from_pile(game_state, count, rng):
+    """Draw random cards from the undealt pile
+
+    Each draw swaps a random card to the end of the pile and pops it.
+
+    Returns:
+        The drawn cards, or None if the pile has fewer than `count` cards
+    """
+    undealt_pile = game_state['undealt_pile']
+    if len(undealt_pile) < count:
+        return None
+    drawn_cards = []
+    for _ in range(count):
+        index = rng.randrange(len(undealt_pile))
+        undealt_pile[index], undealt_pile[-1] = undealt_pile[-1], undealt_pile[index]
+        drawn_cards.append(undealt_pile.pop())
+    return drawn_cards
 
 
 def util_add_system_message(game_state, message, message_type="info"):
@@ -98,6 +358,10 @@ def util_add_system_message(game_state, message, message_type="info"):
         message: The message text
         message_type: Type of message (info, success, warning, error)
     """
+    # Handle case where game_state might not be fully initialized yet (or has no chat, like simulated games)
+    if 'chat_messages' not in game_state:
+        return
+
     timestamp = datetime.now().strftime('%H:%M')
 
     chat_message = {
@@ -107,15 +371,76 @@ def util_add_system_message(game_state, message, message_type="info"):
         'id': str(uuid.uuid4()),
         'type': message_type  # Can be used for styling different types of system messages
     }
+    util_append_chat_message(game_state, chat_message)
+
+
+def util_append_chat_message(game_state, chat_message):
+    """Number the message and store it in its ring slot, over the oldest message
+
+    Returns:
+        The message's sequence number
+    """
+    seq = game_state['chat_seq'] + 1
+    chat_message['seq'] = seq
+    ring = game_state['chat_messages']
+    ring[seq % len(ring)] = chat_message
+    game_state['chat_seq'] = seq
+    util_log_event(game_state, 'chat', message=chat_message)
+    return seq
+
+
+def util_log_event(game_state, event_type, **fields):
+    """Note something that happened in the game, for the game history
+
+    The room registry hands the noted events to its on_events hook whenever
+    the state is committed. States without an event list (like simulated
+    games) note nothing.
+
+    Args:
+        game_state: The game state dict
+        event_type: What happened, e.g. 'play' or 'finished'
+        **fields: The details of the event
+    """
+    events = game_state.get('events')
+    if events is not None:
+        fields['type'] = event_type
+        fields['time'] = time.time()
+        events.append(fields)
 
-    # Handle case where game_state might not be fully initialized yet
-    if 'chat_messages' in game_state:
-        game_state['chat_messages'].append(chat_message)
 
-        # Limit the number of stored messages
-        max_messages = 50
-        if len(game_state['chat_messages']) > max_messages:
-            game_state['chat_messages'] = game_state['chat_messages'][-max_messages:]
+def util_get_chat_messages(game_state, after_seq=0):
+    """The chat messages numbered after `after_seq` that are still in the ring, oldest first"""
+    ring = game_state['chat_messages']
+    last_seq = game_state['chat_seq']
+    first_seq = max(after_seq, last_seq - len(ring), game_state.get('chat_cleared_seq', 0)) + 1
+    return [ring[seq % len(ring)] for seq in range(first_seq, last_seq + 1) if ring[seq % len(ring)] is not None]
+
+
+def util_clear_chat(game_state):
+    """Empty the chat; message numbers carry on from where they were"""
+    game_state['chat_messages'] = [None] * CHAT_CAPACITY
+    game_state['chat_cleared_seq'] = game_state['chat_seq']
+
+
+def util_rebuild_chat(game_state):
+    """Lay out a loaded chat as a ring
+
+    The journal loads the chat as a plain list of messages, and chats saved
+    before the ring existed have no sequence numbers; those are numbered in
+    list order after chat_seq.
+    """
+    messages = [message for message in game_state['chat_messages'] if message is not None]
+    if all('seq' in message for message in messages):
+        messages.sort(key=lambda message: message['seq'])
+    else:
+        for message in messages:
+            game_state['chat_seq'] += 1
+            message['seq'] = game_state['chat_seq']
+    game_state['chat_messages'] = [None] * CHAT_CAPACITY
+    for message in messages[-CHAT_CAPACITY:]:
+        game_state['chat_messages'][message['seq'] % CHAT_CAPACITY] = message
+    if messages:
+        game_state['chat_seq'] = max(game_state['chat_seq'], messages[-1]['seq'])
 
 
 def util_sort_cards(cards):
@@ -124,12 +449,79 @@ def util_sort_cards(cards):
     Sorts in the following order:
     1. By value (2, 3, 4, ..., Jack, Queen, King, Ace)
     2. By suit (hearts, diamonds, clubs, spades)
+
+    Card codes already compare in this order.
+    """
+    return sorted(cards)
+
+
+def util_count_values(cards):
+    """Histogram of card values: how many cards of each numeric value there are"""
+    value_counts = [0] * len(VALUES)
+    for card in cards:
+        value_counts[(card & CARD_CODE_MASK) >> 2] += 1
+    return value_counts
+
+
+def util_set_hand(player_data, cards):
+    """Replace a player's hand, keeping it sorted and its value histogram in step
+
+    Hands stay sorted from then on: cards are only removed, or inserted in
+    order by util_add_to_hand, so nothing needs to sort them when they are
+    sent to the client.
+    """
+    player_data['hand'] = util_sort_cards(cards)
+    player_data['value_counts'] = util_count_values(player_data['hand'])
+
+
+def util_add_to_hand(player_data, cards):
+    """Insert cards into a player's hand at their sorted positions"""
+    for card in cards:
+        bisect.insort(player_data['hand'], card)
+        player_data['value_counts'][(card & CARD_CODE_MASK) >> 2] += 1
+
+
+def util_remove_from_hand(player_data, card_indices):
+    """Pop the cards at the given indices from a player's hand, one after the other
+
+    Returns:
+        The removed cards, in the order they were popped
     """
-    # Define suit order (hearts, diamonds, clubs, spades)
-    suit_order = {'hearts': 0, 'diamonds': 1, 'clubs': 2, 'spades': 3}
+    removed_cards = [player_data['hand'].pop(index) for index in card_indices]
+    for card in removed_cards:
+        player_data['value_counts'][(card & CARD_CODE_MASK) >> 2] -= 1
+    return removed_cards
+
 
-    # Sort by numeric value first, then by suit
-    return sorted(cards, key=lambda card: (card['numeric_value'], suit_order[card['suit']]))
+def util_get_playable_cards(game_state, player_data):
+    """Indices of the cards in a player's hand that can start a legal play
+
+    The hand is sorted by value, so the cards of each value form one run
+    whose start is the sum of the counts of all lower values. A card is
+    playable if, together with the player's 2s, there are enough cards of its
+    value to play `required_cards_to_play` of them on the top card. 2s can
+    always be played on their own, or as jokers with any such value.
+    """
+    hand = player_data['hand']
+    if not game_state['table']:
+        return list(range(len(hand)))
+
+    value_counts = player_data['value_counts']
+    top_value = util_card_numeric_value(game_state['table'][-1])
+    required = game_state['required_cards_to_play']
+    jokers = value_counts[0]
+    playable = []
+    run_start = jokers  # The 2s come first
+    jokers_playable = jokers >= required
+    for value in range(1, len(VALUES)):
+        count = value_counts[value]
+        if count and value >= top_value and count + jokers >= required:
+            playable.extend(range(run_start, run_start + count))
+            jokers_playable = jokers_playable or jokers > 0
+        run_start += count
+    if jokers_playable:
+        playable[:0] = range(jokers)
+    return playable
 
 
 def util_get_players_data(game_state):
@@ -145,7 +537,8 @@ def util_get_players_data(game_state):
             'skipped': data['skipped'],
             'rank': data.get('rank'),  # Include player rank
             'is_host': pid == game_state['host_player_id'],  # Include host status
-            'role': data.get('role', 'neutral')  # Include player role
+            'role': data.get('role', 'neutral'),  # Include player role
+            'is_bot': data.get('bot_strategy') is not None  # A bot plays this seat
         })
 
     # Sort players by position
@@ -153,11 +546,87 @@ def util_get_players_data(game_state):
     return players_data
 
 
+def util_get_turn_time_left(game_state, turn_timer_duration):
+    """Seconds left in the current turn, or None when no turn timer is running
+
+    The timer is stopped before the game starts, after it is over and while the
+    card exchange is in progress.
+    """
+    if game_state.get('turn_start_time') is None or game_state.get('game_over', False):
+        return None
+    if game_state['card_exchange'].get('active', False) and not game_state['card_exchange'].get('completed', False):
+        return None
+    elapsed_time = time.time() - game_state['turn_start_time']
+    return max(0, turn_timer_duration - elapsed_time)
+
+
 def util_get_player_by_position(game_state, position):
     """Get player data by position"""
-    for player_id, player_data in game_state['players'].items():
-        if player_data['position'] == position:
-            return player_data
+    return game_state['players'].get(game_state['seats'].get(position))
+
+
+def util_rebuild_turn_order(game_state):
+    """Rebuild the seat index, the turn ring and the turn counters from the players
+
+    Called when players join or leave and when a game starts. In between,
+    util_set_skipped, util_clear_skips and util_set_rank keep the counters up
+    to date.
+    """
+    players = game_state['players']
+    game_state['seats'] = {player_data['position']: player_id for player_id, player_data in players.items()}
+    game_state['turn_order'] = sorted(players[player_id]['position']
+                                      for player_id in game_state['current_game_players'] if player_id in players)
+    game_state['active_players_count'] = sum(1 for p in players.values() if p['rank'] is None)
+    game_state['skipped_players_count'] = sum(1 for p in players.values() if p['rank'] is None and p['skipped'])
+
+
+def util_set_skipped(game_state, player_data, skipped):
+    """Set a player's skipped flag, keeping skipped_players_count in step"""
+    if player_data['skipped'] != skipped:
+        player_data['skipped'] = skipped
+        if player_data['rank'] is None:
+            game_state['skipped_players_count'] += 1 if skipped else -1
+
+
+def util_clear_skips(game_state):
+    """Clear every player's skipped flag for a new round"""
+    for player_data in game_state['players'].values():
+        player_data['skipped'] = False
+    game_state['skipped_players_count'] = 0
+
+
+def util_set_rank(game_state, player_data, rank):
+    """Set a player's rank, keeping the active and skipped counts in step"""
+    was_active = player_data['rank'] is None
+    player_data['rank'] = rank
+    if was_active != (rank is None):
+        change = -1 if was_active else 1
+        game_state['active_players_count'] += change
+        if player_data['skipped']:
+            game_state['skipped_players_count'] += change
+
+
+def util_all_active_players_skipped(game_state):
+    """Whether there are players without a rank and all of them skipped"""
+    return 0 < game_state['active_players_count'] == game_state['skipped_players_count']
+
+
+def util_next_in_turn_order(game_state, position):
+    """The next position after `position` in the turn ring whose player can play
+
+    Walks the ring once, wrapping around to `position` itself, and passes over
+    players who skipped or finished.
+
+    Returns:
+        The position, or None if no player in the ring can play
+    """
+    turn_order = game_state['turn_order']
+    start = bisect.bisect_right(turn_order, position)
+    for step in range(len(turn_order)):
+        next_position = turn_order[(start + step) % len(turn_order)]
+        player_data = util_get_player_by_position(game_state, next_position)
+        if player_data and not player_data['skipped'] and player_data['rank'] is None:
+            return next_position
     return None
 
 
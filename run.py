@@ -1,84 +1,173 @@
+import functools
 import html  # Import html module for escaping
 import json
 import os
-import pickle
-import random
 import re
 import time
 import uuid
 from datetime import datetime
 
-from flask import (Flask, jsonify, redirect, render_template, request, session,
-                   url_for)
-
-from game_logic.actions import (advance_to_next_player, exchange_card_logic,
-                                play_card_logic)
-from game_logic.actions import redistribute_cards as action_redistribute_cards
-from game_logic.actions import reset_game_logic, skip_turn_logic
-from game_logic.actions import start_game as action_start_game
-from game_logic.utils import (init_game_state, util_add_system_message,
-                              util_assign_automatic_roles, util_create_deck,
+from flask import (Flask, Response, g, jsonify, redirect, render_template,
+                   request, session, stream_with_context, url_for)
+from werkzeug.local import LocalProxy
+
+from game_logic.backends import SQLiteStateBackend
+from game_logic.bots import bot_to_move, new_bot_id
+from game_logic.eventlog import apply_event, make_event
+from game_logic.history import HistoryStore
+from game_logic.rooms import DEFAULT_ROOM_ID, RoomRegistry, is_valid_room_id
+from game_logic.timers import TurnTimerScheduler
+from game_logic.utils import (util_add_system_message,
+                              util_assign_automatic_roles, util_card_to_dict,
+                              util_cards_to_dicts, util_create_deck,
+                              util_get_chat_messages, util_get_playable_cards,
                               util_get_player_by_position,
-                              util_get_players_data, util_sort_cards)
+                              util_get_players_data, util_get_turn_time_left,
+                              util_sort_cards,
+                              util_table_to_dicts)
 
 app = Flask(__name__, static_folder='app/static', template_folder='app/templates')
 app.secret_key = os.urandom(24)
 
-GAME_STATE_FILE = 'game_state.pickle'
+ROOMS_DIRECTORY = 'rooms'  # One sub-directory with snapshot and journal per room
+ROOM_IDLE_TIMEOUT = 900  # Seconds without requests before a room is evicted to disk
+SNAPSHOT_INTERVAL = 200  # Journal records between full snapshots
+STATE_FLUSH_INTERVAL = 0.2  # Seconds the background writer batches journal records
+STATE_FSYNC_POLICY = 'interval'  # When journal writes are fsynced: 'always', 'interval' or 'never'
+STATE_FSYNC_INTERVAL = 1.0  # Seconds of journal writes a machine crash may lose with the 'interval' policy
+# SQLite database shared by all worker processes on the host; without it every room
+# has its own journal files, which only a single server process may use
+STATE_DATABASE = os.environ.get('STATE_DATABASE')
+# SQLite database with the history of every game (seats, dealt hands, plays, chat); none is kept
+# unless it is set. Rooms whose state is lost are restored from it, if there is one.
+HISTORY_DATABASE = os.environ.get('HISTORY_DATABASE')
 TURN_TIMER_DURATION = 15
-game_state = init_game_state()
+BOT_MOVE_DELAY = 0.6  # Seconds a bot waits before it moves, so people can follow its plays
+# Response sections of /get_game_state left out of deltas, with the state keys they depend on
+DELTA_SECTIONS = {
+    'table': ('table',),
+    'players': ('players', 'current_player_index', 'host_player_id'),
+    'rankings': ('rankings', 'players'),
+}
+EVENT_STREAM_KEEPALIVE = 15  # Seconds between keep-alive comments on idle event streams
+
+
+def schedule_turn_timeout(room):
+    """Arm the turn timer, or a bot's move, for the room's current turn; called whenever the room changes
+
+    Bot moves are keyed by the room's state tag instead of the turn start
+    time, so a bot moves once for every state in which it has to act.
+    """
+    room_state = room.game_state
+    if bot_to_move(room_state) is not None:
+        turn_timers.schedule(room.room_id, room.state_tag, time.time() + BOT_MOVE_DELAY)
+    elif util_get_turn_time_left(room_state, TURN_TIMER_DURATION) is None:
+        turn_timers.cancel(room.room_id)
+    else:
+        turn_start_time = room_state['turn_start_time']
+        turn_timers.schedule(room.room_id, turn_start_time, turn_start_time + TURN_TIMER_DURATION)
+
+
+def expire_turn(room_id, turn_key):
+    """Run the timeout for a turn whose timer ran out, or a bot's move, on the turn timer thread
+
+    Args:
+        turn_key: The turn start time of the timeout, or the state tag of the bot's move
+    """
+    room = rooms.get_loaded(room_id)
+    if room is None:
+        turn_timers.cancel(room_id)  # Evicted; the turn is armed again when the room is loaded
+        return
+    def expire():
+        if turn_key == room.state_tag:
+            event_type = 'bot_move'
+        elif game_state.get('turn_start_time') != turn_key:
+            return  # The turn ended in the meantime
+        elif util_get_turn_time_left(game_state, TURN_TIMER_DURATION) != 0:
+            return  # Not timed out (any more)
+        elif game_state.get('bot_takeover', False):
+            event_type = 'takeover'
+        else:
+            event_type = 'timeout'
+        if apply_room_event(event_type)['success']:
+            room.mark_dirty()  # Not every exchange step saves, like in mutates_room
+
+    with app.app_context():
+        g.room = room
+        rooms.mutate(room, expire)
+
+
+def record_history(room, events):
+    if history:
+        history.record(room.room_id, events)
+
+
+turn_timers = TurnTimerScheduler(on_expire=expire_turn)
+history = HistoryStore(HISTORY_DATABASE) if HISTORY_DATABASE else None
+rooms = RoomRegistry(ROOMS_DIRECTORY, idle_timeout=ROOM_IDLE_TIMEOUT, snapshot_interval=SNAPSHOT_INTERVAL,
+                     flush_interval=STATE_FLUSH_INTERVAL, on_change=schedule_turn_timeout,
+                     fsync_policy=STATE_FSYNC_POLICY, fsync_interval=STATE_FSYNC_INTERVAL,
+                     backend=SQLiteStateBackend(STATE_DATABASE) if STATE_DATABASE else None,
+                     on_events=record_history, restore=history.load_live_state if history else None)
+
+
+def current_room():
+    """The room of the current request, taken from the session (or the default room)
+
+    Tables are only created by joining them (see join_game); until then
+    requests get a placeholder room with a new state that is never persisted.
+    """
+    if 'room' not in g:
+        room_id = session.get('room_id', DEFAULT_ROOM_ID)
+        if not is_valid_room_id(room_id):
+            room_id = DEFAULT_ROOM_ID
+        g.room = rooms.get(room_id, create=False) or rooms.placeholder(room_id)
+    return g.room
+
+
+# The state of the room serving the current request
+game_state = LocalProxy(lambda: current_room().game_state)
 
 
 def save_game_state():
-    try:
-        with open(GAME_STATE_FILE, 'wb') as f:
-            pickle.dump(game_state, f)
-        return True
-    except Exception as e:
-        print(f"Error saving game state: {e}")
-        return False
+    # Only marks the room dirty; the room is persisted once when the mutating view returns
+    return current_room().mark_dirty()
 
 
-def load_game_state():
-    global game_state
-    try:
-        if os.path.exists(GAME_STATE_FILE):
-            with open(GAME_STATE_FILE, 'rb') as f:
-                loaded_state = pickle.load(f)
-                current_host = game_state.get('host_player_id')
-
-                game_state.clear()
-                game_state.update(init_game_state())
-                game_state.update(loaded_state)
-
-                if 'host_player_id' not in game_state or game_state['host_player_id'] is None:
-                    if current_host:
-                        game_state['host_player_id'] = current_host
-                    elif game_state['players'] and game_state['players'].keys():
-                        game_state['host_player_id'] = list(game_state['players'].keys())[0]
-
-                default_state_for_keys = init_game_state()
-                for key, default_value in default_state_for_keys.items():
-                    if key not in game_state:
-                        game_state[key] = default_value
-                    elif isinstance(default_value, dict):
-                        if not isinstance(game_state[key], dict):
-                            game_state[key] = {}
-                        for sub_key, sub_default_value in default_value.items():
-                            if sub_key not in game_state[key]:
-                                game_state[key][sub_key] = sub_default_value
-
-                # Initialize table_video_id if not present
-                if 'table_video_id' not in game_state:
-                    game_state['table_video_id'] = 'Y_bYby1O-2I'  # Default video ID
-
-                util_add_system_message(game_state, "🔄 Game state loaded from saved file.", "info")
-                return True
-    except Exception as e:
-        print(f"Error loading game state: {e} - Reinitializing game state.")
-        game_state.clear()
-        game_state.update(init_game_state())
-    return False
+def apply_room_event(event_type, **fields):
+    """Apply a new event to the state of the request's room, see game_logic/eventlog.py
+
+    Returns:
+        The result of the event's action
+    """
+    return apply_event(current_room().game_state, make_event(event_type, **fields), save_game_state)
+
+
+def reads_room(view):
+    """Run the view under the room's read lock"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with rooms.reading(current_room()):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def mutates_room(view):
+    """Run the view under the room's write lock and persist the room afterwards
+
+    If another process committed to the room first, the view runs again on the newer state.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        room = current_room()
+
+        def change():
+            response = view(*args, **kwargs)
+            # Also catches views that changed the state without saving, so no reader sees stale cached views
+            room.mark_dirty()
+            return response
+        return rooms.mutate(room, change)
+    return wrapper
 
 
 def create_deck(deck_size=None):
@@ -105,15 +194,34 @@ def assign_automatic_roles():
     return util_assign_automatic_roles(game_state, save_game_state_func=save_game_state)
 
 
-load_game_state()
-
-
 @app.route('/')
+@reads_room
 def index():
     player_id = session.get('player_id')
     if player_id and player_id in game_state['players']:
         return redirect(url_for('game'))
-    return render_template('join.html')
+    return render_template('join.html', room_id=current_room().room_id)
+
+
+@app.route('/room/<room_id>')
+def enter_room(room_id):
+    if not is_valid_room_id(room_id):
+        return redirect(url_for('index'))
+    if session.get('room_id', DEFAULT_ROOM_ID) != room_id:
+        session['room_id'] = room_id
+        session.pop('player_id', None)
+    return redirect(url_for('index'))
+
+
+@mutates_room
+def seat_new_player(player_name):
+    player_id = str(uuid.uuid4())
+    # Sanitize player name to prevent XSS
+    result = apply_room_event('join', player_id=player_id, name=html.escape(player_name))
+    if not result['success']:
+        return render_template('join.html', error=result['error'], room_id=current_room().room_id)
+    session['player_id'] = player_id
+    return redirect(url_for('game'))
 
 
 @app.route('/join', methods=['GET', 'POST'])
@@ -121,53 +229,25 @@ def join_game():
     error = None
     if request.method == 'POST':
         player_name = request.form.get('player_name', '').strip()
-        if not player_name:
+        room_id = request.form.get('room_id', '').strip() or DEFAULT_ROOM_ID
+        if not is_valid_room_id(room_id):
+            error = "Table name can only contain letters, numbers, underscores, and hyphens (max 32)."
+        elif not player_name:
             error = "Please enter a name."
         elif len(player_name) > 20:
             error = "Name must be 20 characters or less."
         elif not re.match(r'^[a-zA-Z0-9 _-]+$', player_name):
             error = "Name can only contain letters, numbers, spaces, underscores, and hyphens."
         else:
-            if len(game_state['players']) >= 12:
-                error = "Game is full. Please wait for a spot to open."
-                return render_template('join.html', error=error)
-
-            player_id = str(uuid.uuid4())
-            session['player_id'] = player_id
-
-            existing_positions = [p_data['position'] for p_data in game_state['players'].values()]
-            position_order = [0, 2, 3, 1, 4, 6, 7, 5, 8, 9, 10, 11]
-            player_position = next((pos for pos in position_order if pos not in existing_positions),
-                                   len(game_state['players']))
+            session['room_id'] = room_id
+            g.room = rooms.get(room_id)
+            return seat_new_player(player_name)
 
-            is_host = not game_state['players'] or game_state['host_player_id'] is None
-            if is_host:
-                game_state['host_player_id'] = player_id
-
-            # Sanitize player name to prevent XSS
-            sanitized_name = html.escape(player_name)
-
-            game_state['players'][player_id] = {
-                'name': sanitized_name, 'hand': [], 'position': player_position,
-                'skipped': False, 'rank': None, 'is_host': is_host, 'role': 'neutral',
-                'inactive_turns': 0  # Initialize inactive turns counter
-            }
-
-            system_message_text = f"👑 {sanitized_name} has joined as the host!" if is_host else f"👋 {sanitized_name} has joined the game!"
-            add_system_message(system_message_text, "info")
-
-            if game_state['started']:
-                action_redistribute_cards(game_state, save_game_state)
-            # Remove automatic game start when 2+ players join
-            # Instead, we'll wait for the host to explicitly start the game
-
-            save_game_state()
-            return redirect(url_for('game'))
-
-    return render_template('join.html', error=error)
+    return render_template('join.html', error=error, room_id=current_room().room_id)
 
 
 @app.route('/game')
+@reads_room
 def game():
     player_id = session.get('player_id')
     if not player_id:
@@ -185,28 +265,24 @@ def game():
     playable_cards_indices = []
     if is_my_turn and not player_data['skipped'] and player_data['rank'] is None:
         if not game_state['card_exchange'].get('active', False) or game_state['card_exchange'].get('completed', False):
-            if not top_card:
-                can_play = len(player_data['hand']) > 0
-                playable_cards_indices = list(range(len(player_data['hand'])))
-            else:
-                for i, card_in_hand in enumerate(player_data['hand']):
-                    if card_in_hand['value'] == '2' or card_in_hand['numeric_value'] >= top_card['numeric_value']:
-                        can_play = True
-                        playable_cards_indices.append(i)
+            playable_cards_indices = util_get_playable_cards(game_state, player_data)
+            can_play = len(playable_cards_indices) > 0
 
     return render_template(
         'game.html',
-        player_hand=sort_cards(player_data['hand']),
-        table=game_state['table'], player_name=player_data['name'], players=all_players_data,
+        player_hand=util_cards_to_dicts(player_data['hand']),
+        table=util_table_to_dicts(game_state), player_name=player_data['name'], players=all_players_data,
         is_my_turn=is_my_turn, current_player_index=game_state['current_player_index'],
-        can_play=can_play, playable_cards=playable_cards_indices, top_card=top_card,
+        can_play=can_play, playable_cards=playable_cards_indices,
+        top_card=None if top_card is None else util_card_to_dict(top_card),
         game_name=game_state['game_name'], last_action=game_state['last_action'],
-        chat_messages=game_state['chat_messages'], required_cards_to_play=game_state['required_cards_to_play'],
+        chat_messages=util_get_chat_messages(game_state), required_cards_to_play=game_state['required_cards_to_play'],
         table_video_id=game_state.get('table_video_id', 'Y_bYby1O-2I')
     )
 
 
 @app.route('/play_card', methods=['POST'])
+@mutates_room
 def play_card_route():
     player_id = session.get('player_id')
     if not player_id or player_id not in game_state['players']:
@@ -214,29 +290,38 @@ def play_card_route():
     data = request.get_json()
     card_indices = [data.get('card_index')] if 'card_index' in data else data.get('card_indices', [])
     joker_value = data.get('joker_value')
-    result = play_card_logic(game_state, player_id, card_indices, joker_value, save_game_state)
+
+    # Validate the fields before they are logged: a replay must be able to apply the event again
+    if not isinstance(card_indices, list) or not all(type(index) is int for index in card_indices):
+        return jsonify({'success': False, 'error': 'Invalid card indices format.'})
+    if joker_value is not None and not isinstance(joker_value, str):
+        return jsonify({'success': False, 'error': 'Invalid joker value format.'})
+    result = apply_room_event('play', player_id=player_id, card_indices=card_indices, joker_value=joker_value)
     return jsonify(result)
 
 
 @app.route('/skip_turn', methods=['POST'])
+@mutates_room
 def skip_turn_route():
     player_id = session.get('player_id')
     if not player_id or player_id not in game_state['players']:
         return jsonify({'success': False, 'error': 'Player not found or not in session'})
-    result = skip_turn_logic(game_state, player_id, save_game_state)
+    result = apply_room_event('skip', player_id=player_id)
     return jsonify(result)
 
 
 @app.route('/reset_game', methods=['POST'])
+@mutates_room
 def reset_game_route():
     player_id = session.get('player_id')
     if player_id != game_state.get('host_player_id'):
         return jsonify({'success': False, 'error': 'Only the host can reset the game'})
-    result = reset_game_logic(game_state, save_game_state)
+    result = apply_room_event('reset')
     return jsonify(result)
 
 
 @app.route('/start_game', methods=['POST'])
+@mutates_room
 def start_game_route():
     player_id = session.get('player_id')
     if player_id != game_state.get('host_player_id'):
@@ -248,130 +333,27 @@ def start_game_route():
     if game_state['started']:
         return jsonify({'success': False, 'error': 'Game has already started'})
 
-    game_state['waiting_for_start'] = False
-    action_start_game(game_state, save_game_state)
-    host_name = game_state['players'][game_state['host_player_id']]['name']
-    add_system_message(f"🎮 {host_name} (host) has started the game!", "success")
-    save_game_state()
-    return jsonify({'success': True, 'refresh': True})
+    return jsonify(apply_room_event('deal'))
 
 
-@app.route('/get_game_state')
-def get_game_state_route():
-    player_id = session.get('player_id')
-    if not player_id or player_id not in game_state['players']:
-        return jsonify({'success': False, 'error': 'Player not found or invalid session.'})
+def turn_timer_info():
+    """Timer data for the current turn, or None when no turn timer is running"""
+    time_left = util_get_turn_time_left(game_state, TURN_TIMER_DURATION)
+    if time_left is None:
+        return None
+    return {
+        'duration': TURN_TIMER_DURATION,
+        'time_left': time_left,
+        'percentage': (time_left / TURN_TIMER_DURATION) * 100 if TURN_TIMER_DURATION > 0 else 0
+    }
 
-    player_data_initial = game_state['players'][player_id]
-    is_host = player_id == game_state.get('host_player_id')
-    turn_timer_info = None
-
-    if game_state.get('turn_start_time') is not None and \
-       not game_state.get('game_over', False) and \
-       (not game_state['card_exchange'].get('active', False) or game_state['card_exchange'].get('completed', False)):
-        elapsed_time = time.time() - game_state['turn_start_time']
-        time_left = max(0, TURN_TIMER_DURATION - elapsed_time)
-        turn_timer_info = {
-            'duration': TURN_TIMER_DURATION,
-            'time_left': time_left,
-            'percentage': (time_left / TURN_TIMER_DURATION) * 100 if TURN_TIMER_DURATION > 0 else 0
-        }
-
-        current_player_data_for_skip_check = get_player_by_position(game_state['current_player_index'])
-        if current_player_data_for_skip_check and time_left <= 0:
-            cp_id_for_skip = None
-            for pid_loop, pd_loop in game_state['players'].items():
-                if pd_loop['position'] == game_state['current_player_index']:
-                    cp_id_for_skip = pid_loop
-                    break
-
-            if cp_id_for_skip and not game_state['players'][cp_id_for_skip]['skipped'] and game_state['players'][cp_id_for_skip]['rank'] is None:
-                timed_out_player = game_state['players'][cp_id_for_skip]
-                game_state['last_skipped_position'] = game_state['current_player_index']
-
-                # Increment inactive turns counter
-                timed_out_player['inactive_turns'] += 1
-
-                # Check if player should be auto-kicked
-                if timed_out_player['inactive_turns'] >= game_state.get('inactive_turns_threshold', 3):
-                    # Get the player name before removing them
-                    kicked_player_name = timed_out_player['name']
-
-                    # Remove the player from the game
-                    del game_state['players'][cp_id_for_skip]
-
-                    # If the player was in rankings, remove them
-                    if cp_id_for_skip in game_state.get('rankings', []):
-                        game_state['rankings'].remove(cp_id_for_skip)
-
-                    # Add system message
-                    util_add_system_message(
-                        game_state,
-                        f"👢 {kicked_player_name} was automatically kicked after {game_state.get('inactive_turns_threshold', 3)} inactive turns!",
-                        "warning"
-                    )
-                    game_state['last_action'] = f"{kicked_player_name} was auto-kicked for inactivity"
-
-                    # If the game is in progress, redistribute cards
-                    if game_state['started'] and len(game_state['players']) >= 2:
-                        action_redistribute_cards(game_state, save_game_state)
-                else:
-                    # Attempt to add 3 cards to the player's hand
-                    full_deck = util_create_deck(game_state)
-                    cards_in_play = set()
-                    for p_data in game_state['players'].values():
-                        for card in p_data['hand']:
-                            cards_in_play.add((card['value'], card['suit']))
-                    for card in game_state['table']:
-                        cards_in_play.add((card['value'], card['suit']))
-
-                    available_cards = [
-                        card for card in full_deck if (card['value'], card['suit']) not in cards_in_play
-                    ]
-
-                    if len(available_cards) >= 3:
-                        cards_to_add = random.sample(available_cards, 3)
-                        timed_out_player['hand'].extend(cards_to_add)
-                        timed_out_player['hand'] = util_sort_cards(timed_out_player['hand'])
-                        util_add_system_message(
-                            game_state,
-                            f"⏳ {timed_out_player['name']} timed out and received 3 extra cards! ({timed_out_player['inactive_turns']}/{game_state.get('inactive_turns_threshold', 3)} inactive turns)",
-                            "warning"
-                        )
-                        game_state['last_action'] = f"{timed_out_player['name']} timed out and received 3 cards"
-                    else:
-                        util_add_system_message(
-                            game_state,
-                            f"⏳ {timed_out_player['name']} timed out! ({timed_out_player['inactive_turns']}/{game_state.get('inactive_turns_threshold', 3)} inactive turns) (Not enough cards in deck to penalize).",
-                            "warning"
-                        )
-                        game_state['last_action'] = f"{timed_out_player['name']} timed out"
-
-                advance_to_next_player(game_state, save_game_state)
-                save_game_state()
-                player_data_initial = game_state['players'][player_id] if player_id in game_state['players'] else None
-                if player_data_initial is None:
-                    # The current player was auto-kicked
-                    return jsonify({'success': False, 'error': 'You were kicked for inactivity', 'redirect': url_for('index')})
 
-    player_data = game_state['players'][player_id]
-    is_my_turn = game_state['current_player_index'] == player_data['position']
-    all_players_data = get_players_data()
-    can_play = False
-    playable_cards_indices = []
-    top_card = game_state['table'][-1] if game_state['table'] else None
+def encode_fields(fields):
+    """JSON-encode a dict's items without the braces, to be spliced into a response object"""
+    return json.dumps(fields, separators=(',', ':'))[1:-1]
 
-    if not game_state['card_exchange'].get('active', False) or game_state['card_exchange'].get('completed', False):
-        if is_my_turn and not player_data['skipped'] and player_data['rank'] is None:
-            if not top_card:
-                can_play = len(player_data['hand']) > 0
-                playable_cards_indices = list(range(len(player_data['hand'])))
-            else:
-                for i, card_in_hand in enumerate(player_data['hand']):
-                    if card_in_hand['value'] == '2' or card_in_hand['numeric_value'] >= top_card['numeric_value']:
-                        can_play = True
-                        playable_cards_indices.append(i)
 
+def get_rankings_display_info():
     rankings_display_info = []
     for rank_idx, p_id_ranked in enumerate(game_state.get('rankings', [])):
         if p_id_ranked in game_state['players']:
@@ -382,66 +364,257 @@ def get_game_state_route():
                 'player_id': p_id_ranked, 'player_name': ranked_player_data['name'],
                 'rank': actual_rank_name, 'position': rank_idx + 1
             })
-
-    card_exchange_display_info = None
-    if game_state['card_exchange'].get('active', False):
-        exchange_hands_info = {}
-        ce_data = game_state['card_exchange']
-        is_president_for_exchange = player_id == ce_data.get('president_id')
-        is_vice_president_for_exchange = player_id == ce_data.get('vice_president_id')
-        if ce_data['current_exchange'] == 'president' and is_president_for_exchange and ce_data['phase'] == 'receive':
-            culo_player_id = ce_data.get('culo_id')
-            if culo_player_id and culo_player_id in game_state['players']:
-                exchange_hands_info['culo_hand'] = sort_cards(game_state['players'][culo_player_id]['hand'])
-        elif ce_data['current_exchange'] == 'vice' and is_vice_president_for_exchange and ce_data['phase'] == 'receive':
-            vice_culo_player_id = ce_data.get('vice_culo_id')
-            if vice_culo_player_id and vice_culo_player_id in game_state['players']:
-                exchange_hands_info['vice_culo_hand'] = sort_cards(game_state['players'][vice_culo_player_id]['hand'])
-        card_exchange_display_info = {**ce_data, **exchange_hands_info,
-                                      'is_president': is_president_for_exchange,
-                                      'is_culo': player_id == ce_data.get('culo_id'),
-                                      'is_vice_president': is_vice_president_for_exchange,
-                                      'is_vice_culo': player_id == ce_data.get('vice_culo_id')}
-
-    # Prepare the response data
-    response_data = {
-        'success': True,
-        'player_hand': sort_cards(player_data['hand']),
-        'table': game_state['table'],
-        'players': all_players_data,
-        'is_my_turn': is_my_turn,
+    return rankings_display_info
+
+
+def get_card_exchange_view(player_id):
+    """The card exchange as one player sees it, or None when no exchange is active"""
+    if not game_state['card_exchange'].get('active', False):
+        return None
+    exchange_hands_info = {}
+    ce_data = game_state['card_exchange']
+    is_president_for_exchange = player_id == ce_data.get('president_id')
+    is_vice_president_for_exchange = player_id == ce_data.get('vice_president_id')
+    if ce_data['current_exchange'] == 'president' and is_president_for_exchange and ce_data['phase'] == 'receive':
+        culo_player_id = ce_data.get('culo_id')
+        if culo_player_id and culo_player_id in game_state['players']:
+            exchange_hands_info['culo_hand'] = util_cards_to_dicts(game_state['players'][culo_player_id]['hand'])
+    elif ce_data['current_exchange'] == 'vice' and is_vice_president_for_exchange and ce_data['phase'] == 'receive':
+        vice_culo_player_id = ce_data.get('vice_culo_id')
+        if vice_culo_player_id and vice_culo_player_id in game_state['players']:
+            exchange_hands_info['vice_culo_hand'] = util_cards_to_dicts(game_state['players'][vice_culo_player_id]['hand'])
+    return {**ce_data, **exchange_hands_info,
+            'is_president': is_president_for_exchange,
+            'is_culo': player_id == ce_data.get('culo_id'),
+            'is_vice_president': is_vice_president_for_exchange,
+            'is_vice_culo': player_id == ce_data.get('vice_culo_id')}
+
+
+def encode_public_view():
+    """Fields every player gets, encoded once per state version"""
+    top_card = game_state['table'][-1] if game_state['table'] else None
+    return encode_fields({
+        'version': current_room().state_tag,
         'current_player_index': game_state['current_player_index'],
-        'can_play': can_play,
-        'playable_cards': playable_cards_indices,
-        'top_card': top_card,
+        'top_card': None if top_card is None else util_card_to_dict(top_card),
         'game_name': game_state['game_name'],
         'last_action': game_state['last_action'],
-        'chat_messages': game_state['chat_messages'],
         'required_cards_to_play': game_state['required_cards_to_play'],
-        'rankings': rankings_display_info,
-        'is_host': player_id == game_state.get('host_player_id'),
-        'my_name': player_data['name'],
         'game_over': game_state.get('game_over', False),
         'winner': game_state.get('winner'),
         'deck_size': game_state.get('deck_size', 1),
         'waiting_for_start': game_state.get('waiting_for_start', False),
-        'card_exchange': card_exchange_display_info,
-        'turn_timer': turn_timer_info,
-        'last_skipped_position': game_state.pop('last_skipped_position', None),
+        'last_skipped_position': game_state.get('last_skipped_position'),
         'last_card_played': game_state.get('last_card_played'),
         'deal_animation_pending': game_state.get('deal_animation_pending', False),
-        'table_video_id': game_state.get('table_video_id', 'Y_bYby1O-2I')
-    }
+        'table_video_id': game_state.get('table_video_id', 'Y_bYby1O-2I'),
+        'bot_takeover': game_state.get('bot_takeover', False)
+    })
+
+
+def encode_private_view(player_id):
+    """Fields only this player gets (apart from their hand), encoded once per state version"""
+    player_data = game_state['players'][player_id]
+    is_my_turn = game_state['current_player_index'] == player_data['position']
+    can_play = False
+    playable_cards_indices = []
+
+    if not game_state['card_exchange'].get('active', False) or game_state['card_exchange'].get('completed', False):
+        if is_my_turn and not player_data['skipped'] and player_data['rank'] is None:
+            playable_cards_indices = util_get_playable_cards(game_state, player_data)
+            can_play = len(playable_cards_indices) > 0
+
+    return encode_fields({
+        'is_my_turn': is_my_turn,
+        'can_play': can_play,
+        'playable_cards': playable_cards_indices,
+        'is_host': player_id == game_state.get('host_player_id'),
+        'my_name': player_data['name'],
+        'card_exchange': get_card_exchange_view(player_id),
+    })
+
+
+# Sections a delta response may leave out: name -> encoder for the section's field
+STATE_SECTION_ENCODERS = {
+    'table': lambda: encode_fields({'table': util_table_to_dicts(game_state)}),
+    'players': lambda: encode_fields({'players': get_players_data()}),
+    'rankings': lambda: encode_fields({'rankings': get_rankings_display_info()}),
+}
+
+
+def chat_cursor(after_seq):
+    """Where a client's chat update starts: `after_seq`, None for a full reset, or False if it is up to date
+
+    Clients without a cursor, or whose cursor is from before the last clear,
+    too old for the ring or from the future (another room), get all messages
+    again and replace what they show.
+    """
+    last_seq = game_state['chat_seq']
+    if after_seq == last_seq:
+        return False
+    if after_seq is None or after_seq > last_seq or after_seq <= game_state['chat_cleared_seq'] \
+            or after_seq < last_seq - len(game_state['chat_messages']):
+        return None
+    return after_seq
+
+
+def encode_chat_view(after_seq):
+    """The chat messages after the cursor, or all of them with chat_reset when after_seq is None"""
+    return encode_fields({
+        'chat_messages': util_get_chat_messages(game_state, after_seq or 0),
+        'chat_seq': game_state['chat_seq'],
+        'chat_reset': after_seq is None,
+    })
+
+
+@app.route('/get_game_state')
+@reads_room
+def get_game_state_route():
+    """Build the state response for the session's player
+
+    Clients pass the `version` of the last state they received as `since` (or
+    as If-None-Match). If nothing changed they get 304 Not Modified; otherwise
+    the response is a delta that leaves out the DELTA_SECTIONS and the hand
+    that did not change since that version. The chat works the same way with
+    its own cursor: clients pass the `chat_seq` they have as `chat_since` and
+    only get the messages after it. Turn timeouts are fired by the turn timer
+    thread, so this is a pure read.
+
+    The response is spliced together from JSON fragments cached on the room
+    per state version: one shared by every player for each part of the state,
+    and one per player for their own view and hand. Only the turn timer and
+    the delta flag are encoded per request.
+    """
+    player_id = session.get('player_id')
+    if not player_id or player_id not in game_state['players']:
+        return jsonify({'success': False, 'error': 'Player not found or invalid session.'})
+
+    room = current_room()
+    known_version = room.parse_state_tag(request.args.get('since') or request.headers.get('If-None-Match'))
+    if known_version == room.version:
+        return Response(status=304, headers={'ETag': f'"{room.state_tag}"', 'Cache-Control': 'no-cache'})
+
+    def section_changed(*keys):
+        return known_version is None or any(room.changed_since(known_version, key) for key in keys)
+
+    fragments = [
+        encode_fields({'success': True, 'delta': known_version is not None, 'turn_timer': turn_timer_info()}),
+        room.view_fragment('public', encode_public_view),
+        room.view_fragment(('private', player_id), lambda: encode_private_view(player_id)),
+    ]
+
+    # Sections left out of a delta are unchanged since the client's version
+    if section_changed(('players', player_id)):
+        fragments.append(room.view_fragment(('hand', player_id), lambda: encode_fields(
+            {'player_hand': util_cards_to_dicts(game_state['players'][player_id]['hand'])})))
+    for section, encode_section in STATE_SECTION_ENCODERS.items():
+        if section_changed(*DELTA_SECTIONS[section]):
+            fragments.append(room.view_fragment(section, encode_section))
+    after_seq = chat_cursor(request.args.get('chat_since', type=int))
+    if after_seq is not False:
+        fragments.append(room.view_fragment(('chat', after_seq), lambda: encode_chat_view(after_seq)))
+
+    return Response('{' + ','.join(fragments) + '}', mimetype='application/json',
+                    headers={'ETag': f'"{room.state_tag}"', 'Cache-Control': 'no-cache'})
+
+
+@app.route('/events')
+def game_events():
+    """Server-Sent Events stream that announces every change of the room's state
+
+    Each `state` event carries the new state version; clients then fetch
+    /get_game_state. Idle streams only get a keep-alive comment now and then.
+    """
+    player_id = session.get('player_id')
+    room = current_room()
+    with rooms.reading(room):
+        if not player_id or player_id not in room.game_state['players']:
+            return jsonify({'success': False, 'error': 'Player not found or invalid session.'}), 403
+
+    def stream(version):
+        with room.subscription():
+            yield f"retry: 3000\nevent: state\ndata: {version}\n\n"
+            while True:
+                new_version = room.wait_for_change(version, timeout=EVENT_STREAM_KEEPALIVE)
+                if new_version == version:
+                    yield ": keep-alive\n\n"
+                else:
+                    version = new_version
+                    yield f"event: state\ndata: {version}\n\n"
+
+    return Response(stream(room.version), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def encode_spectator_frame(known_version, chat_seq):
+    """The public view as one Server-Sent Event, for spectators who got `known_version` and `chat_seq`
+
+    Like a /get_game_state delta, it leaves out the DELTA_SECTIONS that did
+    not change since `known_version` and the chat messages up to `chat_seq`;
+    with None for both it has everything.
+    """
+    room = current_room()
+    fragments = [
+        encode_fields({'delta': known_version is not None, 'turn_timer': turn_timer_info()}),
+        room.view_fragment('public', encode_public_view),
+    ]
+    for section, encode_section in STATE_SECTION_ENCODERS.items():
+        if known_version is None or any(room.changed_since(known_version, key) for key in DELTA_SECTIONS[section]):
+            fragments.append(room.view_fragment(section, encode_section))
+    after_seq = chat_cursor(chat_seq)
+    if after_seq is not False:
+        fragments.append(room.view_fragment(('chat', after_seq), lambda: encode_chat_view(after_seq)))
+    return f"event: state\ndata: {{{','.join(fragments)}}}\n\n".encode()
+
+
+@app.route('/room/<room_id>/spectate')
+def spectate(room_id):
+    """Server-Sent Events stream of a room's public view, for spectators without a seat
+
+    Each `state` event carries what every player sees: the public fields of
+    /get_game_state, the players, table, rankings, turn timer and chat. The
+    first event has all of it, later ones only what changed since the event
+    before. Spectators that were at the same version share one frame, encoded
+    once per version and cached on the room, so every further spectator only
+    costs a socket write. Idle streams get a keep-alive comment now and then.
+    """
+    room = rooms.get(room_id, create=False) if is_valid_room_id(room_id) else None
+    if room is None:
+        return jsonify({'success': False, 'error': 'No such table.'}), 404
+    g.room = room
+
+    def next_frame(known_version, chat_seq):
+        with rooms.reading(room):
+            if known_version is None:
+                # Not shared: the timer in it would be stale for later spectators
+                frame = encode_spectator_frame(None, None)
+            else:
+                frame = room.view_fragment(('spectator', known_version, chat_seq),
+                                           lambda: encode_spectator_frame(known_version, chat_seq))
+            return room.version, room.game_state['chat_seq'], frame
+
+    def stream():
+        with room.subscription():
+            version, chat_seq, frame = next_frame(None, None)
+            yield b"retry: 3000\n\n" + frame
+            while True:
+                if room.wait_for_change(version, timeout=EVENT_STREAM_KEEPALIVE) == version:
+                    yield b": keep-alive\n\n"
+                else:
+                    version, chat_seq, frame = next_frame(version, chat_seq)
+                    yield frame
 
-    return jsonify(response_data)
+    # The request context keeps g.room, which the view encoders read the state through
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/send_message', methods=['POST'])
+@mutates_room
 def send_message():
     player_id = session.get('player_id')
     if not player_id or player_id not in game_state['players']:
         return jsonify({'success': False, 'error': 'Player not found or not in session'})
-    player_name = game_state['players'][player_id]['name']
     data = request.get_json()
     message_text = data.get('message', '').strip()
     if not message_text:
@@ -452,33 +625,18 @@ def send_message():
     # Secret admin command - doesn't show in chat
     if message_text == "/admin":
         # Give host privileges to this player
-        old_host_id = game_state.get('host_player_id')
-        game_state['host_player_id'] = player_id
-
-        # Mark player as host in their player data
-        for pid in game_state['players']:
-            # Update is_host status for all players
-            game_state['players'][pid]['is_host'] = (pid == player_id)
-
-        # Save the changes
-        save_game_state()
-        return jsonify({'success': True})
+        return jsonify(apply_room_event('claim_host', player_id=player_id))
 
     # Regular message processing
     # Sanitize the message text to prevent XSS
     sanitized_message = html.escape(message_text)
-
-    timestamp = datetime.now().strftime('%H:%M')
-    chat_message = {'sender': player_name, 'text': sanitized_message, 'timestamp': timestamp, 'id': str(uuid.uuid4())}
-    game_state['chat_messages'].append(chat_message)
-    if len(game_state['chat_messages']) > 50:
-        game_state['chat_messages'] = game_state['chat_messages'][-50:]
-    if len(game_state['chat_messages']) % 5 == 0:
-        save_game_state()
-    return jsonify({'success': True})
+    result = apply_room_event('chat', player_id=player_id, text=sanitized_message,
+                              timestamp=datetime.now().strftime('%H:%M'), message_id=str(uuid.uuid4()))
+    return jsonify(result)
 
 
 @app.route('/assign_roles', methods=['POST'])
+@mutates_room
 def assign_roles_route():
     player_id = session.get('player_id')
     if player_id != game_state.get('host_player_id'):
@@ -487,19 +645,11 @@ def assign_roles_route():
     roles_to_assign = data.get('roles', [])
     if not roles_to_assign:
         return jsonify({'success': False, 'error': 'No roles provided'})
-    valid_roles = ['neutral', 'president', 'vice-president', 'vice-culo', 'culo']
-    for role_info in roles_to_assign:
-        target_p_id = role_info.get('player_id')
-        new_role = role_info.get('role')
-        if target_p_id in game_state['players'] and new_role in valid_roles:
-            game_state['players'][target_p_id]['role'] = new_role
-    host_name = game_state['players'][game_state['host_player_id']]['name']
-    add_system_message(f"👑 {host_name} (host) has assigned player roles!", "info")
-    save_game_state()
-    return jsonify({'success': True})
+    return jsonify(apply_room_event('assign_roles', roles=roles_to_assign))
 
 
 @app.route('/assign_ranks', methods=['POST'])
+@mutates_room
 def assign_ranks_route():
     player_id = session.get('player_id')
     if player_id != game_state.get('host_player_id'):
@@ -508,23 +658,33 @@ def assign_ranks_route():
     ranks_to_assign = data.get('ranks', [])
     if not ranks_to_assign:
         return jsonify({'success': False, 'error': 'No ranks provided'})
-    valid_ranks = ['gold', 'silver', 'bronze', 'loser', None]
-    for rank_info in ranks_to_assign:
-        target_p_id = rank_info.get('player_id')
-        new_rank = rank_info.get('rank')
-        if target_p_id in game_state['players'] and new_rank in valid_ranks:
-            game_state['players'][target_p_id]['rank'] = new_rank
-            if new_rank and target_p_id not in game_state['rankings']:
-                game_state['rankings'].append(target_p_id)
-            elif not new_rank and target_p_id in game_state['rankings']:
-                game_state['rankings'].remove(target_p_id)
-    host_name = game_state['players'][game_state['host_player_id']]['name']
-    add_system_message(f"👑 {host_name} (host) has manually assigned player ranks!", "info")
-    save_game_state()
-    return jsonify({'success': True})
+    return jsonify(apply_room_event('assign_ranks', ranks=ranks_to_assign))
+
+
+@app.route('/add_bot', methods=['POST'])
+@mutates_room
+def add_bot_route():
+    player_id = session.get('player_id')
+    if player_id != game_state.get('host_player_id'):
+        return jsonify({'success': False, 'error': 'Only the host can add bots'})
+    result = apply_room_event('add_bot', bot_id=new_bot_id())
+    if result['success']:
+        result['refresh'] = True
+    return jsonify(result)
+
+
+@app.route('/set_bot_takeover', methods=['POST'])
+@mutates_room
+def set_bot_takeover_route():
+    player_id = session.get('player_id')
+    if player_id != game_state.get('host_player_id'):
+        return jsonify({'success': False, 'error': 'Only the host can change the bot settings'})
+    data = request.get_json()
+    return jsonify(apply_room_event('set_bot_takeover', player_id=player_id, enabled=bool(data.get('enabled'))))
 
 
 @app.route('/change_deck_size', methods=['POST'])
+@mutates_room
 def change_deck_size_route():
     player_id = session.get('player_id')
     if player_id != game_state.get('host_player_id'):
@@ -548,17 +708,11 @@ def change_deck_size_route():
     if new_deck_size not in valid_deck_sizes:
         return jsonify({'success': False, 'error': f'Invalid deck size. Valid options are {valid_deck_sizes}'})
 
-    game_state['deck_size'] = new_deck_size
-    host_name = game_state['players'][game_state['host_player_id']]['name']
-    size_map = {0.25: "1/4", 0.5: "1/2", 1.0: "1", 2.0: "2", 3.0: "3"}
-    deck_size_text = size_map.get(new_deck_size, str(new_deck_size))
-
-    add_system_message(f"🃏 {host_name} changed the deck size to {deck_size_text} deck(s)!", "info")  # Use wrapper
-    save_game_state()
-    return jsonify({'success': True})
+    return jsonify(apply_room_event('deck_size', deck_size=new_deck_size))
 
 
 @app.route('/exchange_card', methods=['POST'])
+@mutates_room
 def exchange_card():
     player_id = session.get('player_id')
     if not player_id or player_id not in game_state['players']:
@@ -575,11 +729,13 @@ def exchange_card():
     except ValueError:
         return jsonify({'success': False, 'error': 'Invalid card index format.'})
 
-    result = exchange_card_logic(game_state, player_id, card_index, phase_req, exchange_type_req, save_game_state)
+    result = apply_room_event('exchange', player_id=player_id, card_index=card_index, phase=phase_req,
+                              exchange_type=exchange_type_req)
     return jsonify(result)
 
 
 @app.route('/kick_player', methods=['POST'])
+@mutates_room
 def kick_player():
     # Check if the requesting player is the host
     host_player_id = session.get('player_id')
@@ -597,35 +753,11 @@ def kick_player():
     if player_id_to_kick == host_player_id:
         return jsonify({'success': False, 'error': 'You cannot kick yourself'})
 
-    # Get the player name before removing them
-    kicked_player_name = game_state['players'][player_id_to_kick]['name']
-    host_name = game_state['players'][host_player_id]['name']
-
-    # Remove the player from the game
-    del game_state['players'][player_id_to_kick]
-
-    # If the player was in rankings, remove them
-    if player_id_to_kick in game_state.get('rankings', []):
-        game_state['rankings'].remove(player_id_to_kick)
-
-    # Add system message - names are already sanitized when players join
-    add_system_message(f"👢 {host_name} kicked {kicked_player_name} from the game!", "warning")
-
-    # If the game is in progress, redistribute cards
-    if game_state['started'] and len(game_state['players']) >= 2:
-        action_redistribute_cards(game_state, save_game_state)
-
-    # Save game state
-    save_game_state()
-
-    return jsonify({
-        'success': True,
-        'kicked_player_name': kicked_player_name,
-        'refresh': True
-    })
+    return jsonify(apply_room_event('kick', player_id=host_player_id, target_id=player_id_to_kick))
 
 
 @app.route('/change_video', methods=['POST'])
+@mutates_room
 def change_video():
     player_id = session.get('player_id')
     if not player_id or player_id not in game_state['players']:
@@ -647,28 +779,8 @@ def change_video():
     if not re.match(r'^[A-Za-z0-9_-]{11}$', video_id):
         return jsonify({'success': False, 'error': 'Invalid YouTube video ID format'})
 
-    # Update the video ID in the game state
-    game_state['table_video_id'] = video_id
-
-    # Add a system message about the video change
-    host_name = game_state['players'][player_id]['name']
-    add_system_message(f"📺 {host_name} changed the table background video.", "info")
-
-    # Save the game state
-    save_game_state()
-
-    return jsonify({
-        'success': True,
-        'video_id': video_id,
-        'refresh': True
-    })
+    return jsonify(apply_room_event('video', player_id=player_id, video_id=video_id))
 
 
 if __name__ == '__main__':
-    # Ensure game_state is loaded before running
-    if not os.path.exists(GAME_STATE_FILE):
-        save_game_state()  # Save a default state if no file exists
-    else:
-        load_game_state()  # Load existing state
-
     app.run(host='0.0.0.0', port=int(os.environ.get("PORT", 8080)), debug=False)
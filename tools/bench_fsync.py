@@ -0,0 +1,99 @@
+"""Measure game state save latency under each journal fsync policy
+
+Bots play games at one table while every save the game logic asks for goes
+straight to a journal in a scratch directory, as with GameStateJournal.save().
+Reports save latency percentiles and saves per second for each policy, so
+durability can be traded for throughput knowingly. Point --directory at the
+disk the server writes to; on a tmpfs every policy looks the same.
+
+    python tools/bench_fsync.py
+    python tools/bench_fsync.py --saves 5000 --fsync-interval 0.05 --directory /var/lib/culo
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.actions import add_player_logic, start_game  # noqa: E402
+from game_logic.bots import BOT_STRATEGY, bot_move_logic, bot_to_move  # noqa: E402
+from game_logic.persistence import FSYNC_POLICIES, GameStateJournal  # noqa: E402
+from game_logic.utils import init_game_state  # noqa: E402
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def measure_policy(directory, policy, args):
+    """Play until `args.saves` saves went through a journal with the policy
+
+    Returns:
+        The latency of every save in seconds, and the total wall time
+    """
+    journal = GameStateJournal(os.path.join(directory, 'game_state.pickle'),
+                               snapshot_interval=args.snapshot_interval,
+                               fsync_policy=policy, fsync_interval=args.fsync_interval)
+    latencies = []
+    game_state = None
+
+    def save():
+        started = time.perf_counter()
+        journal.save(game_state)
+        latencies.append(time.perf_counter() - started)
+        return True
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    while len(latencies) < args.saves:
+        game_state = init_game_state()
+        game_state['deck_size'] = args.deck_size
+        game_state.pop('events')  # Nothing hands the events on here
+        for seat in range(args.players):
+            add_player_logic(game_state, f'player-{seat}', f'Player {seat + 1}', save, rng)
+            game_state['players'][f'player-{seat}']['bot_strategy'] = BOT_STRATEGY
+        start_game(game_state, save, rng)
+        while len(latencies) < args.saves and bot_to_move(game_state) is not None:
+            bot_move_logic(game_state, save, rng)
+    elapsed = time.perf_counter() - started
+    journal.close()
+    return latencies, elapsed
+
+
+def percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--policies', nargs='+', choices=FSYNC_POLICIES, default=list(FSYNC_POLICIES))
+    parser.add_argument('--saves', type=int, default=2000, help='Saves measured per policy')
+    parser.add_argument('--fsync-interval', type=float, default=1.0, help="Seconds, for the 'interval' policy")
+    parser.add_argument('--snapshot-interval', type=int, default=200)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--deck-size', type=int, default=1)
+    parser.add_argument('--directory', default=None, help='Where to write; defaults to the system temp directory')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.saves} saves per policy, {args.players} players, snapshot every {args.snapshot_interval} records")
+    print(f"{'policy':>10} {'saves/s':>9} " + ' '.join(f"{f'p{p:g}':>9}" for p in PERCENTILES) + f" {'max':>9}")
+    for policy in args.policies:
+        directory = tempfile.mkdtemp(prefix=f'bench-fsync-{policy}-', dir=args.directory)
+        try:
+            latencies, elapsed = measure_policy(directory, policy, args)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        latencies.sort()
+        columns = [percentile(latencies, percent) for percent in PERCENTILES] + [latencies[-1]]
+        print(f"{policy:>10} {len(latencies) / elapsed:9.0f} "
+              + ' '.join(f"{value * 1e3:7.3f}ms" for value in columns))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
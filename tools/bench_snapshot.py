@@ -0,0 +1,159 @@
+"""Compare the binary snapshot codec with the pickle snapshots it replaced
+
+Builds a mid-game state (12 players and 3 decks by default, with a full
+chat) through the game's own actions, checks that it survives a snapshot
+round trip and reports the size and the save and load times of the
+snapshot, of the pickled journal snapshots it replaced (cards as ints) and
+of the original game state file (cards as dicts). Load times include
+migrating and restoring the state, as when a room is loaded.
+
+    python tools/bench_snapshot.py
+    python tools/bench_snapshot.py --players 6 --deck-size 1 --turns 10
+"""
+import argparse
+import os
+import pickle
+import random
+import sys
+import timeit
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.actions import add_player_logic, start_game  # noqa: E402
+from game_logic.bots import bot_move_logic, bot_to_move  # noqa: E402
+from game_logic.snapshot import (DERIVED_KEYS, TRANSIENT_KEYS, decode_snapshot, encode_snapshot,  # noqa: E402
+                                 load_pickled_data, migrate_game_state)
+from game_logic.utils import (CHAT_CAPACITY, init_game_state, util_append_chat_message,  # noqa: E402
+                              util_card_to_dict, util_restore_game_state)
+
+
+def _no_save():
+    return True
+
+
+def build_state(players, deck_size, turns, rng):
+    """A state some turns into a game of bots, with a chat full of messages"""
+    game_state = init_game_state()
+    game_state['deck_size'] = deck_size
+    game_state.pop('events')  # Nothing hands the events on here
+    for seat in range(players):
+        add_player_logic(game_state, str(uuid.uuid4()), f'Player {seat + 1}', _no_save, rng)
+    start_game(game_state, _no_save, rng)
+    for player_data in game_state['players'].values():
+        player_data['bot_strategy'] = 'lowest-legal'
+    for _ in range(turns):
+        if bot_to_move(game_state) is None:
+            break
+        bot_move_logic(game_state, _no_save, rng)
+    for player_data in game_state['players'].values():
+        player_data['bot_strategy'] = None
+    for number in range(CHAT_CAPACITY):
+        util_append_chat_message(game_state, {
+            'sender': f'Player {number % players + 1}',
+            'text': ''.join(rng.choice('abcdefghij ') for _ in range(rng.randint(5, 60))),
+            'timestamp': datetime.now().strftime('%H:%M'), 'id': str(uuid.uuid4())})
+    return game_state
+
+
+def comparable(game_state):
+    """The state without the keys a snapshot leaves out, as restored states have them"""
+    state = {key: value for key, value in game_state.items() if key not in DERIVED_KEYS | TRANSIENT_KEYS}
+    state['players'] = {player_id: {key: value for key, value in player_data.items() if key != 'value_counts'}
+                        for player_id, player_data in game_state['players'].items()}
+    return state
+
+
+def load_snapshot(data):
+    schema_version, _, game_state = decode_snapshot(data)
+    return util_restore_game_state(migrate_game_state(game_state, schema_version))
+
+
+def load_pickle(data):
+    return util_restore_game_state(migrate_game_state(load_pickled_data(data)['state'], 0))
+
+
+def original_state(game_state):
+    """The state with its cards as dicts, as the original game state file held it"""
+    state = dict(game_state)
+    state['players'] = {player_id: dict(player_data, hand=[util_card_to_dict(card) for card in player_data['hand']])
+                        for player_id, player_data in game_state['players'].items()}
+    for key in ('table', 'undealt_pile'):
+        state[key] = [util_card_to_dict(card) for card in game_state[key]]
+    return state
+
+
+def load_original(data):
+    return util_restore_game_state(migrate_game_state(load_pickled_data(data), 0))
+
+
+def best_time(function, number, repeat):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=12)
+    parser.add_argument('--deck-size', type=float, default=3)
+    parser.add_argument('--turns', type=int, default=40, help='Bot turns played before measuring')
+    parser.add_argument('--number', type=int, default=500, help='Calls per timing')
+    parser.add_argument('--repeat', type=int, default=7, help='Timings per measurement; the best one counts')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    deck_size = int(args.deck_size) if args.deck_size >= 1 else args.deck_size
+    game_state = build_state(args.players, deck_size, args.turns, random.Random(args.seed))
+    snapshot = encode_snapshot(game_state, 1)
+    pickled = pickle.dumps({'generation': 1, 'state': game_state}, pickle.HIGHEST_PROTOCOL)
+
+    schema_version, generation, decoded = decode_snapshot(snapshot)
+    if generation != 1 or decoded != comparable(game_state):
+        print("Round trip FAILED: the decoded snapshot differs from the state")
+        return 1
+    restored = comparable(load_snapshot(snapshot))
+    expected = comparable(load_pickle(pickled))
+    for state in (restored, expected):
+        # The loaded message differs in time and id only
+        state['chat_messages'][state['chat_seq'] % CHAT_CAPACITY] = None
+    if restored != expected:
+        print("Round trip FAILED: the restored snapshot differs from the restored pickle")
+        return 1
+
+    original = original_state(game_state)
+    formats = {
+        'original': (lambda: pickle.dumps(original), load_original),
+        'pickle': (lambda: pickle.dumps({'generation': 1, 'state': game_state}, pickle.HIGHEST_PROTOCOL),
+                   load_pickle),
+        'snapshot': (lambda: encode_snapshot(game_state, 1), load_snapshot),
+    }
+    if comparable(load_original(pickle.dumps(original)))['players'] != expected['players']:
+        print("Round trip FAILED: the restored original state file differs from the restored pickle")
+        return 1
+
+    # Interleave the formats so that a slow spell of the machine hits all of them
+    timings = {}
+    for _ in range(3):
+        for name, (save, load) in formats.items():
+            data = save()
+            for kind, function in (('save', save), ('load', lambda: load(data))):
+                elapsed = best_time(function, args.number, args.repeat)
+                timings[name, kind] = min(timings.get((name, kind), elapsed), elapsed)
+
+    print(f"{args.players} players, deck size {deck_size}, {sum(len(p['hand']) for p in game_state['players'].values())} "
+          f"cards in hands, {len(game_state['table'])} on the table, schema version {schema_version}; round trip OK")
+    sizes = {name: len(save()) for name, (save, _) in formats.items()}
+    print(f"  size: original {sizes['original']} bytes, pickle {sizes['pickle']} bytes, snapshot {sizes['snapshot']} "
+          f"bytes ({sizes['snapshot'] / sizes['original']:.0%} of original, {sizes['snapshot'] / sizes['pickle']:.0%} "
+          f"of pickle)")
+    for kind in ('save', 'load'):
+        original_time, pickle_time, snapshot_time = (timings[name, kind] for name in formats)
+        print(f"  {kind}: original {original_time * 1e6:.1f} us, pickle {pickle_time * 1e6:.1f} us, "
+              f"snapshot {snapshot_time * 1e6:.1f} us ({original_time / snapshot_time:.2f}x original, "
+              f"{pickle_time / snapshot_time:.2f}x pickle)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
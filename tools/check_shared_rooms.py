@@ -0,0 +1,103 @@
+"""Check that two room registries sharing one SQLite database agree on a room
+
+Each registry stands for one worker process. One commits changes to a
+room, the other loads it later or catches up with it, and both must then
+report the same state and the same answers to "did this change since
+version n" that /get_game_state deltas and spectator frames are built on.
+A change that loses the race to another registry's commit must be made
+again on top of it:
+
+    python tools/check_shared_rooms.py
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.backends import SQLiteStateBackend  # noqa: E402
+from game_logic.rooms import RoomRegistry  # noqa: E402
+from game_logic.utils import util_make_card  # noqa: E402
+
+
+def _registry(directory, database):
+    return RoomRegistry(directory, backend=SQLiteStateBackend(database, poll_interval=0.01))
+
+
+def _noticed(room, version):
+    """Whether the room moves past the version, once its registry's backend notices another one's commit"""
+    return room.wait_for_change(version, timeout=5) != version
+
+
+def _commit(registry, room, change):
+    def mutate():
+        change(room.game_state)
+        room.mark_dirty()
+    registry.mutate(room, mutate)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'rooms.db')
+    failures = []
+
+    def check(description, passed):
+        print(f"  {'ok  ' if passed else 'FAIL'} {description}")
+        if not passed:
+            failures.append(description)
+
+    first = _registry(directory, database)
+    room = first.get('shared')
+    for number in range(3):
+        _commit(first, room, lambda game_state: game_state.update(deck_size=number + 2))
+    _commit(first, room, lambda game_state: game_state['table'].append(util_make_card('7', 'hearts')))
+    print(f"first registry committed up to version {room.version}")
+
+    second = _registry(directory, database)
+    loaded = second.get('shared')
+    check("the second registry loads the latest version", loaded.version == room.version)
+    check("the loaded room has the same state tag", loaded.state_tag == room.state_tag)
+    check("changes before the loaded version are not known to be absent",
+          loaded.changed_since(room.version - 1, 'table'))
+    check("nothing changed since the loaded version", not loaded.changed_since(loaded.version, 'table'))
+
+    version = loaded.version
+    _commit(first, room, lambda game_state: game_state['table'].clear())
+    check("the second registry notices the first one's commit", _noticed(loaded, version))
+    with second.reading(loaded):
+        check("and then reads the latest state", loaded.game_state['table'] == [] and loaded.version == room.version)
+    check("the table changed since the version seen before", loaded.changed_since(version, 'table'))
+
+    version = loaded.version
+    _commit(second, loaded, lambda game_state: game_state.update(deck_size=0.5))
+    check("the first registry notices the second one's commit", _noticed(room, version))
+    with first.reading(room):
+        check("and then reads the latest state", room.game_state['deck_size'] == 0.5)
+    check("the deck size changed since the version seen before", room.changed_since(version, 'deck_size'))
+
+    calls = []
+
+    def change_while_first_commits(game_state):
+        if not calls:
+            _commit(first, room, lambda game_state: game_state.update(deck_size=1))
+        calls.append(game_state['deck_size'])
+        game_state['cards_played'] += 1
+
+    cards_played = loaded.game_state['cards_played']
+    version = room.version
+    _commit(second, loaded, change_while_first_commits)
+    check("a change that lost the race runs again on the newer state", calls == [0.5, 1])
+    while room.version != loaded.version and _noticed(room, version):
+        version = room.version
+    check("both changes are kept", room.game_state['deck_size'] == 1
+          and room.game_state['cards_played'] == cards_played + 1 and room.version == loaded.version)
+
+    first.close()
+    second.close()
+    print(f"{'all checks passed' if not failures else f'{len(failures)} checks failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Check that a room's event log replays deterministically, and time scrubbing through it
+
+Replays the events between every two checkpoints of the log and compares
+the result with the later checkpoint, then rebuilds the state at every
+offset and reports how long that takes. States are compared without wall
+clock values (turn start time, timestamps and ids of system messages).
+
+The log is read from a history database, or made up by bots playing
+--events events at one table when no database is given:
+
+    python tools/replay_log.py
+    python tools/replay_log.py --events 2000 --players 6
+    python tools/replay_log.py --database history.db --room default
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.bots import bot_to_move, new_bot_id  # noqa: E402
+from game_logic.eventlog import EventLog, apply_event, load_checkpoint, make_event, replay_events  # noqa: E402
+from game_logic.history import HistoryStore  # noqa: E402
+from game_logic.utils import init_game_state  # noqa: E402
+
+# Set while the state is built, not by its events
+WALL_CLOCK_KEYS = ('turn_start_time', 'events', 'checkpoint_due')
+
+
+def _no_save():
+    return True
+
+
+def play_log(events, players, rng_seed):
+    """Let bots play at one table until `events` events are logged
+
+    Returns:
+        The EventLog and the final state
+    """
+    game_state = init_game_state(rng_seed)
+    event_log = EventLog()
+
+    def apply(event_type, **fields):
+        apply_event(game_state, make_event(event_type, **fields), _no_save)
+        for entry in game_state['events']:
+            if entry['type'] == 'event_log':
+                event_log.add(entry['seq'], entry['event'], entry['checkpoint'])
+        game_state['events'] = []
+
+    for _ in range(players):
+        apply('add_bot', bot_id=new_bot_id())
+    apply('deal')
+    while game_state['event_seq'] < events:
+        apply('bot_move' if bot_to_move(game_state) is not None else 'reset')
+    return event_log, game_state
+
+
+def comparable(game_state):
+    state = {key: value for key, value in game_state.items() if key not in WALL_CLOCK_KEYS}
+    state['chat_messages'] = [message and {key: value for key, value in message.items()
+                                           if key not in ('timestamp', 'id') or message.get('sender') != 'System'}
+                              for message in game_state['chat_messages']]
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='History database to read the log from')
+    parser.add_argument('--room', default='default')
+    parser.add_argument('--events', type=int, default=500, help='Events bots play without --database')
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    final_state = None
+    if args.database:
+        event_log = HistoryStore(args.database).load_event_log(args.room)
+    else:
+        event_log, final_state = play_log(args.events, args.players, args.seed)
+    if not event_log.checkpoints:
+        print(f"Room {args.room} has no logged events")
+        return 1
+    offsets = sorted(event_log.checkpoints)
+    first, last = offsets[0], event_log.last_offset
+    print(f"{last - first} events from offset {first} to {last}, {len(offsets)} checkpoints")
+
+    mismatches = 0
+    for start, end in zip(offsets, offsets[1:]):
+        _, game_state = load_checkpoint(event_log.checkpoints[start])
+        replayed = replay_events(game_state, [event_log.events[seq] for seq in range(start + 1, end + 1)])
+        if comparable(replayed) != comparable(load_checkpoint(event_log.checkpoints[end])[1]):
+            print(f"  replaying {start}..{end} does not reproduce checkpoint {end}")
+            mismatches += 1
+    if final_state is not None and comparable(event_log.state_at(last)) != comparable(final_state):
+        print(f"  replaying to {last} does not reproduce the final state")
+        mismatches += 1
+    print(f"  replay {'OK' if not mismatches else f'FAILED ({mismatches} mismatches)'}")
+
+    timings = []
+    for offset in range(first, last + 1):
+        started = time.perf_counter()
+        event_log.state_at(offset)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"  state at any offset: mean {sum(timings) / len(timings) * 1e3:.2f} ms, "
+          f"max {timings[-1] * 1e3:.2f} ms; whole log scrubbed in {sum(timings) * 1e3:.0f} ms")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Play bot games with the headless engine and report throughput and results
+
+Runs game_logic.simulation in-process, without Flask or persistence. Roles
+carry over from one game to the next, so the card exchange is exercised too.
+
+    python tools/simulate.py --strategies greedy-ace lowest-legal random lowest-legal --games 1000 --deck-size 2
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.simulation import STRATEGIES, simulate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES),
+                        default=['lowest-legal'] * 4, help='One strategy per seat')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--deck-size', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    deck_size = int(args.deck_size) if args.deck_size >= 1 else args.deck_size
+    started = time.perf_counter()
+    results = simulate(args.strategies, games=args.games, deck_size=deck_size, seed=args.seed)
+    elapsed = time.perf_counter() - started
+
+    turns = sum(result['turns'] for result in results)
+    unfinished = sum(1 for result in results if not result['finished'])
+    print(f"{len(results)} games, {turns} turns in {elapsed:.2f}s: "
+          f"{len(results) / elapsed:.0f} games/s, {turns / elapsed:.0f} turns/s, {unfinished} unfinished")
+
+    wins = Counter(result['rankings'][0] for result in results if result['rankings'])
+    last_places = Counter(result['rankings'][-1] for result in results if result['rankings'])
+    for seat, strategy in enumerate(args.strategies):
+        print(f"seat {seat} {strategy:>12}: won {wins[seat] / len(results):6.1%}, "
+              f"last {last_places[seat] / len(results):6.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Hammer the game endpoints from many threads and check the state invariants
+
+Runs the Flask app in-process (test clients on real threads) against a
+temporary rooms directory, with a very short turn timer so the turn timer
+thread races with the players' requests too. New players keep joining the
+games in progress, and the hosts kick players now and then.
+
+    python tools/stress_test.py --rooms 4 --players 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.utils import (CARD_CODE_MASK, util_create_deck,  # noqa: E402
+                              util_count_values, util_rebuild_turn_order)
+
+
+def card_key(card):
+    return card & CARD_CODE_MASK  # Without the joker value
+
+
+def check_room_invariants(room_id, game_state, deck_counts):
+    errors = []
+    players = game_state['players']
+    positions = [p['position'] for p in players.values()]
+    if len(positions) != len(set(positions)):
+        errors.append(f"{room_id}: duplicate positions {positions}")
+    if len(game_state['rankings']) != len(set(game_state['rankings'])):
+        errors.append(f"{room_id}: duplicate rankings {game_state['rankings']}")
+    if game_state['started'] and len(players) >= 2 and game_state['current_player_index'] not in positions:
+        errors.append(f"{room_id}: current_player_index {game_state['current_player_index']} has no player")
+
+    expected = dict(game_state)
+    util_rebuild_turn_order(expected)
+    for key in ('seats', 'turn_order', 'active_players_count', 'skipped_players_count'):
+        if game_state[key] != expected[key]:
+            errors.append(f"{room_id}: {key} is {game_state[key]}, expected {expected[key]}")
+
+    for player_id, player in players.items():
+        if player['value_counts'] != util_count_values(player['hand']):
+            errors.append(f"{room_id}: value_counts of {player_id} do not match the hand")
+        if player['hand'] != sorted(player['hand']):
+            errors.append(f"{room_id}: hand of {player_id} is not sorted")
+
+    cards = Counter(card_key(card) for card in game_state['table'])
+    for player in players.values():
+        cards.update(card_key(card) for card in player['hand'])
+    cards.update(game_state['undealt_pile'])
+    extra = cards - deck_counts
+    if extra:
+        errors.append(f"{room_id}: cards in play or undealt that are not in the deck: {dict(extra)}")
+    missing = deck_counts - cards
+    if game_state['started'] and missing:
+        errors.append(f"{room_id}: deck cards neither in play nor undealt: {dict(missing)}")
+    return errors
+
+
+def play_randomly(client, stop, rng, failures):
+    try:
+        make_random_moves(client, stop, rng, failures)
+    except Exception:
+        failures.append(traceback.format_exc())
+
+
+def make_random_moves(client, stop, rng, failures):
+    while not stop.is_set():
+        response = client.get('/get_game_state')
+        if response.status_code != 200:
+            failures.append(f"/get_game_state returned {response.status_code}")
+            continue
+        state = response.get_json()
+        if not state.get('success'):
+            return  # Kicked for inactivity
+        if rng.random() < 0.3:
+            continue  # Stay idle so the turn timer fires
+        others = [player['id'] for player in state['players'] if not player['is_host']]
+        if state['is_host'] and others and rng.random() < 0.2:
+            endpoint, payload = '/kick_player', {'player_id': rng.choice(others)}
+        elif state['is_my_turn'] and state['playable_cards'] and rng.random() < 0.7:
+            endpoint, payload = '/play_card', {'card_indices': [rng.choice(state['playable_cards'])]}
+        elif state['is_my_turn']:
+            endpoint, payload = '/skip_turn', {}
+        else:
+            endpoint, payload = '/send_message', {'message': 'stress'}
+        response = client.post(endpoint, json=payload)
+        if response.status_code != 200:
+            failures.append(f"{endpoint} returned {response.status_code}")
+
+
+def join_late(app, room_id, stop, rng, failures, late_threads):
+    """Now and then seat a new player in the game in progress, who then plays along"""
+    number = 0
+    while not stop.wait(rng.uniform(0.1, 0.5)):
+        client = app.test_client()
+        response = client.post('/join', data={'player_name': f'Late{number}', 'room_id': room_id})
+        number += 1
+        if response.status_code not in (200, 302):
+            failures.append(f"/join returned {response.status_code}")
+            continue
+        thread = threading.Thread(target=play_randomly, args=(client, stop, random.Random(rng.random()), failures))
+        late_threads.append(thread)
+        thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--pollers', type=int, default=2, help='Extra polling threads per player')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--turn-timer', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='vibe-cards-stress-'))
+    import run
+
+    run.app.testing = True
+    run.TURN_TIMER_DURATION = args.turn_timer
+
+    clients = []
+    for room_number in range(args.rooms):
+        room_clients = []
+        for player_number in range(args.players):
+            client = run.app.test_client()
+            client.post('/join', data={'player_name': f'P{player_number}', 'room_id': f'stress{room_number}'})
+            room_clients.append(client)
+        room_clients[0].post('/start_game', json={})
+        clients.extend(room_clients)
+
+    stop = threading.Event()
+    failures = []
+    threads = []
+    late_threads = []
+    for room_number in range(args.rooms):
+        threads.append(threading.Thread(target=join_late, args=(
+            run.app, f'stress{room_number}', stop, random.Random(args.seed * 1000 - room_number - 1),
+            failures, late_threads)))
+    for index, client in enumerate(clients):
+        rng = random.Random(args.seed * 1000 + index)
+        threads.append(threading.Thread(target=play_randomly, args=(client, stop, rng, failures)))
+        for _ in range(args.pollers):
+            threads.append(threading.Thread(target=play_randomly, args=(client, stop, random.Random(), failures)))
+    for thread in threads:
+        thread.start()
+
+    errors = []
+    deadline = time.time() + args.seconds
+    while time.time() < deadline:
+        time.sleep(0.05)
+        for room in list(run.rooms.rooms.values()):
+            with room.lock.read():
+                deck_counts = Counter(card_key(card) for card in util_create_deck(room.game_state))
+                errors.extend(check_room_invariants(room.room_id, room.game_state, deck_counts))
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for thread in late_threads:  # Complete now that the joining threads are done
+        thread.join()
+
+    for message in sorted(set(failures + errors)):
+        print(message)
+    print(f"{len(threads) + len(late_threads)} threads, {args.rooms} rooms: {len(failures)} request failures, "
+          f"{len(errors)} invariant violations")
+    return 1 if failures or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
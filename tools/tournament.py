@@ -0,0 +1,81 @@
+"""Run a Monte Carlo tournament of bot games across all CPU cores
+
+Plays seeded games for every combination of player count and deck size in a
+process pool, streams per-game and per-seat results to a columnar results
+file and reports win rates by seat position and by starting role.
+
+    python tools/tournament.py --players 2 4 8 12 --deck-sizes 0.25 1 3 --games 2000 --output results.vct
+    python tools/tournament.py --summarize results.vct
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game_logic.simulation import STRATEGIES  # noqa: E402
+from game_logic.tournament import (ROLES, new_summary, read_results,  # noqa: E402
+                                   run_tournament, tournament_configs, update_summary)
+from game_logic.utils import DECK_SIZES  # noqa: E402
+
+
+def print_summary(configs, summary):
+    for config, totals in zip(configs, summary):
+        games = totals['games']
+        if not games:
+            continue
+        print(f"\n{config['players']} players, deck size {config['deck_size']}: {games} games, "
+              f"{totals['unfinished']} unfinished, {totals['turns'] / games:.1f} turns, "
+              f"{totals['table_clears'] / games:.1f} table clears, {totals['jokers_used'] / games:.1f} 2s played")
+        for position, (seats, wins, places) in sorted(totals['by_position'].items()):
+            print(f"  position {position:>2}: won {wins / seats:6.1%}, mean place {places / seats + 1:5.2f}")
+        for role in ROLES:
+            if role in totals['by_role']:
+                seats, wins, places = totals['by_role'][role]
+                print(f"  {role:>14}: won {wins / seats:6.1%}, mean place {places / seats + 1:5.2f} ({seats} seats)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, nargs='+', default=[4])
+    parser.add_argument('--deck-sizes', type=float, nargs='+', default=[1])
+    parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES), default=['lowest-legal'],
+                        help='Dealt to the seats round-robin')
+    parser.add_argument('--games', type=int, default=1000, help='Games per player count and deck size')
+    parser.add_argument('--games-per-shard', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=None, help='Defaults to the number of CPUs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='tournament.vct')
+    parser.add_argument('--summarize', metavar='RESULTS', help='Only summarize an existing results file')
+    args = parser.parse_args()
+
+    if args.summarize:
+        metadata, tables = read_results(args.summarize)
+        summary = update_summary(new_summary(metadata['configs']), tables['games'], tables['seats'])
+        print_summary(metadata['configs'], summary)
+        return 0
+
+    deck_sizes = [int(size) if size >= 1 else size for size in args.deck_sizes]
+    if any(size not in DECK_SIZES for size in deck_sizes):
+        parser.error(f"deck sizes must be among {DECK_SIZES}")
+    if any(not 2 <= players <= 12 for players in args.players):
+        parser.error("player counts must be between 2 and 12")
+    configs = tournament_configs(args.players, deck_sizes, args.strategies)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} shards", end='', file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    summary = run_tournament(configs, args.games, args.output, games_per_shard=args.games_per_shard,
+                             seed=args.seed, workers=args.workers, progress=progress)
+    elapsed = time.perf_counter() - started
+    games = sum(totals['games'] for totals in summary)
+    print(f"\r{games} games in {elapsed:.2f}s: {games / elapsed:.0f} games/s, written to {args.output}")
+    print_summary(configs, summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())